@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from .background import BackgroundTask
+from .config import settings
+from .database import (
+    SessionLocal, UserModel, PhotographerModel, BookingModel,
+    run_after_commit, previous_value, booking_bulk_insert_listeners, after_bulk_change,
+)
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+Counters = Dict[str, float]
+
+
+class DashboardAggregates:
+    """Running totals behind the admin dashboard.
+
+    Mapper events turn every committed insert, update and delete into a delta
+    on named counters ("bookings:pending", "revenue", ...), so the dashboard
+    reads numbers instead of scanning tables. A periodic reconciliation rebuilds
+    the counters with grouped queries to repair drift from writes that bypass
+    the ORM; ``request_reconcile`` asks for one early after such writes.
+    Deltas applied while it runs are replayed onto the rebuilt counters; one
+    whose commit the queries already saw is counted twice until the next run.
+
+    Daily activity (for active users and retention) has no table behind it and
+    is tracked from authenticated requests on this worker.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 reconcile_interval: float = 600.0, signup_window_days: int = 7):
+        self.session_factory = session_factory
+        self.reconcile_interval = reconcile_interval
+        self.signup_window_days = signup_window_days
+        self._counters: Counters = {}
+        # Deltas come from after-commit hooks, which may run on executor threads
+        self._lock = threading.Lock()
+        # Deltas applied while a reconciliation is loading, to replay onto its result
+        self._journal: Optional[List[Counters]] = None
+        self._worker = BackgroundTask(self._run)
+
+        self._activity_day: Optional[date] = None
+        self._active_today: Set[int] = set()
+        self._active_yesterday: Set[int] = set()
+        self._retained_today = 0
+
+        self.reconciliations = 0
+        self.replayed_deltas = 0
+        self.last_drift = 0
+
+    def get(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def apply(self, delta: Counters):
+        with self._lock:
+            _add(self._counters, delta)
+            if self._journal is not None:
+                self._journal.append(delta)
+
+    def signups(self, days: int) -> int:
+        today = datetime.utcnow().date()
+        return int(sum(self.get(f"signups:{today - timedelta(days=n)}") for n in range(days)))
+
+    # Activity
+
+    def record_activity(self, user_id: int):
+        today = datetime.utcnow().date()
+        if today != self._activity_day:
+            yesterday = today - timedelta(days=1)
+            self._active_yesterday = self._active_today if self._activity_day == yesterday else set()
+            self._active_today = set()
+            self._retained_today = 0
+            self._activity_day = today
+        if user_id not in self._active_today:
+            self._active_today.add(user_id)
+            if user_id in self._active_yesterday:
+                self._retained_today += 1
+
+    def daily_active_users(self) -> int:
+        return len(self._active_today) if self._activity_day == datetime.utcnow().date() else 0
+
+    def retention_rate(self) -> float:
+        """Share of yesterday's active users who came back today, in percent"""
+        if not self._active_yesterday or self._activity_day != datetime.utcnow().date():
+            return 0.0
+        return 100.0 * self._retained_today / len(self._active_yesterday)
+
+    # Contributions of a single row to the counters
+
+    def user_counters(self, user_type: str, created_at: Optional[datetime], deleted: bool) -> Counters:
+        if deleted:
+            return {}
+        counters = {"users": 1, f"users:{user_type}": 1}
+        if created_at is not None and created_at.date() > datetime.utcnow().date() - timedelta(days=self.signup_window_days):
+            counters[f"signups:{created_at.date()}"] = 1
+        return counters
+
+    @staticmethod
+    def photographer_counters(rating: Optional[float], deleted: bool) -> Counters:
+        if deleted:
+            return {}
+        return {"photographers": 1, "rating_sum": rating or 0.0, "rated": 1 if rating is not None else 0}
+
+    @staticmethod
+    def booking_counters(status: str, total_amount: float, deleted: bool) -> Counters:
+        if deleted:
+            return {}
+        return {
+            "bookings": 1,
+            f"bookings:{status}": 1,
+            "booking_amount": total_amount or 0.0,
+            "revenue": (total_amount or 0.0) if status == 'completed' else 0.0,
+        }
+
+    # Reconciliation
+
+    def _load(self) -> Counters:
+        counters: Counters = {}
+
+        def add(name, value):
+            if value:
+                counters[name] = counters.get(name, 0) + value
+
+        db = self.session_factory()
+        try:
+            if db.get_bind().dialect.name == 'postgresql':
+                # Every query below reads the same snapshot
+                db.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+            u = UserModel
+            for user_type, count in db.query(u.user_type, func.count(u.id)) \
+                    .filter(u.deleted_at.is_(None)).group_by(u.user_type):
+                add("users", count)
+                add(f"users:{user_type}", count)
+            since = datetime.combine(
+                datetime.utcnow().date() - timedelta(days=self.signup_window_days - 1), datetime.min.time())
+            for (created_at,) in db.query(u.created_at).filter(u.deleted_at.is_(None), u.created_at >= since):
+                add(f"signups:{created_at.date()}", 1)
+
+            p = PhotographerModel
+            count, rating_sum, rated = db.query(func.count(p.id), func.sum(p.rating), func.count(p.rating)) \
+                .filter(p.deleted_at.is_(None)).one()
+            add("photographers", count)
+            add("rating_sum", rating_sum or 0.0)
+            add("rated", rated)
+
+            b = BookingModel
+            for status, count, amount in db.query(b.status, func.count(b.id), func.sum(b.total_amount)) \
+                    .filter(b.deleted_at.is_(None)).group_by(b.status):
+                add("bookings", count)
+                add(f"bookings:{status}", count)
+                add("booking_amount", amount or 0.0)
+                if status == 'completed':
+                    add("revenue", amount or 0.0)
+        finally:
+            db.close()
+        return counters
+
+    async def reconcile(self):
+        """Rebuild the counters from the database"""
+        with self._lock:
+            self._journal = []
+        loop = asyncio.get_event_loop()
+        try:
+            fresh = await loop.run_in_executor(None, self._load)
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            for delta in self._journal:
+                _add(fresh, delta)
+            self.replayed_deltas += len(self._journal)
+            self._journal = None
+            names = set(fresh) | set(self._counters)
+            self.last_drift = sum(
+                1 for name in names if abs(fresh.get(name, 0) - self._counters.get(name, 0)) > 1e-6
+            )
+            self._counters = fresh
+        self.reconciliations += 1
+
+    def request_reconcile(self):
+        self._worker.wake()
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Dashboard aggregate reconciliation failed")
+            await self._worker.sleep(self.reconcile_interval)
+
+    def metrics(self) -> dict:
+        return {
+            "counters": len(self._counters),
+            "reconciliations": self.reconciliations,
+            "replayed_deltas": self.replayed_deltas,
+            "last_drift": self.last_drift,
+        }
+
+
+dashboard_aggregates = DashboardAggregates(
+    reconcile_interval=settings.DASHBOARD_RECONCILE_INTERVAL,
+    signup_window_days=settings.DASHBOARD_SIGNUP_WINDOW_DAYS,
+)
+metrics_registry.register("aggregates", dashboard_aggregates.metrics)
+
+
+def _add(counters: Counters, delta: Counters):
+    for name, value in delta.items():
+        if value:
+            counters[name] = counters.get(name, 0) + value
+
+
+def _diff(new: Counters, old: Counters) -> Counters:
+    delta = dict(new)
+    for name, value in old.items():
+        delta[name] = delta.get(name, 0) - value
+    return delta
+
+
+def _user_state(target, value=getattr):
+    return dashboard_aggregates.user_counters(
+        value(target, 'user_type'), value(target, 'created_at'), value(target, 'deleted_at') is not None)
+
+def _photographer_state(target, value=getattr):
+    return dashboard_aggregates.photographer_counters(
+        value(target, 'rating'), value(target, 'deleted_at') is not None)
+
+def _booking_state(target, value=getattr):
+    return dashboard_aggregates.booking_counters(
+        value(target, 'status'), value(target, 'total_amount'), value(target, 'deleted_at') is not None)
+
+
+def _listen(model, state):
+    @event.listens_for(model, 'after_insert')
+    def _inserted(mapper, connection, target):
+        delta = state(target)
+        run_after_commit(target, lambda: dashboard_aggregates.apply(delta))
+
+    @event.listens_for(model, 'after_update')
+    def _updated(mapper, connection, target):
+        delta = _diff(state(target), state(target, previous_value))
+        run_after_commit(target, lambda: dashboard_aggregates.apply(delta))
+
+    @event.listens_for(model, 'after_delete')
+    def _deleted(mapper, connection, target):
+        delta = _diff({}, state(target, previous_value))
+        run_after_commit(target, lambda: dashboard_aggregates.apply(delta))
+
+
+_listen(UserModel, _user_state)
+_listen(PhotographerModel, _photographer_state)
+_listen(BookingModel, _booking_state)
+
+
+def _count_bulk_bookings(rows):
+    delta: Counters = {}
+    for row in rows:
+        counters = dashboard_aggregates.booking_counters(
+            row['status'], row['total_amount'], row['deleted_at'] is not None)
+        for name, value in counters.items():
+            delta[name] = delta.get(name, 0) + value
+    dashboard_aggregates.apply(delta)
+
+booking_bulk_insert_listeners.append(_count_bulk_bookings)
+
+
+after_bulk_change(dashboard_aggregates.request_reconcile, UserModel, PhotographerModel, BookingModel)
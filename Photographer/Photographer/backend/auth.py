@@ -1,19 +1,20 @@
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-from .database import get_db, UserModel
+from .database import get_db, run_db, UserModel
 from .config import settings
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
+from .user_cache import CachedUser, auth_user_cache
+from .password_hashing import pwd_context, password_hasher
+from .google_verifier import CertificateFetchError, google_token_verifier
+from .aggregates import dashboard_aggregates
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+if settings.RATE_LIMIT_BACKEND == "redis":
+    from fastapi_limiter.depends import RateLimiter
+else:
+    from .rate_limit import RateLimiter
 
 # OAuth2 configuration
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -35,6 +36,36 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
+
+def _find_user_by_email(db: Session, email: str) -> Optional[UserModel]:
+    return db.query(UserModel).filter(UserModel.email == email).first()
+
+def _load_cached_user(db: Session, email: str) -> Optional[CachedUser]:
+    user = _find_user_by_email(db, email)
+    return CachedUser.from_model(user) if user is not None else None
+
+def _store_password_hash(db: Session, user: UserModel, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.commit()
+
+async def authenticate_user(db: Session, email: str, password: str) -> Optional[UserModel]:
+    user = await run_db(db, _find_user_by_email, email)
+    if user is None:
+        await password_hasher.dummy_verify()
+        return None
+    verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not verified:
+        return None
+    if new_hash:
+        # Hash was made with an older work factor; replace it while we have the password
+        await run_db(db, _store_password_hash, user, new_hash)
+    return user
+
 def create_token(data: dict, expires_delta: Optional[timedelta] = None, is_refresh_token: bool = False) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -63,11 +94,12 @@ def create_tokens(data: dict) -> Dict[str, str]:
 
 async def verify_google_token(token: str):
     try:
-        idinfo = id_token.verify_oauth2_token(
-            token, google_requests.Request(), settings.GOOGLE_CLIENT_ID)
-        if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
-            raise ValueError('Invalid issuer')
-        return idinfo
+        return await google_token_verifier.verify(token)
+    except CertificateFetchError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Google sign-in is temporarily unavailable",
+        )
     except ValueError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -91,20 +123,30 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     except JWTError:
         raise credentials_exception
 
-    user = db.query(UserModel).filter(UserModel.email == token_data.email).first()
+    user = auth_user_cache.get(token_data.email)
     if user is None:
+        version = auth_user_cache.version
+        user = await run_db(db, _load_cached_user, token_data.email)
+        if user is None:
+            raise credentials_exception
+        auth_user_cache.put(user, version)
+    if user.deleted_at is not None:
         raise credentials_exception
+    dashboard_aggregates.record_activity(user.id)
     return user
 
+# Per client address; RATE_LIMITS["/token"] overrides it on the memory backend
+login_rate_limiter = RateLimiter(times=10, minutes=1)
+
 async def get_current_active_user(
-    current_user: UserModel = Depends(get_current_user),
+    current_user: CachedUser = Depends(get_current_user),
     rate_limiter: None = Depends(RateLimiter(times=100, minutes=1))
 ):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-async def get_current_admin_user(current_user: UserModel = Depends(get_current_user)):
+async def get_current_admin_user(current_user: CachedUser = Depends(get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -121,7 +163,7 @@ async def refresh_access_token(refresh_token: str, db: Session = Depends(get_db)
                 detail="Invalid refresh token"
             )
         email: str = payload.get("sub")
-        user = db.query(UserModel).filter(UserModel.email == email).first()
+        user = await run_db(db, _find_user_by_email, email)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,336 @@
+import asyncio
+import bisect
+import itertools
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import (
+    SessionLocal, BookingModel, run_after_commit, previous_value, booking_bulk_insert_listeners, after_bulk_change,
+)
+from .message_bus import message_bus
+from .metrics_registry import metrics_registry
+
+# Bookings that hold the photographer's time
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+_EPOCH = datetime(1970, 1, 1)
+
+Interval = Tuple[float, float]
+
+
+def _seconds(moment: datetime) -> float:
+    return (moment - _EPOCH).total_seconds()
+
+
+class PhotographerSchedule:
+    """One photographer's booked intervals, sorted by start.
+
+    ``max_duration`` grows to the longest interval ever added, so only those
+    starting in ``(start - max_duration, end)`` can overlap [start, end): a
+    conflict check is one bisect plus a scan of that window, which holds a
+    handful of bookings unless the photographer has an unusually long one.
+    Adding or removing is a bisect plus a list insert or delete;
+    that is a memmove of the later entries, O(n) but cheap at the size of
+    one photographer's upcoming bookings.
+    """
+
+    __slots__ = ("max_duration", "_starts", "_ends", "_keys", "_start_of")
+
+    def __init__(self, max_duration: float = 86400.0):
+        self.max_duration = max_duration
+        self._starts: List[float] = []
+        self._ends: List[float] = []
+        self._keys: List[Hashable] = []
+        self._start_of: Dict[Hashable, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def add(self, start: float, end: float, key: Hashable):
+        if key in self._start_of:
+            self.remove(key)
+        self.max_duration = max(self.max_duration, end - start)
+        i = bisect.bisect_right(self._starts, start)
+        self._starts.insert(i, start)
+        self._ends.insert(i, end)
+        self._keys.insert(i, key)
+        self._start_of[key] = start
+
+    def remove(self, key: Hashable) -> bool:
+        start = self._start_of.pop(key, None)
+        if start is None:
+            return False
+        i = bisect.bisect_left(self._starts, start)
+        while self._keys[i] != key:
+            i += 1
+        del self._starts[i], self._ends[i], self._keys[i]
+        return True
+
+    def prune(self, before: float):
+        """Forget intervals that ended before ``before``"""
+        count = bisect.bisect_left(self._starts, before - self.max_duration)
+        if count:
+            for key in self._keys[:count]:
+                del self._start_of[key]
+            del self._starts[:count], self._ends[:count], self._keys[:count]
+
+    def conflict(self, start: float, end: float) -> Optional[Hashable]:
+        """Key of an interval overlapping [start, end), or None"""
+        earliest = start - self.max_duration
+        i = bisect.bisect_left(self._starts, end) - 1
+        while i >= 0 and self._starts[i] > earliest:
+            if self._ends[i] > start:
+                return self._keys[i]
+            i -= 1
+        return None
+
+
+class AvailabilityIndex:
+    """Pending and confirmed bookings per photographer, for overlap checks.
+
+    Schedules are loaded from the database the first time a photographer is
+    checked, then kept current by booking events after commit. Other workers
+    drop their copy when a booking changes here and reload it on next use.
+    Only bookings that can still be running are kept. ``max_booking_hours``
+    is only enforced for new bookings, so longer stored ones (imported or
+    older) are looked up separately.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, max_booking_hours: float = 24.0):
+        self.session_factory = session_factory
+        self.max_booking_seconds = max_booking_hours * 3600
+        self._schedules: Dict[int, PhotographerSchedule] = {}
+        self._lock = threading.Lock()
+        # Photographers whose bookings changed while a load was running
+        self._loads_running = 0
+        self._changed_during_load: Set[int] = set()
+        self._holds = itertools.count()
+
+        self.loads = 0
+        self.checks = 0
+        self.conflicts = 0
+
+    # Loading
+
+    def _query(self, photographer_ids: List[int]) -> Dict[int, PhotographerSchedule]:
+        now = datetime.utcnow()
+        since = now - timedelta(seconds=self.max_booking_seconds)
+        schedules = {pid: PhotographerSchedule(self.max_booking_seconds) for pid in photographer_ids}
+        db = self.session_factory()
+        try:
+            b = BookingModel
+            for chunk_start in range(0, len(photographer_ids), 500):
+                rows = db.query(b.id, b.photographer_id, b.booking_date, b.duration_hours).filter(
+                    b.photographer_id.in_(photographer_ids[chunk_start:chunk_start + 500]),
+                    b.status.in_(ACTIVE_STATUSES),
+                    b.deleted_at.is_(None),
+                    self._starting_since_or_long(since),
+                )
+                for booking_id, photographer_id, booking_date, duration_hours in rows:
+                    if booking_date < since and booking_date + timedelta(hours=duration_hours) <= now:
+                        continue
+                    start = _seconds(booking_date)
+                    schedules[photographer_id].add(start, start + duration_hours * 3600, booking_id)
+        finally:
+            db.close()
+        return schedules
+
+    async def ensure_loaded(self, photographer_ids: Iterable[int], attempts: int = 3):
+        photographer_ids = set(photographer_ids)
+        for attempt in range(attempts):
+            missing = [pid for pid in photographer_ids if pid not in self._schedules]
+            if not missing:
+                return
+            with self._lock:
+                self._loads_running += 1
+            try:
+                loop = asyncio.get_event_loop()
+                schedules = await loop.run_in_executor(None, self._query, missing)
+            finally:
+                with self._lock:
+                    self._loads_running -= 1
+                    changed = self._changed_during_load
+                    if not self._loads_running:
+                        self._changed_during_load = set()
+            self.loads += 1
+            with self._lock:
+                for pid, schedule in schedules.items():
+                    # A commit raced the query and may be missing from the
+                    # snapshot; load that photographer again
+                    if pid not in changed or attempt == attempts - 1:
+                        self._schedules.setdefault(pid, schedule)
+
+    # Checks
+
+    def conflict(self, photographer_id: int, start: datetime, end: datetime) -> Optional[Hashable]:
+        """Booking (or hold) overlapping [start, end); call ``ensure_loaded`` first"""
+        self.checks += 1
+        with self._lock:
+            schedule = self._schedules.get(photographer_id)
+            found = schedule.conflict(_seconds(start), _seconds(end)) if schedule is not None else None
+        if found is not None:
+            self.conflicts += 1
+        return found
+
+    async def free(self, photographer_ids: Iterable[int], start: datetime, end: datetime) -> List[int]:
+        """The photographers among ``photographer_ids`` with nothing booked in [start, end)"""
+        photographer_ids = list(photographer_ids)
+        await self.ensure_loaded(photographer_ids)
+        low, high = _seconds(start), _seconds(end)
+        free = []
+        with self._lock:
+            for pid in photographer_ids:
+                schedule = self._schedules.get(pid)
+                if schedule is not None and schedule.conflict(low, high) is None:
+                    free.append(pid)
+        self.checks += len(photographer_ids)
+        return free
+
+    def hold(self, photographer_id: int, start: datetime, end: datetime) -> Hashable:
+        """Reserve the slot while the booking is being written"""
+        key = ("hold", next(self._holds))
+        with self._lock:
+            # Not loaded means dropped since the check (a bulk change); the
+            # next check reloads it from the database
+            schedule = self._schedules.get(photographer_id)
+            if schedule is not None:
+                schedule.add(_seconds(start), _seconds(end), key)
+        return key
+
+    def release(self, photographer_id: int, key: Hashable):
+        with self._lock:
+            schedule = self._schedules.get(photographer_id)
+            if schedule is not None:
+                schedule.remove(key)
+
+    # Changes
+
+    def apply(self, photographer_id: int, booking_id: int, interval: Optional[Interval]):
+        with self._lock:
+            if self._loads_running:
+                self._changed_during_load.add(photographer_id)
+            schedule = self._schedules.get(photographer_id)
+            if schedule is None:
+                return
+            schedule.remove(booking_id)
+            if interval is not None:
+                schedule.add(interval[0], interval[1], booking_id)
+                schedule.prune(_seconds(datetime.utcnow()))
+
+    def find_conflict(self, db: Session, photographer_id: int, start: datetime, end: datetime) -> Optional[int]:
+        """Id of a stored booking overlapping [start, end), read through ``db``.
+
+        The authoritative check: the in-memory schedules only see this
+        worker's holds, so ``create_booking`` runs this in the inserting
+        transaction after locking the photographer row.
+        """
+        b = BookingModel
+        rows = db.query(b.id, b.booking_date, b.duration_hours).filter(
+            b.photographer_id == photographer_id,
+            b.status.in_(ACTIVE_STATUSES),
+            b.deleted_at.is_(None),
+            self._starting_since_or_long(start - timedelta(seconds=self.max_booking_seconds)),
+            b.booking_date < end,
+        )
+        for booking_id, booking_date, duration_hours in rows:
+            if booking_date + timedelta(hours=duration_hours) > start:
+                return booking_id
+        return None
+
+    def _starting_since_or_long(self, since: datetime):
+        """Filter for bookings starting at or after ``since``, or longer than ``max_booking_hours``"""
+        b = BookingModel
+        return or_(b.booking_date >= since, b.duration_hours > self.max_booking_seconds / 3600)
+
+    def invalidate(self, photographer_id: int):
+        with self._lock:
+            if self._loads_running:
+                self._changed_during_load.add(photographer_id)
+            self._schedules.pop(photographer_id, None)
+
+    def clear(self):
+        with self._lock:
+            if self._loads_running:
+                self._changed_during_load.update(self._schedules)
+            self._schedules.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "schedules": len(self._schedules),
+            "intervals": sum(len(schedule) for schedule in self._schedules.values()),
+            "loads": self.loads,
+            "checks": self.checks,
+            "conflicts": self.conflicts,
+        }
+
+
+availability = AvailabilityIndex(max_booking_hours=settings.BOOKING_MAX_DURATION_HOURS)
+metrics_registry.register("availability", availability.metrics)
+
+
+def _interval(target, value=getattr) -> Optional[Interval]:
+    if value(target, 'status') not in ACTIVE_STATUSES or value(target, 'deleted_at') is not None:
+        return None
+    start = _seconds(value(target, 'booking_date'))
+    return start, start + value(target, 'duration_hours') * 3600
+
+
+def _changed(old_photographer: Optional[int], new_photographer: Optional[int], booking_id: int,
+             interval: Optional[Interval]):
+    def apply():
+        if old_photographer is not None and old_photographer != new_photographer:
+            availability.apply(old_photographer, booking_id, None)
+            message_bus.publish('booking_schedule', old_photographer)
+        if new_photographer is not None:
+            availability.apply(new_photographer, booking_id, interval)
+            message_bus.publish('booking_schedule', new_photographer)
+    return apply
+
+
+@event.listens_for(BookingModel, 'after_insert')
+def _booking_inserted(mapper, connection, target):
+    interval = _interval(target)
+    if interval is not None:
+        run_after_commit(target, _changed(None, target.photographer_id, target.id, interval))
+
+
+@event.listens_for(BookingModel, 'after_update')
+def _booking_updated(mapper, connection, target):
+    old, new = _interval(target, previous_value), _interval(target)
+    old_photographer = previous_value(target, 'photographer_id')
+    if old != new or old_photographer != target.photographer_id:
+        run_after_commit(target, _changed(old_photographer, target.photographer_id, target.id, new))
+
+
+@event.listens_for(BookingModel, 'after_delete')
+def _booking_deleted(mapper, connection, target):
+    photographer_id = previous_value(target, 'photographer_id')
+    run_after_commit(target, _changed(None, photographer_id, target.id, None))
+
+
+def _bulk_inserted(rows):
+    # Row ids are unknown after an executemany, so reload those photographers
+    for photographer_id in {row['photographer_id'] for row in rows if row['status'] in ACTIVE_STATUSES}:
+        availability.invalidate(photographer_id)
+        message_bus.publish('booking_schedule', photographer_id)
+
+booking_bulk_insert_listeners.append(_bulk_inserted)
+
+
+def _clear_all():
+    availability.clear()
+    message_bus.publish('booking_schedule', None)
+
+after_bulk_change(_clear_all, BookingModel)
+
+
+def _remote_schedule_change(photographer_id, origin):
+    if photographer_id is None:
+        availability.clear()
+    else:
+        availability.invalidate(photographer_id)
+
+message_bus.subscribe('booking_schedule', _remote_schedule_change)
@@ -0,0 +1,60 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+
+class BackgroundTask:
+    """One asyncio task running ``run()`` from ``start`` until ``stop``.
+
+    Components own one of these for their periodic loop: ``sleep`` waits out
+    the loop's interval, and ``wake`` cuts that wait short when work piles up
+    early. ``wake`` may be called from any thread (after-commit hooks run on
+    executor threads) and does nothing while the task is not running.
+    """
+
+    def __init__(self, run: Callable[[], Awaitable[None]]):
+        self._run = run
+        self._task: Optional[asyncio.Task] = None
+        # Created on start so they bind to the running event loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_event_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+    def wake(self):
+        wakeup, loop = self._wakeup, self._loop
+        if wakeup is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            wakeup.set()
+        else:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def sleep(self, timeout: float):
+        """Wait ``timeout`` seconds, or less if ``wake`` is called"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
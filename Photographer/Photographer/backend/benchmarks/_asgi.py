@@ -0,0 +1,129 @@
+"""Minimal in-process ASGI drivers (HTTP, websocket, lifespan), so benchmarks need no client or server"""
+import asyncio
+import contextlib
+import json
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlencode
+
+
+async def asgi_request(app, method: str, path: str, params: Optional[dict] = None,
+                       headers: Optional[Dict[str, str]] = None,
+                       body: bytes = b"", chunk_size: Optional[int] = None) -> Tuple[int, Dict[str, str], bytes]:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": urlencode(params or {}, doseq=True).encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    # The body arrives in ``chunk_size`` pieces, like a streamed upload
+    step = chunk_size or max(len(body), 1)
+    offset = 0
+    sent_request = False
+    status = 0
+    response_headers: Dict[str, str] = {}
+    chunks = []
+
+    async def receive():
+        nonlocal offset, sent_request
+        if not sent_request:
+            piece = body[offset:offset + step]
+            offset += step
+            sent_request = offset >= len(body)
+            return {"type": "http.request", "body": piece, "more_body": not sent_request}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            for key, value in message.get("headers", []):
+                response_headers[key.decode()] = value.decode()
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, response_headers, b"".join(chunks)
+
+
+def json_body(body: bytes):
+    return json.loads(body) if body else None
+
+
+class AsgiWebSocket:
+    """Client end of a websocket connected straight to an ASGI app"""
+
+    def __init__(self, app, path: str, query_string: str = "", headers: Optional[Dict[str, str]] = None):
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query_string.encode(),
+            # What a server passes on from the handshake; engineio checks these
+            "headers": [(k.lower().encode(), v.encode())
+                        for k, v in {"host": "testserver", "connection": "Upgrade", "upgrade": "websocket",
+                                     **(headers or {})}.items()],
+            "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+            "subprotocols": [],
+        }
+        self.app = app
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    async def connect(self):
+        self._to_app.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.ensure_future(self.app(self.scope, self._to_app.get, self._from_app.put))
+        self._task.add_done_callback(lambda _: self._from_app.put_nowait({"type": "websocket.close"}))
+        message = await self._from_app.get()
+        if message["type"] != "websocket.accept":
+            raise ConnectionError(f"Websocket rejected: {message}")
+
+    async def send_text(self, text: str):
+        self._to_app.put_nowait({"type": "websocket.receive", "text": text})
+
+    async def receive(self) -> Union[str, bytes]:
+        """Next text or bytes frame; raises ConnectionError once the app closed"""
+        message = await self._from_app.get()
+        if message["type"] == "websocket.close":
+            self.closed = True
+            self._from_app.put_nowait(message)
+            raise ConnectionError("Websocket closed")
+        return message.get("text") if message.get("text") is not None else message.get("bytes")
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._to_app.put_nowait({"type": "websocket.disconnect", "code": 1000})
+            try:
+                await asyncio.wait_for(self._task, timeout=5)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+
+
+@contextlib.asynccontextmanager
+async def asgi_lifespan(app):
+    """Run the app's startup handlers, and its shutdown handlers on exit"""
+    to_app: asyncio.Queue = asyncio.Queue()
+    from_app: asyncio.Queue = asyncio.Queue()
+    task = asyncio.ensure_future(app({"type": "lifespan", "asgi": {"version": "3.0"}}, to_app.get, from_app.put))
+    to_app.put_nowait({"type": "lifespan.startup"})
+    message = await from_app.get()
+    if message["type"] != "lifespan.startup.complete":
+        raise RuntimeError(f"Startup failed: {message}")
+    try:
+        yield app
+    finally:
+        to_app.put_nowait({"type": "lifespan.shutdown"})
+        await from_app.get()
+        await task
@@ -0,0 +1,94 @@
+"""Show that slow queries no longer serialize concurrent requests.
+
+Each request runs a query that takes ``--query-ms`` inside the database driver.
+The same burst of concurrent requests is timed for three setups:
+
+* blocking: the old pattern, a sync Session queried directly in ``async def``
+* threadpool: sync Session through ``database.run_db`` (DB_ASYNC=false)
+* async: AsyncSession on aiosqlite through ``database.run_db`` (DB_ASYNC=true)
+
+    python -m backend.benchmarks.bench_async_db --requests 20 --query-ms 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def run_mode(mode: str, requests: int, query_ms: int, db_path: str):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["DB_ASYNC"] = "true" if mode == "async" else "false"
+
+    from fastapi import Depends
+    from sqlalchemy import event, text
+    from ..database import engine, async_engine, get_db, run_db
+    from ..main import app
+    from ._asgi import asgi_request
+
+    def slow_sleep(seconds):
+        time.sleep(seconds)
+        return 1
+
+    def register(dbapi_connection, connection_record):
+        dbapi_connection.create_function("slow_sleep", 1, slow_sleep)
+
+    event.listen(engine, "connect", register)
+    if async_engine is not None:
+        event.listen(async_engine.sync_engine, "connect", register)
+
+    statement = text("SELECT slow_sleep(:seconds)")
+    seconds = query_ms / 1000
+
+    if mode == "blocking":
+        @app.get("/_bench/slow")
+        async def slow_blocking(db=Depends(get_db)):
+            return db.execute(statement, {"seconds": seconds}).scalar()
+    else:
+        @app.get("/_bench/slow")
+        async def slow(db=Depends(get_db)):
+            return await run_db(db, lambda session: session.execute(statement, {"seconds": seconds}).scalar())
+
+    async def burst():
+        await asgi_request(app, "GET", "/_bench/slow")  # warm the pool
+        start = time.perf_counter()
+        results = await asyncio.gather(*(asgi_request(app, "GET", "/_bench/slow") for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+        assert all(status == 200 for status, _, _ in results), results[0]
+        return elapsed
+
+    elapsed = asyncio.run(burst())
+    print(json.dumps({"mode": mode, "elapsed_s": elapsed}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--query-ms", type=int, default=50)
+    parser.add_argument("--mode", choices=["blocking", "threadpool", "async"])
+    args = parser.parse_args()
+
+    if args.mode:
+        with tempfile.TemporaryDirectory() as tmp:
+            run_mode(args.mode, args.requests, args.query_ms, os.path.join(tmp, "bench.db"))
+        return
+
+    serial = args.requests * args.query_ms / 1000
+    print(f"{args.requests} concurrent requests, {args.query_ms} ms query each "
+          f"(fully serialized would take {serial:.2f} s)")
+    for mode in ("blocking", "threadpool", "async"):
+        # Settings are read at import time, so each mode runs in its own process
+        output = subprocess.run(
+            [sys.executable, "-m", __spec__.name, "--mode", mode,
+             "--requests", str(args.requests), "--query-ms", str(args.query_ms)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>10}: {result['elapsed_s']:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Booking conflict checks and availability search: interval index vs scanning bookings.
+
+    python -m backend.benchmarks.bench_availability --photographers 5000 --bookings 200
+"""
+import argparse
+import random
+import time
+
+from ..availability import PhotographerSchedule
+
+HOUR = 3600.0
+CITIES = ["Dehradun", "Rishikesh", "Chandigarh", "Delhi"]
+
+
+def build(photographers: int, per_photographer: int, seed: int):
+    """Non-overlapping bookings of 1-8 hours spread over the coming year"""
+    rng = random.Random(seed)
+    schedules, rows, cities = {}, [], {}
+    for pid in range(photographers):
+        cities[pid] = rng.choice(CITIES)
+        schedule = schedules[pid] = PhotographerSchedule(8 * HOUR)
+        start = rng.uniform(0, 24) * HOUR
+        for n in range(per_photographer):
+            duration = rng.uniform(1, 8) * HOUR
+            schedule.add(start, start + duration, (pid, n))
+            rows.append((pid, start, start + duration))
+            start += duration + rng.uniform(2, 72) * HOUR
+    return schedules, rows, cities
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photographers", type=int, default=5000)
+    parser.add_argument("--bookings", type=int, default=200, help="bookings per photographer")
+    parser.add_argument("--checks", type=int, default=20000)
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    schedules, rows, cities = build(args.photographers, args.bookings, args.seed)
+    build_s = time.perf_counter() - started
+    by_photographer = {}
+    for pid, start, end in rows:
+        by_photographer.setdefault(pid, []).append((start, end))
+    horizon = max(end for _, _, end in rows)
+    rng = random.Random(args.seed + 1)
+
+    probes = [(rng.randrange(args.photographers), rng.uniform(0, horizon), rng.uniform(1, 8) * HOUR)
+              for _ in range(args.checks)]
+    started = time.perf_counter()
+    indexed = [schedules[pid].conflict(a, a + d) is not None for pid, a, d in probes]
+    index_us = (time.perf_counter() - started) / len(probes) * 1e6
+    started = time.perf_counter()
+    scanned = [any(s < a + d and e > a for s, e in by_photographer[pid]) for pid, a, d in probes]
+    scan_us = (time.perf_counter() - started) / len(probes) * 1e6
+    assert indexed == scanned
+
+    searches = [(rng.choice(CITIES), rng.uniform(0, horizon), rng.uniform(1, 8) * HOUR)
+                for _ in range(args.searches)]
+    members = {city: [pid for pid, c in cities.items() if c == city] for city in CITIES}
+    started = time.perf_counter()
+    free_index = [[pid for pid in members[city] if schedules[pid].conflict(a, a + d) is None]
+                  for city, a, d in searches]
+    search_index_ms = (time.perf_counter() - started) / len(searches) * 1000
+    started = time.perf_counter()
+    free_scan = []
+    for city, a, d in searches:
+        # What a query over the bookings table has to do without the index
+        busy = {pid for pid, s, e in rows if s < a + d and e > a}
+        free_scan.append([pid for pid in members[city] if pid not in busy])
+    search_scan_ms = (time.perf_counter() - started) / len(searches) * 1000
+    assert free_index == free_scan
+
+    print(f"{len(rows)} bookings for {args.photographers} photographers (indexed in {build_s:.2f} s)")
+    print(f"conflict check   index {index_us:8.2f} us   scan of photographer's bookings {scan_us:8.2f} us")
+    print(f"city search      index {search_index_ms:8.2f} ms   scan of all bookings {search_scan_ms:8.2f} ms")
+    print(f"conflicts found in {sum(indexed)} of {len(probes)} checks")
+
+
+if __name__ == "__main__":
+    main()
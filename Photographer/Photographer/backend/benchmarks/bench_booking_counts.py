@@ -0,0 +1,130 @@
+"""Statements issued to keep photographers.total_bookings current for N bookings.
+
+Runs against an in-memory SQLite database:
+
+    python -m backend.benchmarks.bench_booking_counts --bookings 1000 --photographers 50
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, func, pool
+from sqlalchemy.orm import Session, sessionmaker
+
+from .. import database
+from ..database import BookingModel, PhotographerModel, UserModel, bulk_insert_bookings
+
+
+class StatementCounter:
+    def __init__(self, engine):
+        self.counts = {}
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.split(None, 2)
+        key = " ".join(verb[:2]) if verb[0] == "UPDATE" else verb[0]
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def take(self) -> dict:
+        counts, self.counts = self.counts, {}
+        return counts
+
+
+def _legacy_per_row_update(mapper, connection, target):
+    # What the old after_insert listener did, minus the f-string
+    if target.status == 'completed':
+        connection.execute(
+            PhotographerModel.__table__.update()
+            .where(PhotographerModel.user_id == target.photographer_id)
+            .values(total_bookings=PhotographerModel.total_bookings + 1)
+        )
+
+
+def setup(photographers: int):
+    engine = create_engine("sqlite://", poolclass=pool.StaticPool, connect_args={"check_same_thread": False})
+    database.Base.metadata.create_all(engine)
+    Sessions = sessionmaker(bind=engine)
+    db = Sessions()
+    customer = UserModel(email="customer@example.com", full_name="C", hashed_password="x", user_type="customer")
+    users = [UserModel(email=f"p{i}@example.com", full_name="P", hashed_password="x", user_type="photographer")
+             for i in range(photographers)]
+    db.add_all([customer, *users])
+    db.commit()
+    db.add_all([PhotographerModel(user_id=user.id, hourly_rate=1000, city="Delhi") for user in users])
+    db.commit()
+    customer_id, ids = customer.id, [user.id for user in users]
+    db.close()
+    return engine, Sessions, customer_id, ids
+
+
+def booking_rows(count: int, customer_id: int, photographer_ids, status: str, rng):
+    start = datetime(2024, 1, 1)
+    return [
+        dict(customer_id=customer_id, photographer_id=rng.choice(photographer_ids),
+             booking_date=start + timedelta(hours=i), duration_hours=2, status=status,
+             location={}, total_amount=2000.0)
+        for i in range(count)
+    ]
+
+
+def total_bookings(db: Session) -> int:
+    return db.query(func.sum(PhotographerModel.total_bookings)).scalar() or 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bookings", type=int, default=1000)
+    parser.add_argument("--photographers", type=int, default=50)
+    args = parser.parse_args()
+    n = args.bookings
+    rng = random.Random(5)
+    engine, Sessions, customer_id, photographer_ids = setup(args.photographers)
+    counter = StatementCounter(engine)
+    results = []
+
+    # Old behaviour: one UPDATE per completed insert, from the mapper event
+    event.remove(BookingModel, "after_insert", database._count_inserted_booking)
+    event.listen(BookingModel, "after_insert", _legacy_per_row_update)
+    db = Sessions()
+    db.add_all([BookingModel(**row) for row in booking_rows(n, customer_id, photographer_ids, "completed", rng)])
+    counter.take()
+    db.commit()
+    results.append(("per-row listener, ORM insert of completed", counter.take()))
+    event.remove(BookingModel, "after_insert", _legacy_per_row_update)
+    event.listen(BookingModel, "after_insert", database._count_inserted_booking)
+    db.query(BookingModel).delete()
+    db.query(PhotographerModel).update({PhotographerModel.total_bookings: 0})
+    db.commit()
+
+    db.add_all([BookingModel(**row) for row in booking_rows(n, customer_id, photographer_ids, "completed", rng)])
+    counter.take()
+    db.commit()
+    results.append(("batched, ORM insert of completed", counter.take()))
+    assert total_bookings(db) == n
+
+    pending = [BookingModel(**row) for row in booking_rows(n, customer_id, photographer_ids, "pending", rng)]
+    db.add_all(pending)
+    db.commit()
+    for booking in db.query(BookingModel).filter(BookingModel.status == "pending"):
+        booking.status = "completed"
+    counter.take()
+    db.commit()
+    results.append(("batched, pending -> completed updates", counter.take()))
+    assert total_bookings(db) == 2 * n
+
+    rows = booking_rows(n, customer_id, photographer_ids, "completed", rng)
+    counter.take()
+    bulk_insert_bookings(db, rows)
+    db.commit()
+    results.append(("bulk_insert_bookings", counter.take()))
+    assert total_bookings(db) == 3 * n
+    db.close()
+
+    print(f"{n} bookings across {args.photographers} photographers")
+    for label, counts in results:
+        summary = ", ".join(f"{key}: {value}" for key, value in sorted(counts.items()))
+        print(f"  {label:<45} {sum(counts.values()):>6} statements  ({summary})")
+
+
+if __name__ == "__main__":
+    main()
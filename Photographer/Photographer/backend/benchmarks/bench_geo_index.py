@@ -0,0 +1,108 @@
+"""Compare GeoIndex radius / nearest queries against a naive full scan.
+
+Run from the directory containing ``backend``:
+
+    python -m backend.benchmarks.bench_geo_index --photographers 50000
+"""
+import argparse
+import random
+import time
+
+from ..geo_index import GeoIndex, haversine_km
+
+# Rough bounding box around the cities we operate in (Delhi to Dehradun)
+LAT_RANGE = (28.4, 30.5)
+LON_RANGE = (76.7, 78.3)
+CITIES = ["Dehradun", "Rishikesh", "Chandigarh", "Delhi"]
+SPECIALTIES = ["wedding", "portrait", "event", "fashion", "product", "travel"]
+
+
+def build(count: int, seed: int):
+    rng = random.Random(seed)
+    index = GeoIndex()
+    rows = []
+    for pid in range(count):
+        lat = rng.uniform(*LAT_RANGE)
+        lon = rng.uniform(*LON_RANGE)
+        city = rng.choice(CITIES)
+        specialties = rng.sample(SPECIALTIES, 2)
+        rate = rng.uniform(500, 5000)
+        index.update_profile(pid, city=city, specialties=specialties, hourly_rate=rate)
+        index.update_location(pid, lat, lon)
+        rows.append((str(pid), lat, lon, city, set(specialties), rate))
+    return index, rows
+
+
+def naive_radius(rows, lat, lon, radius_km, city, max_rate):
+    found = []
+    for pid, plat, plon, pcity, _, rate in rows:
+        if city and pcity != city:
+            continue
+        if max_rate is not None and rate > max_rate:
+            continue
+        distance = haversine_km(lat, lon, plat, plon)
+        if distance <= radius_km:
+            found.append((distance, pid))
+    found.sort()
+    return found
+
+
+def naive_nearest(rows, lat, lon, k):
+    return sorted((haversine_km(lat, lon, plat, plon), pid) for pid, plat, plon, *_ in rows)[:k]
+
+
+def timed(fn, queries):
+    start = time.perf_counter()
+    for query in queries:
+        fn(*query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photographers", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--moves", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    index, rows = build(args.photographers, args.seed)
+    rng = random.Random(args.seed + 1)
+    points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    for _ in range(args.moves):
+        pid = rng.randrange(args.photographers)
+        index.update_location(pid, rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+    move_us = (time.perf_counter() - start) / args.moves * 1_000_000
+    # Keep the naive rows in sync with the index after the moves
+    rows = [
+        (pid, index._entries[pid].latitude, index._entries[pid].longitude, city, specs, rate)
+        for pid, _, _, city, specs, rate in rows
+    ]
+
+    print(f"{args.photographers} photographers, {args.queries} queries")
+    print(f"location update: {move_us:.2f} us/op")
+    radius_index = timed(lambda lat, lon: index.query_radius(lat, lon, args.radius_km), points)
+    radius_naive = timed(lambda lat, lon: naive_radius(rows, lat, lon, args.radius_km, None, None), points)
+    print(f"radius {args.radius_km}km: index {radius_index:.3f} ms  naive {radius_naive:.3f} ms")
+    filtered_index = timed(
+        lambda lat, lon: index.query_radius(lat, lon, args.radius_km, city="Delhi", max_hourly_rate=2000), points)
+    filtered_naive = timed(
+        lambda lat, lon: naive_radius(rows, lat, lon, args.radius_km, "Delhi", 2000), points)
+    print(f"radius + filters: index {filtered_index:.3f} ms  naive {filtered_naive:.3f} ms")
+    knn_index = timed(lambda lat, lon: index.nearest(lat, lon, args.k), points)
+    knn_naive = timed(lambda lat, lon: naive_nearest(rows, lat, lon, args.k), points)
+    print(f"nearest k={args.k}: index {knn_index:.3f} ms  naive {knn_naive:.3f} ms")
+
+    # Sanity check: both paths agree on the result set
+    lat, lon = points[0]
+    assert [r["user_id"] for r in index.nearest(lat, lon, args.k)] == [pid for _, pid in naive_nearest(rows, lat, lon, args.k)]
+    assert {r["user_id"] for r in index.query_radius(lat, lon, args.radius_km)} == \
+        {pid for _, pid in naive_radius(rows, lat, lon, args.radius_km, None, None)}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Top-rated photographer reads: indexed ORDER BY plus a join to users vs the in-memory leaderboard.
+
+Also times leaderboard updates (a rating change, a booking count change) and
+a full rebuild.
+
+    python -m backend.benchmarks.bench_leaderboard --photographers 100000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import create_engine, pool
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base, PhotographerModel, UserModel
+from ..leaderboard import Leaderboard
+
+CITIES = ["Delhi", "Mumbai", "Pune", "Bengaluru", "Chennai", "Kolkata", "Jaipur", "Goa"]
+
+
+def seed(engine, count: int, rng: random.Random):
+    users = UserModel.__table__
+    photographers = PhotographerModel.__table__
+    with engine.begin() as connection:
+        connection.execute(users.insert(), [
+            {"id": i, "email": f"p{i}@example.com", "full_name": f"Photographer {i}", "hashed_password": "x",
+             "user_type": "photographer", "is_active": True, "is_admin": False}
+            for i in range(1, count + 1)
+        ])
+        connection.execute(photographers.insert(), [
+            {"user_id": i, "portfolio_urls": [], "specialties": [], "hourly_rate": 1000,
+             "city": rng.choice(CITIES), "rating": round(rng.uniform(3, 5), 2),
+             "total_bookings": rng.randint(0, 200)}
+            for i in range(1, count + 1)
+        ])
+
+
+def sql_top(Sessions, limit: int, city=None):
+    db = Sessions()
+    try:
+        query = db.query(PhotographerModel.user_id, UserModel.full_name, PhotographerModel.city,
+                         PhotographerModel.rating, PhotographerModel.total_bookings) \
+            .join(UserModel, UserModel.id == PhotographerModel.user_id) \
+            .filter(PhotographerModel.deleted_at.is_(None), PhotographerModel.rating.isnot(None))
+        if city is not None:
+            query = query.filter(PhotographerModel.city == city)
+        return query.order_by(PhotographerModel.rating.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+
+def per_call(fn, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photographers", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=500)
+    args = parser.parse_args()
+    rng = random.Random(7)
+
+    engine = create_engine("sqlite://", poolclass=pool.StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    seed(engine, args.photographers, rng)
+    Sessions = sessionmaker(bind=engine)
+
+    board = Leaderboard(session_factory=Sessions)
+    started = time.perf_counter()
+    asyncio.run(board.rebuild())
+    print(f"rebuild of {args.photographers} photographers: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    limit = args.limit
+    rows = [
+        ("top global, SQL", lambda: sql_top(Sessions, limit)),
+        ("top global, leaderboard", lambda: board.top(limit)),
+        ("top in city, SQL", lambda: sql_top(Sessions, limit, "Pune")),
+        ("top in city, leaderboard", lambda: board.top(limit, city="Pune")),
+        ("rating change", lambda: board.update(rng.randint(1, args.photographers), rating=round(rng.uniform(3, 5), 2))),
+        ("booking count change", lambda: board.add_bookings({rng.randint(1, args.photographers): 1})),
+    ]
+    for name, fn in rows:
+        print(f"{name:<26} {per_call(fn, args.calls) * 1e6:10.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+"""Load test of the REST API, the dashboard websocket and the socket.io server.
+
+Boots ``main.app`` and ``realtime.app`` in-process (startup and shutdown
+handlers included) against a fresh SQLite database seeded with synthetic
+users, photographers and bookings. Each scenario then runs ``--concurrency``
+virtual users for ``--duration`` seconds:
+
+* rest: authenticated mix of listings, detail reads (with ETags), booking
+  reads and creates, and admin dashboard stats
+* dashboard: /ws/dashboard/metrics clients timing metrics_request round trips
+* socketio: customers in chat pairs timing message delivery, and
+  photographers timing acknowledged updates of their own location
+
+Latency percentiles, throughput and process memory are printed and can be
+saved as JSON; ``--compare`` prints the change against an earlier run. Client
+and server share one event loop, so results are for comparing runs on the
+same machine rather than absolute capacity.
+
+    python -m backend.benchmarks.bench_load --concurrency 50 --duration 10 --output before.json
+    python -m backend.benchmarks.bench_load --concurrency 50 --duration 10 --compare before.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+SCENARIOS = ("rest", "dashboard", "socketio")
+
+MOBILE_FIELDS = "user_id,full_name,hourly_rate,rating,city"
+CITIES = ["Delhi", "Mumbai", "Pune", "Jaipur", "Kolkata"]
+CENTERS = {"Delhi": (28.61, 77.21), "Mumbai": (19.08, 72.88), "Pune": (18.52, 73.86),
+           "Jaipur": (26.91, 75.79), "Kolkata": (22.57, 88.36)}
+
+
+def percentiles(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0, "mean": 0.0}
+    pick = lambda p: ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1] * 1000,
+            "mean": sum(ordered) / len(ordered) * 1000}
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1_048_576
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Recorder:
+    """Latencies and errors per operation"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, operation: str, seconds: float, ok: bool = True):
+        if ok:
+            self.latencies.setdefault(operation, []).append(seconds)
+        else:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    async def timed(self, operation: str, call: Awaitable, ok: Callable = lambda result: True):
+        started = time.perf_counter()
+        try:
+            result = await call
+        except Exception:
+            self.record(operation, 0.0, ok=False)
+            return None
+        self.record(operation, time.perf_counter() - started, ok(result))
+        return result
+
+    def summary(self, elapsed: float) -> dict:
+        operations = sorted(set(self.latencies) | set(self.errors))
+        return {
+            operation: {
+                "count": len(self.latencies.get(operation, ())),
+                "errors": self.errors.get(operation, 0),
+                "throughput_per_s": len(self.latencies.get(operation, ())) / elapsed,
+                "latency_ms": percentiles(self.latencies.get(operation, [])),
+            }
+            for operation in operations
+        }
+
+
+async def run_workers(concurrency: int, duration: float, worker: Callable[[int, float], Awaitable]) -> float:
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(worker(i, deadline) for i in range(concurrency)))
+    return time.perf_counter() - started
+
+
+# Data
+
+def seed(customers: int, photographers: int, bookings: int, rng: random.Random) -> dict:
+    from ..auth import create_tokens
+    from ..database import SessionLocal, UserModel, PhotographerModel, bulk_insert_bookings, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        users = [UserModel(email=f"photographer{i}@example.com", full_name=f"Photographer {i}",
+                           hashed_password="x", user_type="photographer") for i in range(photographers)]
+        users += [UserModel(email=f"customer{i}@example.com", full_name=f"Customer {i}",
+                            hashed_password="x", user_type="customer") for i in range(customers)]
+        admin = UserModel(email="admin@example.com", full_name="Admin", hashed_password="x",
+                          user_type="customer", is_admin=True)
+        db.add_all([*users, admin])
+        db.flush()
+        photographer_ids = [user.id for user in users[:photographers]]
+        customer_ids = [user.id for user in users[photographers:]]
+        profiles = []
+        for user_id in photographer_ids:
+            city = rng.choice(CITIES)
+            latitude, longitude = CENTERS[city]
+            profiles.append(PhotographerModel(
+                user_id=user_id, city=city, hourly_rate=rng.randint(500, 5000), rating=round(rng.uniform(3, 5), 2),
+                specialties=rng.sample(["wedding", "portrait", "fashion", "event", "product"], 2),
+                portfolio_urls=[f"https://cdn.example.com/{user_id}/{n}.jpg" for n in range(8)],
+                current_location={"latitude": latitude + rng.uniform(-0.2, 0.2),
+                                  "longitude": longitude + rng.uniform(-0.2, 0.2)},
+            ))
+        db.add_all(profiles)
+        db.commit()
+        start = datetime(2023, 1, 1)
+        bulk_insert_bookings(db, [
+            dict(customer_id=rng.choice(customer_ids), photographer_id=rng.choice(photographer_ids),
+                 booking_date=start + timedelta(hours=3 * n), duration_hours=2,
+                 status=rng.choice(["completed", "confirmed", "cancelled"]), location={}, total_amount=2000.0)
+            for n in range(bookings)
+        ])
+        db.commit()
+        from ..database import BookingModel
+        own_bookings: Dict[int, List[int]] = {}
+        for booking_id, customer_id in db.query(BookingModel.id, BookingModel.customer_id):
+            own_bookings.setdefault(customer_id, []).append(booking_id)
+        return {
+            "photographer_ids": photographer_ids,
+            "photographers": [
+                (user_id, create_tokens({"sub": f"photographer{n}@example.com", "is_admin": False})["access_token"])
+                for n, user_id in enumerate(photographer_ids)
+            ],
+            "customers": [
+                (customer_id, create_tokens({"sub": f"customer{n}@example.com", "is_admin": False})["access_token"])
+                for n, customer_id in enumerate(customer_ids)
+            ],
+            "own_bookings": own_bookings,
+            "admin_token": create_tokens({"sub": "admin@example.com", "is_admin": True})["access_token"],
+        }
+    finally:
+        db.close()
+
+
+# Scenarios
+
+async def rest_scenario(app, data: dict, concurrency: int, duration: float, rng: random.Random) -> Recorder:
+    from ._asgi import asgi_request
+
+    recorder = Recorder()
+    ok = lambda result: result[0] < 400
+    etags: Dict[int, str] = {}
+
+    async def worker(i: int, deadline: float):
+        customer_id, token = data["customers"][i % len(data["customers"])]
+        auth = {"Authorization": f"Bearer {token}", "X-Forwarded-For": f"10.0.{i // 250}.{i % 250}"}
+        own = data["own_bookings"].get(customer_id) or [0]
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            if roll < 0.30:
+                await recorder.timed("list_photographers", asgi_request(
+                    app, "GET", "/photographers/", {"city": rng.choice(CITIES), "fields": MOBILE_FIELDS}), ok)
+            elif roll < 0.45:
+                latitude, longitude = CENTERS[rng.choice(CITIES)]
+                await recorder.timed("nearby_photographers", asgi_request(
+                    app, "GET", "/photographers/", {"latitude": latitude, "longitude": longitude, "radius_km": 10}), ok)
+            elif roll < 0.75:
+                pid = rng.choice(data["photographer_ids"])
+                headers = {"If-None-Match": etags[pid]} if pid in etags else {}
+                result = await recorder.timed("get_photographer", asgi_request(
+                    app, "GET", f"/photographers/{pid}", headers=headers), ok)
+                if result is not None and "etag" in result[1]:
+                    etags[pid] = result[1]["etag"]
+            elif roll < 0.92:
+                await recorder.timed("get_booking", asgi_request(
+                    app, "GET", f"/bookings/{rng.choice(own)}", headers=auth), ok)
+            elif roll < 0.98:
+                moment = datetime(2031, 1, 1) + timedelta(hours=rng.randrange(24 * 365))
+                body = json.dumps({"photographer_id": rng.choice(data["photographer_ids"]),
+                                   "booking_date": moment.isoformat(), "duration_hours": 2, "location": {}})
+                # 409 (slot taken) is a valid answer under load
+                await recorder.timed("create_booking", asgi_request(
+                    app, "POST", "/bookings/", headers={**auth, "Content-Type": "application/json"},
+                    body=body.encode()), lambda result: result[0] in (201, 409))
+            else:
+                await recorder.timed("dashboard_stats", asgi_request(
+                    app, "GET", "/dashboard/stats", headers={"Authorization": f"Bearer {data['admin_token']}"}), ok)
+
+    recorder.elapsed = await run_workers(concurrency, duration, worker)
+    return recorder
+
+
+async def dashboard_scenario(app, data: dict, concurrency: int, duration: float, rng: random.Random) -> Recorder:
+    from ._asgi import AsgiWebSocket
+
+    recorder = Recorder()
+
+    async def worker(i: int, deadline: float):
+        websocket = AsgiWebSocket(app, "/ws/dashboard/metrics")
+        if await recorder.timed("connect", websocket.connect()) is None and websocket.closed:
+            return
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                await websocket.send_text(json.dumps({"type": "metrics_request"}))
+                while True:
+                    # Skip pushed history and deltas until our answer arrives
+                    message = json.loads(await websocket.receive())
+                    if message.get("type") == "metrics_response":
+                        break
+                recorder.record("metrics_request", time.perf_counter() - started)
+        except ConnectionError:
+            recorder.record("metrics_request", 0.0, ok=False)
+        finally:
+            await websocket.close()
+
+    recorder.elapsed = await run_workers(concurrency, duration, worker)
+    return recorder
+
+
+class SocketIOClient:
+    """Just enough of the Engine.IO 4 / Socket.IO 5 protocol over an in-process websocket"""
+
+    def __init__(self, app, on_event: Callable[[str, list], None]):
+        from ._asgi import AsgiWebSocket
+
+        self.websocket = AsgiWebSocket(app, "/socket.io/", "EIO=4&transport=websocket")
+        self.on_event = on_event
+        self._acks: Dict[int, asyncio.Future] = {}
+        self._next_ack = 0
+        self._reader: Optional[asyncio.Task] = None
+
+    async def connect(self, token: Optional[str] = None):
+        await self.websocket.connect()
+        await self.websocket.receive()  # Engine.IO open packet
+        await self.websocket.send_text("40" + (json.dumps({"token": token}) if token else ""))
+        while True:
+            frame = await self.websocket.receive()
+            if frame.startswith("40"):
+                break
+            if frame.startswith("44"):
+                raise ConnectionError(f"Connection refused: {frame[2:]}")
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                frame = await self.websocket.receive()
+                if frame == "2":
+                    await self.websocket.send_text("3")
+                elif frame.startswith("42"):
+                    event, *args = json.loads(frame[2:])
+                    self.on_event(event, args)
+                elif frame.startswith("43"):
+                    bracket = frame.index("[")
+                    future = self._acks.pop(int(frame[2:bracket]), None)
+                    if future is not None and not future.done():
+                        future.set_result(json.loads(frame[bracket:]))
+        except ConnectionError:
+            pass
+
+    async def emit(self, event: str, *args):
+        await self.websocket.send_text("42" + json.dumps([event, *args]))
+
+    async def call(self, event: str, *args):
+        """Emit and wait for the server's acknowledgement"""
+        self._next_ack += 1
+        future = asyncio.get_event_loop().create_future()
+        self._acks[self._next_ack] = future
+        await self.websocket.send_text(f"42{self._next_ack}" + json.dumps([event, *args]))
+        return await asyncio.wait_for(future, timeout=10)
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        await self.websocket.close()
+
+
+async def socketio_scenario(app, data: dict, concurrency: int, duration: float, rng: random.Random) -> Recorder:
+    recorder = Recorder()
+    concurrency += -concurrency % 4  # customers in chat pairs, as many photographers
+    customers = data["customers"]
+    photographers = data["photographers"]
+
+    async def worker(i: int, deadline: float):
+        # The first half chat, the rest report their own locations
+        is_photographer = i >= concurrency // 2
+        if is_photographer:
+            user_id, token = photographers[i % len(photographers)]
+        else:
+            user_id, token = customers[i % len(customers)]
+        partner_id = customers[(i ^ 1) % len(customers)][0]
+
+        def on_event(event, args):
+            if event == "new_message":
+                sent_at = float(args[0]["message"].split(":", 1)[0])
+                recorder.record("chat_delivery", time.perf_counter() - sent_at)
+
+        client = SocketIOClient(app, on_event)
+        try:
+            await recorder.timed("connect", client.connect(token))
+            await client.emit("register_user", str(user_id))
+            await asyncio.sleep(0.1)  # let every partner register
+            latitude, longitude = CENTERS[rng.choice(CITIES)]
+            while time.perf_counter() < deadline:
+                if not is_photographer:
+                    await client.call("send_message", {
+                        "sender_id": str(user_id), "receiver_id": str(partner_id),
+                        "message": f"{time.perf_counter()}:hello",
+                    })
+                    recorder.record("send_message_ack", 0.0)
+                else:
+                    await recorder.timed("update_location", client.call("update_location", {
+                        "photographer_id": str(user_id),
+                        "latitude": latitude + rng.uniform(-0.05, 0.05),
+                        "longitude": longitude + rng.uniform(-0.05, 0.05),
+                    }))
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.2)  # let the last messages arrive
+        except (ConnectionError, asyncio.TimeoutError):
+            recorder.record("session", 0.0, ok=False)
+        finally:
+            await client.close()
+
+    # The server prints every connect and disconnect
+    with contextlib.redirect_stdout(io.StringIO()):
+        recorder.elapsed = await run_workers(concurrency, duration, worker)
+    recorder.latencies.pop("send_message_ack", None)
+    return recorder
+
+
+SCENARIO_RUNNERS = {"rest": rest_scenario, "dashboard": dashboard_scenario, "socketio": socketio_scenario}
+
+
+# Reporting
+
+def print_report(results: dict):
+    for scenario, result in results["scenarios"].items():
+        print(f"{scenario}: {result['duration_s']:.1f}s, rss {result['rss_mb']['before']:.0f} -> "
+              f"{result['rss_mb']['after']:.0f} MiB")
+        for operation, stats in result["operations"].items():
+            latency = stats["latency_ms"]
+            print(f"  {operation:<22} {stats['count']:>7} ok {stats['errors']:>5} err "
+                  f"{stats['throughput_per_s']:>9.1f}/s   p50 {latency['p50']:7.2f}  p95 {latency['p95']:7.2f}  "
+                  f"p99 {latency['p99']:7.2f} ms")
+
+
+def print_comparison(old: dict, new: dict):
+    print(f"Compared with {old.get('timestamp', 'the earlier run')} ({old.get('git_commit') or 'unknown commit'}):")
+    for scenario, result in new["scenarios"].items():
+        previous = old.get("scenarios", {}).get(scenario)
+        if previous is None:
+            continue
+        for operation, stats in result["operations"].items():
+            before = previous["operations"].get(operation)
+            if before is None:
+                continue
+            change = lambda new_value, old_value: (new_value - old_value) / old_value * 100 if old_value else 0.0
+            print(f"  {scenario + '/' + operation:<32} p95 {before['latency_ms']['p95']:7.2f} -> "
+                  f"{stats['latency_ms']['p95']:7.2f} ms ({change(stats['latency_ms']['p95'], before['latency_ms']['p95']):+.0f}%)"
+                  f"   throughput {change(stats['throughput_per_s'], before['throughput_per_s']):+.0f}%")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, data: dict) -> dict:
+    from ..main import app as rest_app
+    from ..realtime import app as realtime_app
+    from ._asgi import asgi_lifespan
+
+    rng = random.Random(args.seed)
+    scenarios = {}
+    async with asgi_lifespan(rest_app), asgi_lifespan(realtime_app):
+        for scenario in args.scenarios:
+            app = realtime_app if scenario == "socketio" else rest_app
+            before = rss_mb()
+            recorder = await SCENARIO_RUNNERS[scenario](app, data, args.concurrency, args.duration, rng)
+            scenarios[scenario] = {
+                "duration_s": recorder.elapsed,
+                "rss_mb": {"before": before, "after": rss_mb()},
+                "operations": recorder.summary(recorder.elapsed),
+            }
+        # Let tasks cancelled by the last disconnects finish before the loop closes
+        await asyncio.sleep(0.1)
+    return scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--customers", type=int, default=500)
+    parser.add_argument("--photographers", type=int, default=1000)
+    parser.add_argument("--bookings", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Settings are read at import time, so configure before importing the apps
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        os.environ["DB_ASYNC"] = "false"
+        os.environ["UPLOAD_DIRECTORY"] = os.path.join(tmp, "uploads")
+        # Virtual users would otherwise hit the per-client limit of 100/minute
+        os.environ["RATE_LIMITS"] = json.dumps({"/bookings/": "1000000/second",
+                                                "/bookings/{booking_id}": "1000000/second"})
+        started = time.perf_counter()
+        data = seed(args.customers, args.photographers, args.bookings, random.Random(args.seed))
+        print(f"Seeded {args.customers} customers, {args.photographers} photographers, "
+              f"{args.bookings} bookings in {time.perf_counter() - started:.1f}s; "
+              f"{args.concurrency} virtual users for {args.duration:g}s per scenario")
+        scenarios = asyncio.run(run(args, data))
+
+    results = {
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {name: getattr(args, name) for name in
+                   ("scenarios", "concurrency", "duration", "customers", "photographers", "bookings", "seed")},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "scenarios": scenarios,
+    }
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
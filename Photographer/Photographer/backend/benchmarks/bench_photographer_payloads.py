@@ -0,0 +1,109 @@
+"""Payload size and encode time of photographer listings per 1,000 photographers.
+
+Compares the old path (full ORM objects, FastAPI's jsonable_encoder and
+json.dumps, optionally validated through the ``Photographer`` model) with
+column projection plus ``fast_json`` for the default and the mobile fieldset.
+
+    python -m backend.benchmarks.bench_photographer_payloads --photographers 1000
+"""
+import argparse
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, pool
+from sqlalchemy.orm import sessionmaker
+
+from .. import fast_json
+from ..database import Base, PhotographerModel, UserModel
+from ..main import DEFAULT_PHOTOGRAPHER_FIELDS, Photographer, _photographer_query, _photographer_row
+
+MOBILE_FIELDS = ["user_id", "full_name", "hourly_rate", "rating", "city"]
+
+
+def seed(db, count: int, rng: random.Random):
+    users = [UserModel(email=f"p{i}@example.com", full_name=f"Photographer {i}", hashed_password="x",
+                       user_type="photographer") for i in range(count)]
+    db.add_all(users)
+    db.flush()
+    specialties = ["wedding", "portrait", "fashion", "event", "product", "travel", "food"]
+    db.add_all([
+        PhotographerModel(
+            user_id=user.id,
+            portfolio_urls=[f"https://cdn.example.com/portfolio/{user.id}/{n}.jpg" for n in range(12)],
+            specialties=rng.sample(specialties, 3),
+            hourly_rate=rng.randint(500, 5000),
+            city=rng.choice(["Delhi", "Mumbai", "Pune"]),
+            current_location={"latitude": rng.uniform(18, 29), "longitude": rng.uniform(72, 78)},
+            rating=round(rng.uniform(3, 5), 2),
+        )
+        for user in users
+    ])
+    db.commit()
+
+
+def timed(fn, rounds: int):
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - started)
+    return body, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photographers", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", poolclass=pool.StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Sessions = sessionmaker(bind=engine)
+    db = Sessions()
+    seed(db, args.photographers, random.Random(3))
+
+    def old_dicts():
+        return [
+            {"user_id": str(p.user_id), "portfolio_urls": p.portfolio_urls, "specialties": p.specialties,
+             "hourly_rate": p.hourly_rate, "city": p.city, "current_location": p.current_location,
+             "rating": p.rating}
+            for p in db.query(PhotographerModel).order_by(PhotographerModel.rating.desc())
+        ]
+
+    def projected(names):
+        return [_photographer_row(names, row)
+                for row in _photographer_query(db, names).order_by(PhotographerModel.rating.desc())]
+
+    cases = {
+        "ORM + jsonable_encoder": lambda: json.dumps(jsonable_encoder(old_dicts())).encode(),
+        "ORM + Photographer model": lambda: json.dumps(
+            jsonable_encoder([Photographer(**p) for p in old_dicts()])).encode(),
+        "projection + fast_json": lambda: fast_json.dumps(projected(list(DEFAULT_PHOTOGRAPHER_FIELDS))),
+        "projection + fast_json, mobile fields": lambda: fast_json.dumps(projected(MOBILE_FIELDS)),
+    }
+    encoder = "orjson" if fast_json.orjson is not None else "json (orjson not installed)"
+    print(f"{args.photographers} photographers, fast_json encoder: {encoder}")
+    for label, fn in cases.items():
+        db.expunge_all()
+        body, seconds = timed(fn, args.rounds)
+        per_thousand = 1000 / args.photographers
+        print(f"  {label:<40} {len(body) * per_thousand / 1024:8.1f} KiB   "
+              f"{seconds * 1000 * per_thousand:7.2f} ms per 1,000 (query + encode)")
+
+    # The same rows without the query, to isolate serialization
+    rows = old_dicts()
+    mobile = projected(MOBILE_FIELDS)
+    for label, fn in {
+        "encode only: jsonable_encoder + json": lambda: json.dumps(jsonable_encoder(rows)).encode(),
+        "encode only: fast_json": lambda: fast_json.dumps(rows),
+        "encode only: fast_json, mobile fields": lambda: fast_json.dumps(mobile),
+    }.items():
+        _, seconds = timed(fn, args.rounds)
+        print(f"  {label:<40} {'':>12}   {seconds * 1000 * 1000 / args.photographers:7.2f} ms per 1,000")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Connect/disconnect churn: PresenceRegistry vs the old linear-scan dict.
+
+    python -m backend.benchmarks.bench_presence --users 100000 --churn 20000
+"""
+import argparse
+import random
+import time
+
+from ..presence import PresenceRegistry
+
+
+def old_disconnect(active_users, sid):
+    user_id = next((uid for uid, session_id in active_users.items() if session_id == sid), None)
+    if user_id:
+        del active_users[user_id]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--churn", type=int, default=20_000)
+    parser.add_argument("--old-churn", type=int, default=500,
+                        help="cycles for the linear scan, which is far slower")
+    args = parser.parse_args()
+    rng = random.Random(3)
+
+    registry = PresenceRegistry()
+    start = time.perf_counter()
+    for i in range(args.users):
+        registry.register(f"sid-{i}", i)
+        if i % 5 == 0:
+            registry.register(f"sid-{i}-tablet", i)  # second device
+    fill_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for n in range(args.churn):
+        user = rng.randrange(args.users)
+        sid = f"churn-{n}"
+        registry.register(sid, user)
+        registry.unregister(sid)
+    registry_us = (time.perf_counter() - start) / args.churn * 1_000_000
+
+    active_users = {str(i): f"sid-{i}" for i in range(args.users)}
+    start = time.perf_counter()
+    for n in range(args.old_churn):
+        user = str(rng.randrange(args.users))
+        sid = f"churn-{n}"
+        previous = active_users[user]
+        active_users[user] = sid
+        old_disconnect(active_users, sid)
+        active_users[user] = previous
+    old_us = (time.perf_counter() - start) / args.old_churn * 1_000_000
+
+    print(f"{args.users} users, {registry.session_count()} sessions (filled in {fill_s:.2f} s)")
+    print(f"PresenceRegistry connect+disconnect: {registry_us:.2f} us/cycle")
+    print(f"linear scan connect+disconnect:      {old_us:.2f} us/cycle")
+    print(f"online users: {registry.online_count()}")
+
+
+if __name__ == "__main__":
+    main()
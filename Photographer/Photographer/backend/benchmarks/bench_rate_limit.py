@@ -0,0 +1,72 @@
+"""Per-check overhead of the in-memory token-bucket rate limiter.
+
+    python -m backend.benchmarks.bench_rate_limit --checks 200000 --keys 10000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from fastapi import FastAPI, HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+
+from ..rate_limit import RateLimiter, TokenBucketStore
+
+
+def make_request(app, ip: str) -> Request:
+    return Request({
+        "type": "http",
+        "app": app,
+        "method": "GET",
+        "path": "/photographers/",
+        "headers": [],
+        "client": (ip, 1234),
+        "endpoint": None,
+    })
+
+
+async def bench_dependency(checks: int, keys: int, store: TokenBucketStore) -> float:
+    app = FastAPI()
+    limiter = RateLimiter(times=100, minutes=1, store=store)
+    requests = [make_request(app, f"10.0.{i // 256}.{i % 256}") for i in range(keys)]
+    response = Response()
+    rng = random.Random(1)
+    picks = [rng.randrange(keys) for _ in range(checks)]
+    start = time.perf_counter()
+    for i in picks:
+        try:
+            await limiter(requests[i], response)
+        except HTTPException:
+            pass
+    return (time.perf_counter() - start) / checks * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--checks", type=int, default=200_000)
+    parser.add_argument("--keys", type=int, default=10_000)
+    args = parser.parse_args()
+
+    store = TokenBucketStore()
+    rng = random.Random(0)
+    keys = [f"10.0.0.{i}:/photographers/" for i in range(args.keys)]
+    picks = [keys[rng.randrange(args.keys)] for _ in range(args.checks)]
+    start = time.perf_counter()
+    for key in picks:
+        store.consume(key, 100, 60_000)
+    consume_us = (time.perf_counter() - start) / args.checks * 1_000_000
+    print(f"{args.checks} checks over {args.keys} keys")
+    print(f"TokenBucketStore.consume: {consume_us:.2f} us/check")
+
+    dependency_us = asyncio.run(bench_dependency(args.checks, args.keys, TokenBucketStore()))
+    print(f"RateLimiter dependency:   {dependency_us:.2f} us/check")
+
+    start = time.perf_counter()
+    evicted = sum(store.sweep_shard(i, now=time.monotonic() + 3600) for i in range(len(store._shards)))
+    sweep_ms = (time.perf_counter() - start) * 1000
+    print(f"full sweep: {sweep_ms:.2f} ms, evicted {evicted} idle buckets")
+
+
+if __name__ == "__main__":
+    main()
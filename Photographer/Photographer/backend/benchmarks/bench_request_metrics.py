@@ -0,0 +1,97 @@
+"""Per-request cost of RequestMetricsMiddleware and the SQL statement counting.
+
+Serves the same two routes from an app with and without the instrumentation:
+a route doing no SQL, and one with a classic N+1 (every user's lazy
+``sent_messages``), then prints the instrumented route table.
+
+    python -m backend.benchmarks.bench_request_metrics --users 50 --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, pool
+from sqlalchemy.orm import sessionmaker
+
+from ..database import Base, UserModel
+from ..request_metrics import RequestMetrics, RequestMetricsMiddleware
+from ._asgi import asgi_request
+
+
+def build_app(users: int, metrics=None) -> FastAPI:
+    engine = create_engine("sqlite://", poolclass=pool.StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Sessions = sessionmaker(bind=engine)
+    db = Sessions()
+    db.add_all([UserModel(email=f"u{i}@example.com", full_name=f"User {i}", hashed_password="x",
+                          user_type="customer") for i in range(users)])
+    db.commit()
+    db.close()
+
+    def get_db():
+        db = Sessions()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    if metrics is not None:
+        app.add_middleware(RequestMetricsMiddleware, metrics=metrics)
+        metrics.instrument(engine)
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/users/messages")
+    def message_counts(db=Depends(get_db)):
+        return [{"id": user.id, "sent": len(user.sent_messages)} for user in db.query(UserModel)]
+
+    return app
+
+
+async def measure(app, path: str, requests: int) -> float:
+    """Mean seconds per request, after a warm-up"""
+    for _ in range(min(requests, 100)):
+        await asgi_request(app, "GET", path)
+    started = time.perf_counter()
+    for _ in range(requests):
+        status, _, _ = await asgi_request(app, "GET", path)
+        assert status == 200, status
+    return (time.perf_counter() - started) / requests
+
+
+async def run(args):
+    metrics = RequestMetrics(query_threshold=args.threshold)
+    plain, instrumented = build_app(args.users), build_app(args.users, metrics)
+    for path, requests in (("/ping", args.requests), ("/users/messages", max(args.requests // 10, 1))):
+        # Alternate so drift in machine load hits both sides alike
+        base = with_metrics = float("inf")
+        for _ in range(args.rounds):
+            base = min(base, await measure(plain, path, requests))
+            with_metrics = min(with_metrics, await measure(instrumented, path, requests))
+        print(f"{path:<16} plain {base * 1e6:8.1f} us   instrumented {with_metrics * 1e6:8.1f} us   "
+              f"overhead {(with_metrics - base) * 1e6:+6.1f} us ({(with_metrics / base - 1) * 100:+.1f}%)")
+    snapshot = metrics.snapshot()
+    for route, stats in snapshot["routes"].items():
+        print(f"{route:<22} {stats['count']:>6} requests  p95 {stats['p95_ms']:.2f} ms  "
+              f"{stats['queries_per_request']:.0f} queries/request  {stats['db_ms_per_request']:.2f} ms in DB  "
+              f"flagged {stats['flagged']}")
+    if snapshot["recent_flagged"]:
+        print("latest flagged:", json.dumps(snapshot["recent_flagged"][-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--threshold", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
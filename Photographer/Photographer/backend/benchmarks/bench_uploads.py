@@ -0,0 +1,110 @@
+"""Throughput of concurrent portfolio uploads through the streaming endpoint.
+
+Each upload is a random body behind a JPEG signature, sent in 64 KiB ASGI
+chunks to POST /photographers/me/portfolio. Unique uploads are hashed and
+written; duplicate uploads (the same bytes again) are hashed and discarded.
+The tracemalloc peak shows memory does not grow with the file size.
+
+    python -m backend.benchmarks.bench_uploads --size-mb 4 --concurrency 1 8 32
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from fastapi import Request
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from .. import database
+from ..auth import get_current_active_user
+from ..database import PhotographerModel, UserModel
+from ..main import app
+from ..uploads import portfolio_store
+from ..user_cache import CachedUser
+from ._asgi import asgi_request
+
+CHUNK_SIZE = 65_536
+
+
+def setup_app(directory: str, photographers: int):
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}",
+                           connect_args={"check_same_thread": False, "timeout": 30})
+    database.Base.metadata.create_all(engine)
+    Sessions = sessionmaker(bind=engine)
+    db = Sessions()
+    users = [UserModel(email=f"p{i}@example.com", full_name="P", hashed_password="x", user_type="photographer")
+             for i in range(photographers)]
+    db.add_all(users)
+    db.flush()
+    db.add_all([PhotographerModel(user_id=user.id, hourly_rate=1000, city="Delhi") for user in users])
+    db.commit()
+    cached = {str(user.id): CachedUser(user.id, user.email, user.full_name, user.user_type, True, False, None)
+              for user in users}
+    db.close()
+
+    def get_db():
+        session = Sessions()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    # Each upload is made by its own photographer, picked by a header
+    def current_user(request: Request):
+        return cached[request.headers["x-bench-user"]]
+
+    app.dependency_overrides[database.get_db] = get_db
+    app.dependency_overrides[get_current_active_user] = current_user
+    portfolio_store.directory = os.path.join(directory, "uploads")
+    portfolio_store.max_size = 1 << 30
+    return list(cached)
+
+
+async def upload_all(bodies, user_ids):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        asgi_request(app, "POST", "/photographers/me/portfolio", body=body, chunk_size=CHUNK_SIZE,
+                     headers={"content-type": "image/jpeg", "content-length": str(len(body)),
+                              "x-bench-user": user_id})
+        for body, user_id in zip(bodies, user_ids)
+    ))
+    elapsed = time.perf_counter() - started
+    assert all(status == 201 for status, _, _ in results), results[0]
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench-uploads-")
+    try:
+        user_ids = setup_app(directory, max(args.concurrency))
+        size = int(args.size_mb * 1_048_576)
+        print(f"{args.size_mb:g} MiB uploads in {CHUNK_SIZE // 1024} KiB chunks")
+        for concurrency in args.concurrency:
+            bodies = [b"\xff\xd8\xff\xe0" + os.urandom(size - 4) for _ in range(concurrency)]
+            total_mb = size * concurrency / 1_048_576
+            tracemalloc.start()
+            unique = asyncio.run(upload_all(bodies, user_ids))
+            _, peak = tracemalloc.get_traced_memory()
+            duplicate = asyncio.run(upload_all(bodies, user_ids))
+            tracemalloc.stop()
+            # The bodies themselves are allocated before tracing starts
+            print(f"  {concurrency:>3} concurrent: unique {total_mb / unique:7.1f} MiB/s, "
+                  f"duplicate {total_mb / duplicate:7.1f} MiB/s, "
+                  f"peak traced memory {peak / 1_048_576:6.1f} MiB for {total_mb:g} MiB uploaded")
+        print(portfolio_store.metrics())
+    finally:
+        portfolio_store.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,429 @@
+"""Stream CSV or NDJSON files into and out of the main tables.
+
+    python -m backend.bulk_io import bookings bookings.csv.gz
+    python -m backend.bulk_io import bookings bookings.csv.gz --resume
+    python -m backend.bulk_io export users users.ndjson
+
+Files are read and written a batch at a time, so memory does not grow with
+their size. Imports use COPY on PostgreSQL (psycopg2) and executemany
+INSERTs elsewhere, commit once per batch and record the rows committed so
+far in a checkpoint file; ``--resume`` continues an interrupted import from
+there. Columns missing from the input get their model defaults.
+
+Imported bookings are added to photographer total_bookings like any other
+write; pass ``--skip-counts`` when photographers were imported with their
+totals. Once an import finishes, running workers are told over the message
+bus (MESSAGE_BUS_BACKEND=redis) and reload what they index from that table;
+other state picks the new rows up at its next reconciliation.
+"""
+import argparse
+import asyncio
+import contextlib
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, IO, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, JSON, String, Table, create_engine, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+
+from .config import settings
+from .database import (
+    engine, UserModel, PhotographerModel, BookingModel, ChatMessageModel, bulk_insert_bookings,
+)
+from .message_bus import message_bus
+
+logger = logging.getLogger(__name__)
+
+TABLES = {
+    model.__tablename__: model.__table__
+    for model in (UserModel, PhotographerModel, BookingModel, ChatMessageModel)
+}
+
+FORMATS = ("csv", "ndjson")
+
+_TRUE = {"1", "t", "true", "y", "yes"}
+
+# NULL marker in the CSV sent to COPY, so empty strings stay empty strings
+_COPY_NULL = "\\N"
+
+
+def detect_format(path: str) -> str:
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    raise ValueError(f"Cannot tell the format of {path!r}; pass --format")
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+# Decoding
+
+def _parse_datetime(value: str) -> datetime:
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _converter(column, textual: bool) -> Callable[[Any], Any]:
+    kind = column.type
+    if isinstance(kind, JSON):
+        return json.loads if textual else (lambda value: value)
+    if isinstance(kind, DateTime):
+        return _parse_datetime
+    if isinstance(kind, Boolean):
+        return (lambda value: value.strip().lower() in _TRUE) if textual else bool
+    if isinstance(kind, Integer):
+        return int
+    if isinstance(kind, Float):
+        return float
+    return str
+
+
+def _default_factory(column) -> Callable[[], Any]:
+    default = column.default
+    if default is None:
+        return lambda: None
+    if default.is_callable:
+        return lambda: default.arg(None)
+    return lambda: default.arg
+
+
+class RowDecoder:
+    """Turns input records into rows with every column of ``table``.
+
+    ``fields`` are the input's column names (the CSV header, or the keys of
+    the first NDJSON record). ``textual`` inputs (CSV) carry every value as a
+    string, with an empty string for NULL.
+    """
+
+    def __init__(self, table: Table, fields: List[str], textual: bool):
+        unknown = [field for field in fields if field not in table.c]
+        if unknown:
+            raise ValueError(f"{table.name} has no column(s) {', '.join(unknown)}")
+        self.textual = textual
+        self.fields = set(fields)
+        # (name, convert, value for an empty field)
+        self._provided: List[Tuple[str, Callable[[Any], Any], Any]] = []
+        self._defaults: List[Tuple[str, Callable[[], Any]]] = []
+        for column in table.columns:
+            if column.name in self.fields:
+                empty = "" if isinstance(column.type, String) and not column.nullable else None
+                self._provided.append((column.name, _converter(column, textual), empty))
+            elif not column.primary_key:
+                if column.default is None and not column.nullable:
+                    raise ValueError(f"Column {table.name}.{column.name} is required")
+                self._defaults.append((column.name, _default_factory(column)))
+        self.columns = [name for name, _, _ in self._provided] + [name for name, _ in self._defaults]
+
+    def decode(self, record: dict) -> dict:
+        if not self.textual and not self.fields.issuperset(record):
+            raise ValueError(f"unexpected field(s) {', '.join(sorted(set(record) - self.fields))}")
+        row = {}
+        for name, convert, empty in self._provided:
+            value = record.get(name)
+            if value is None or (self.textual and value == ""):
+                row[name] = empty
+            else:
+                row[name] = convert(value)
+        for name, default in self._defaults:
+            row[name] = default()
+        return row
+
+
+def _read_csv(f: IO[str]) -> Tuple[List[str], Iterator[dict]]:
+    reader = csv.reader(f)
+    header = next(reader, None) or []
+    return header, (dict(zip(header, values)) for values in reader)
+
+
+def _read_ndjson(f: IO[str]) -> Tuple[List[str], Iterator[dict]]:
+    records = (json.loads(line) for line in f if line.strip())
+    first = next(records, None)
+    if first is None:
+        return [], iter(())
+
+    def all_records():
+        yield first
+        yield from records
+
+    return list(first), all_records()
+
+
+# Writing to the database
+
+def _copy_cursor(db: Session):
+    """A DBAPI cursor in the session's transaction that can COPY, or None"""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    cursor = db.connection().connection.cursor()
+    return cursor if hasattr(cursor, "copy_expert") else None
+
+
+def _copy_in(db: Session, cursor, table: Table, columns: List[str], rows: List[dict]):
+    json_columns = {name for name in columns if isinstance(table.c[name].type, JSON)}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([
+            _COPY_NULL if row[name] is None else json.dumps(row[name]) if name in json_columns else row[name]
+            for name in columns
+        ])
+    buffer.seek(0)
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    cursor.copy_expert(
+        f"COPY {quote(table.name)} ({', '.join(quote(name) for name in columns)}) "
+        f"FROM STDIN WITH (FORMAT csv, NULL '{_COPY_NULL}')",
+        buffer,
+    )
+
+
+def _insert_batch(db: Session, table: Table, columns: List[str], rows: List[dict], cursor, update_counts: bool):
+    if cursor is not None:
+        insert = lambda rows: _copy_in(db, cursor, table, columns, rows)
+    else:
+        insert = lambda rows: db.execute(table.insert(), rows)
+    if table is BookingModel.__table__ and update_counts:
+        bulk_insert_bookings(db, rows, insert=insert)
+    else:
+        insert(rows)
+
+
+class Progress:
+    """Counts rows and logs the rate every ``interval`` seconds"""
+
+    def __init__(self, label: str, interval: float = 5.0):
+        self.label = label
+        self.interval = interval
+        self.rows = 0
+        self.started = time.perf_counter()
+        self._last_report = self.started
+
+    def add(self, rows: int):
+        self.rows += rows
+        now = time.perf_counter()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            logger.info("%s: %d rows, %.0f rows/s", self.label, self.rows, self.rate())
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def rate(self) -> float:
+        elapsed = self.elapsed()
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+
+# Checkpoints
+
+def _source_key(path: str) -> dict:
+    return {"source": os.path.abspath(path), "size": os.path.getsize(path)}
+
+
+def _load_checkpoint(path: str, table_name: str, source: str) -> int:
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("table") != table_name or {k: state.get(k) for k in ("source", "size")} != _source_key(source):
+        raise ValueError(f"Checkpoint {path} belongs to a different import")
+    return state["rows"]
+
+
+def _save_checkpoint(path: str, table_name: str, source: str, rows: int):
+    partial = path + ".tmp"
+    with open(partial, "w") as f:
+        json.dump({"table": table_name, **_source_key(source), "rows": rows}, f)
+    os.replace(partial, path)
+
+
+def import_rows(db: Session, table_name: str, source: str, fmt: str,
+                batch_size: int = settings.BULK_IO_BATCH_SIZE, checkpoint: Optional[str] = None,
+                resume: bool = False, use_copy: bool = True, update_counts: bool = True,
+                progress: Optional[Progress] = None) -> int:
+    """Load ``source`` into ``table_name``, committing every ``batch_size`` rows.
+
+    Returns the number of rows imported by this call. A crash between a
+    commit and the checkpoint write repeats that one batch on resume.
+    """
+    table = TABLES[table_name]
+    skip = 0
+    if checkpoint is not None and os.path.exists(checkpoint):
+        if not resume:
+            raise ValueError(f"Checkpoint {checkpoint} exists; pass --resume or delete it")
+        skip = _load_checkpoint(checkpoint, table_name, source)
+        logger.info("Resuming %s after %d rows", table_name, skip)
+    progress = progress or Progress(table_name)
+    cursor = _copy_cursor(db) if use_copy else None
+
+    with _open(source, "r") as f:
+        fields, records = (_read_csv if fmt == "csv" else _read_ndjson)(f)
+        if not fields:
+            return 0
+        decoder = RowDecoder(table, fields, textual=fmt == "csv")
+        done = skip
+        batch: List[dict] = []
+        for number, record in enumerate(records, start=1):
+            if number <= skip:
+                continue
+            try:
+                batch.append(decoder.decode(record))
+            except (ValueError, TypeError, KeyError) as exc:
+                raise ValueError(f"{source}: record {number}: {exc}") from exc
+            if len(batch) >= batch_size:
+                _insert_batch(db, table, decoder.columns, batch, cursor, update_counts)
+                db.commit()
+                done += len(batch)
+                if checkpoint is not None:
+                    _save_checkpoint(checkpoint, table_name, source, done)
+                progress.add(len(batch))
+                batch = []
+                cursor = _copy_cursor(db) if use_copy else None
+        if batch:
+            _insert_batch(db, table, decoder.columns, batch, cursor, update_counts)
+            db.commit()
+            done += len(batch)
+            progress.add(len(batch))
+
+    if "id" in decoder.columns and db.get_bind().dialect.name == "postgresql":
+        # Explicit ids leave the sequence behind
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM {table.name}))"
+        ))
+        db.commit()
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return done - skip
+
+
+async def announce_import(table_name: str):
+    """Tell running workers that ``table_name`` changed outside their ORM sessions"""
+    message_bus.publish('bulk_import', table_name)
+    try:
+        # Sends the queued event and closes the connection
+        await message_bus.stop()
+    except Exception:
+        logger.warning("Running workers were not told about the import", exc_info=True)
+
+
+# Export
+
+def _csv_value(value) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def export_rows(db: Session, table_name: str, target: str, fmt: str,
+                batch_size: int = settings.BULK_IO_BATCH_SIZE, use_copy: bool = True,
+                progress: Optional[Progress] = None) -> int:
+    """Write every row of ``table_name`` to ``target``; returns the row count"""
+    table = TABLES[table_name]
+    columns = [column.name for column in table.columns]
+    progress = progress or Progress(table_name)
+    cursor = _copy_cursor(db) if use_copy and fmt == "csv" else None
+
+    with _open(target, "w") as f:
+        if cursor is not None:
+            quote = db.get_bind().dialect.identifier_preparer.quote
+            cursor.copy_expert(
+                f"COPY {quote(table.name)} ({', '.join(quote(name) for name in columns)}) "
+                f"TO STDOUT WITH (FORMAT csv, HEADER)",
+                f,
+            )
+            progress.add(cursor.rowcount)
+            return cursor.rowcount
+
+        result = db.connection().execution_options(stream_results=True).execute(
+            select(table).order_by(table.c.id))
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for rows in result.partitions(batch_size):
+                writer.writerows([_csv_value(value) for value in row] for row in rows)
+                progress.add(len(rows))
+        else:
+            for rows in result.partitions(batch_size):
+                f.writelines(
+                    json.dumps(dict(zip(columns, row)), default=_json_default, separators=(",", ":")) + "\n"
+                    for row in rows
+                )
+                progress.add(len(rows))
+    return progress.rows
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command in ("import", "export"):
+        sub = commands.add_parser(command)
+        sub.add_argument("table", choices=sorted(TABLES))
+        sub.add_argument("path", help="CSV or NDJSON file, '.gz' for gzip, '-' for stdin/stdout")
+        sub.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+        sub.add_argument("--batch-size", type=int, default=settings.BULK_IO_BATCH_SIZE)
+        sub.add_argument("--database-url", help="default: the app's DATABASE_URL")
+        sub.add_argument("--no-copy", action="store_true", help="use batched statements even on PostgreSQL")
+        if command == "import":
+            sub.add_argument("--resume", action="store_true", help="continue from the checkpoint")
+            sub.add_argument("--checkpoint", help="default: <path>.checkpoint")
+            sub.add_argument("--skip-counts", action="store_true",
+                             help="don't add imported bookings to photographer totals")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    try:
+        fmt = args.format or detect_format(args.path)
+    except ValueError as exc:
+        parser.error(str(exc))
+    bind = create_engine(args.database_url) if args.database_url else engine
+    db = sessionmaker(bind=bind)()
+    progress = Progress(args.table)
+    try:
+        if args.command == "import":
+            checkpoint = None if args.path == "-" else args.checkpoint or args.path + ".checkpoint"
+            import_rows(db, args.table, args.path, fmt, args.batch_size, checkpoint, args.resume,
+                        use_copy=not args.no_copy, update_counts=not args.skip_counts, progress=progress)
+            asyncio.run(announce_import(args.table))
+        else:
+            export_rows(db, args.table, args.path, fmt, args.batch_size,
+                        use_copy=not args.no_copy, progress=progress)
+    except (ValueError, SQLAlchemyError) as exc:
+        db.rollback()
+        logger.error("%s failed after %d rows: %s", args.command.capitalize(), progress.rows, exc)
+        sys.exit(1)
+    finally:
+        db.close()
+    logger.info("%s %d %s rows in %.1fs (%.0f rows/s)",
+                "Imported" if args.command == "import" else "Exported",
+                progress.rows, args.table, progress.elapsed(), progress.rate())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+import asyncio
+import base64
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .auth import get_current_active_user
+from .background import BackgroundTask
+from .config import settings
+from .database import SessionLocal, ChatMessageModel, UserModel, get_db, run_db
+from .message_bus import message_bus
+from .unread_counters import unread_counters
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+chat_messages_table = ChatMessageModel.__table__
+
+
+class UnknownUser(Exception):
+    pass
+
+
+class ChatMessageWriter:
+    """Persists chat messages in the background with batched multi-row INSERTs.
+
+    ``submit`` only appends to an in-memory batch, so the socket emit path never
+    waits for a commit. The batch is written every ``flush_interval`` seconds or
+    once ``batch_size`` messages are waiting. If ``max_pending`` messages pile
+    up (database down or slow), ``submit`` flushes inline, which pushes back on
+    the senders instead of growing memory without bound.
+
+    Sender and receiver must exist when a message is submitted. Rows that still
+    violate a constraint (e.g. a user deleted meanwhile) are isolated by
+    splitting the batch and dropped, so they can't block the ones behind them.
+    A batch failing for any other reason is retried ``max_retries`` times.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 batch_size: int = 500, flush_interval: float = 0.05, max_pending: int = 10_000,
+                 max_retries: int = 20, known_users_size: int = 10_000):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.known_users_size = known_users_size
+        self._pending: List[dict] = []
+        self._failures = 0  # consecutive failed attempts at the oldest batch
+        # Ids recently seen in the users table, LRU
+        self._known_users: "OrderedDict[int, None]" = OrderedDict()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._worker = BackgroundTask(self._run)
+        # Called with each batch of rows once it is committed
+        self.listeners: List[Callable[[List[dict]], None]] = []
+
+        self.submitted = 0
+        self.persisted = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.unknown_users = 0
+        self.last_batch_duration = 0.0
+
+    async def check_users(self, *user_ids: int):
+        """Raise UnknownUser unless every id is in the users table"""
+        missing = [user_id for user_id in set(user_ids) if user_id not in self._known_users]
+        if missing:
+            loop = asyncio.get_event_loop()
+            found = await loop.run_in_executor(None, self._existing_users, missing)
+            for user_id in found:
+                self._remember_user(user_id)
+            if len(found) != len(missing):
+                self.unknown_users += 1
+                raise UnknownUser(f"Unknown user id {sorted(set(missing) - set(found))[0]}")
+        for user_id in user_ids:
+            self._known_users.move_to_end(user_id)
+
+    def _existing_users(self, user_ids: Iterable[int]) -> List[int]:
+        db = self.session_factory()
+        try:
+            return [user_id for user_id, in db.query(UserModel.id).filter(
+                UserModel.id.in_(list(user_ids)), UserModel.deleted_at.is_(None))]
+        finally:
+            db.close()
+
+    def _remember_user(self, user_id: int):
+        self._known_users[user_id] = None
+        self._known_users.move_to_end(user_id)
+        while len(self._known_users) > self.known_users_size:
+            self._known_users.popitem(last=False)
+
+    async def submit(self, sender_id: int, receiver_id: int, message: str,
+                     created_at: Optional[datetime] = None) -> dict:
+        """Queue a message; raises UnknownUser if either user doesn't exist"""
+        await self.check_users(sender_id, receiver_id)
+        now = created_at or datetime.utcnow()
+        row = {
+            "sender_id": sender_id,
+            "receiver_id": receiver_id,
+            "message": message,
+            "is_read": False,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._pending.append(row)
+        self.submitted += 1
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+        elif len(self._pending) >= self.batch_size:
+            self._worker.wake()
+        return row
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._worker.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> int:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            written = 0
+            loop = asyncio.get_event_loop()
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                started = time.monotonic()
+                try:
+                    persisted, rejected = await loop.run_in_executor(None, self._write, batch)
+                except Exception:
+                    self.failed_batches += 1
+                    self._failures += 1
+                    if self._failures > self.max_retries:
+                        self._failures = 0
+                        self.dropped += len(batch)
+                        logger.exception("Dropping %d chat messages after %d failed attempts",
+                                         len(batch), self.max_retries + 1)
+                    else:
+                        logger.exception("Failed to persist %d chat messages", len(batch))
+                        # Keep the messages, in order, for the next attempt
+                        self._pending[:0] = batch
+                    break
+                self._failures = 0
+                if rejected:
+                    self.rejected += len(rejected)
+                    logger.warning("Dropped %d chat messages violating a constraint: %s", len(rejected),
+                                   [(row["sender_id"], row["receiver_id"]) for row in rejected])
+                    for row in rejected:
+                        self._known_users.pop(row["sender_id"], None)
+                        self._known_users.pop(row["receiver_id"], None)
+                self.batches += 1
+                self.persisted += len(persisted)
+                self.last_batch_duration = time.monotonic() - started
+                written += len(persisted)
+                if persisted:
+                    for listener in self.listeners:
+                        listener(persisted)
+            return written
+
+    def _write(self, batch: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """Insert ``batch``; returns the rows written and those rejected by a constraint"""
+        try:
+            self._insert(batch)
+            return batch, []
+        except IntegrityError:
+            if len(batch) == 1:
+                return [], batch
+        # Bisect down to the offending rows; each half is its own transaction
+        middle = len(batch) // 2
+        first_written, first_rejected = self._write(batch[:middle])
+        rest_written, rest_rejected = self._write(batch[middle:])
+        return first_written + rest_written, first_rejected + rest_rejected
+
+    def _insert(self, batch: List[dict]):
+        db = self.session_factory()
+        try:
+            db.execute(chat_messages_table.insert(), batch)
+            db.commit()
+        finally:
+            db.close()
+
+    def metrics(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "submitted": self.submitted,
+            "persisted": self.persisted,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "unknown_users": self.unknown_users,
+            "last_batch_duration_seconds": self.last_batch_duration,
+        }
+
+
+chat_writer = ChatMessageWriter(
+    batch_size=settings.CHAT_WRITE_BATCH_SIZE,
+    flush_interval=settings.CHAT_WRITE_FLUSH_INTERVAL,
+    max_pending=settings.CHAT_WRITE_MAX_PENDING,
+    max_retries=settings.CHAT_WRITE_MAX_RETRIES,
+)
+metrics_registry.register("chat_writer", chat_writer.metrics)
+chat_writer.listeners.append(unread_counters.on_messages_persisted)
+
+
+# Other workers keep their own unread counters, so they hear about every
+# message this worker persists and every conversation read here
+def _share_persisted(rows: List[dict]):
+    unread = [[row["receiver_id"], row["sender_id"]] for row in rows if not row["is_read"]]
+    if unread:
+        message_bus.publish("chat_persisted", unread)
+
+def _apply_remote_persisted(pairs, origin):
+    unread_counters.on_messages_persisted(
+        {"receiver_id": receiver, "sender_id": sender} for receiver, sender in pairs
+    )
+
+def _apply_remote_read(data, origin):
+    unread_counters.mark_read(data["receiver_id"], data["sender_id"])
+
+chat_writer.listeners.append(_share_persisted)
+message_bus.subscribe("chat_persisted", _apply_remote_persisted)
+message_bus.subscribe("chat_read", _apply_remote_read)
+
+
+# History
+
+def encode_cursor(created_at: datetime, message_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, message_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def _mark_conversation_read(db: Session, user_id: int, other_id: int) -> int:
+    m = ChatMessageModel
+    updated = db.query(m).filter(
+        m.receiver_id == user_id, m.is_read.is_(False), m.sender_id == other_id,
+    ).update({m.is_read: True}, synchronize_session=False)
+    db.commit()
+    return updated
+
+def _conversation_page(db: Session, user_id: int, other_id: int,
+                       before: Optional[Tuple[datetime, int]], limit: int) -> List[ChatMessageModel]:
+    """Newest-first page of a conversation, strictly older than ``before``.
+
+    Each direction is a range scan on idx_chat_sender_receiver
+    (sender_id, receiver_id, created_at) bounded by the cursor, so the cost of
+    a page does not depend on how deep into the thread it is.
+    """
+    m = ChatMessageModel
+    rows: List[ChatMessageModel] = []
+    for sender, receiver in ((user_id, other_id), (other_id, user_id)):
+        query = db.query(m).filter(m.sender_id == sender, m.receiver_id == receiver)
+        if before is not None:
+            created_at, message_id = before
+            query = query.filter(or_(
+                m.created_at < created_at,
+                and_(m.created_at == created_at, m.id < message_id),
+            ))
+        rows.extend(query.order_by(m.created_at.desc(), m.id.desc()).limit(limit).all())
+    rows.sort(key=lambda row: (row.created_at, row.id), reverse=True)
+    return rows[:limit]
+
+
+# Routes
+router = APIRouter(prefix="/chat", tags=["chat"])
+
+@router.post("/send")
+async def send_message(receiver_id: int, message: str, current_user=Depends(get_current_active_user)):
+    try:
+        row = await chat_writer.submit(current_user.id, receiver_id, message)
+    except UnknownUser:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Receiver not found")
+    return {"status": "sent", "timestamp": row["created_at"].isoformat()}
+
+@router.get("/history/{other_user_id}")
+async def get_conversation_history(
+    other_user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.CHAT_HISTORY_PAGE_SIZE, ge=1, le=200),
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    before = decode_cursor(cursor) if cursor else None
+    # Fetch one extra row to know whether another page exists
+    rows = await run_db(db, _conversation_page, current_user.id, other_user_id, before, limit + 1)
+    page = rows[:limit]
+    return {
+        "messages": [
+            {
+                "id": row.id,
+                "sender_id": row.sender_id,
+                "receiver_id": row.receiver_id,
+                "message": row.message,
+                "is_read": row.is_read,
+                "timestamp": row.created_at.isoformat(),
+            }
+            for row in page
+        ],
+        "next_cursor": encode_cursor(page[-1].created_at, page[-1].id) if len(rows) > limit else None,
+    }
+
+@router.post("/read/{other_user_id}")
+async def mark_conversation_read(
+    other_user_id: int,
+    db: Session = Depends(get_db),
+    current_user=Depends(get_current_active_user),
+):
+    updated = await run_db(db, _mark_conversation_read, current_user.id, other_user_id)
+    unread_counters.mark_read(current_user.id, other_user_id)
+    message_bus.publish("chat_read", {"receiver_id": current_user.id, "sender_id": other_user_id})
+    return {"status": "read", "updated": updated}
+
+@router.get("/unread")
+async def get_unread_counts(current_user=Depends(get_current_active_user)):
+    return unread_counters.counts(current_user.id)
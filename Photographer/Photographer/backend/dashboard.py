@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 from pydantic import BaseModel
-from .database import get_db
+from .config import settings
+from .aggregates import dashboard_aggregates
+from .revenue_rollup import revenue_rollup
+from .leaderboard import leaderboard
 from .auth import get_current_admin_user
+from .metrics_registry import metrics_registry
+from .request_metrics import request_metrics
 
 # Dashboard Models
 class DashboardStats(BaseModel):
@@ -36,51 +41,75 @@ class UserActivity(BaseModel):
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 @router.get("/stats", response_model=DashboardStats)
-async def get_dashboard_stats(db=Depends(get_db), current_admin=Depends(get_current_admin_user)):
-    # TODO: Implement dashboard stats logic
+async def get_dashboard_stats(current_admin=Depends(get_current_admin_user)):
+    aggregates = dashboard_aggregates
+    total_users = int(aggregates.get("users"))
+    signups = aggregates.signups(settings.DASHBOARD_SIGNUP_WINDOW_DAYS)
+    previous_users = total_users - signups
     return DashboardStats(
-        total_users=0,
-        total_photographers=0,
-        total_bookings=0,
-        active_bookings=0,
-        total_revenue=0.0,
-        user_growth_rate=0.0
+        total_users=total_users,
+        total_photographers=int(aggregates.get("photographers")),
+        total_bookings=int(aggregates.get("bookings")),
+        active_bookings=int(aggregates.get("bookings:pending") + aggregates.get("bookings:confirmed")),
+        total_revenue=aggregates.get("revenue"),
+        user_growth_rate=100.0 * signups / previous_users if previous_users > 0 else 0.0
     )
 
 @router.get("/bookings/metrics", response_model=BookingMetrics)
-async def get_booking_metrics(db=Depends(get_db), current_admin=Depends(get_current_admin_user)):
-    # TODO: Implement booking metrics logic
+async def get_booking_metrics(current_admin=Depends(get_current_admin_user)):
+    aggregates = dashboard_aggregates
+    bookings = aggregates.get("bookings")
     return BookingMetrics(
-        pending_bookings=0,
-        confirmed_bookings=0,
-        completed_bookings=0,
-        cancelled_bookings=0,
-        average_booking_value=0.0
+        pending_bookings=int(aggregates.get("bookings:pending")),
+        confirmed_bookings=int(aggregates.get("bookings:confirmed")),
+        completed_bookings=int(aggregates.get("bookings:completed")),
+        cancelled_bookings=int(aggregates.get("bookings:cancelled")),
+        average_booking_value=aggregates.get("booking_amount") / bookings if bookings else 0.0
     )
 
 @router.get("/photographers/metrics", response_model=PhotographerMetrics)
-async def get_photographer_metrics(db=Depends(get_db), current_admin=Depends(get_current_admin_user)):
-    # TODO: Implement photographer metrics logic
+async def get_photographer_metrics(current_admin=Depends(get_current_admin_user)):
+    aggregates = dashboard_aggregates
+    rated = aggregates.get("rated")
     return PhotographerMetrics(
-        active_photographers=0,
-        top_rated_photographers=[],
-        average_rating=0.0,
-        total_earnings=0.0
+        active_photographers=int(aggregates.get("photographers")),
+        top_rated_photographers=leaderboard.top(5),
+        average_rating=aggregates.get("rating_sum") / rated if rated else 0.0,
+        total_earnings=aggregates.get("revenue")
     )
 
+@router.get("/photographers/leaderboard")
+async def get_photographer_leaderboard(city: Optional[str] = None, limit: int = Query(10, ge=1, le=100),
+                                       current_admin=Depends(get_current_admin_user)):
+    return {"photographers": leaderboard.top(limit, city=city)}
+
 @router.get("/users/activity", response_model=UserActivity)
-async def get_user_activity(db=Depends(get_db), current_admin=Depends(get_current_admin_user)):
-    # TODO: Implement user activity logic
+async def get_user_activity(current_admin=Depends(get_current_admin_user)):
     return UserActivity(
-        daily_active_users=0,
-        new_user_signups=0,
-        user_retention_rate=0.0
+        daily_active_users=dashboard_aggregates.daily_active_users(),
+        new_user_signups=dashboard_aggregates.signups(settings.DASHBOARD_SIGNUP_WINDOW_DAYS),
+        user_retention_rate=dashboard_aggregates.retention_rate()
     )
 
 @router.get("/revenue/chart")
-async def get_revenue_chart(timeframe: str = "week", db=Depends(get_db), current_admin=Depends(get_current_admin_user)):
-    # TODO: Implement revenue chart data logic
-    return {
-        "labels": [],
-        "data": []
-    }
\ No newline at end of file
+async def get_revenue_chart(timeframe: str = "week", current_admin=Depends(get_current_admin_user)):
+    try:
+        return revenue_rollup.chart(timeframe)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.get("/metrics")
+async def get_component_metrics(current_admin=Depends(get_current_admin_user)):
+    return metrics_registry.collect_all()
+
+@router.get("/metrics/{component}")
+async def get_single_component_metrics(component: str, current_admin=Depends(get_current_admin_user)):
+    try:
+        return metrics_registry.collect(component)
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown component {component!r}")
+
+@router.delete("/metrics/requests", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_request_metrics(current_admin=Depends(get_current_admin_user)):
+    request_metrics.reset()
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,10 +1,15 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, JSON, Index, event
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, JSON, Index, event, case, inspect
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker, relationship, object_session, Session
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
-from typing import Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar, Union
 import os
 from dotenv import load_dotenv
+from .config import settings
+
+T = TypeVar('T')
 
 # Load environment variables
 load_dotenv()
@@ -15,10 +20,40 @@ DB_PASSWORD = os.getenv('DB_PASSWORD', 'password')
 DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_NAME = os.getenv('DB_NAME', 'photohire')
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+DATABASE_URL = os.getenv('DATABASE_URL', f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}")
+
+def _async_database_url(url: str) -> str:
+    if url.startswith('postgresql://'):
+        return 'postgresql+asyncpg://' + url[len('postgresql://'):]
+    if url.startswith('sqlite://'):
+        return 'sqlite+aiosqlite://' + url[len('sqlite://'):]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL', _async_database_url(DATABASE_URL))
 
-engine = create_engine(DATABASE_URL, pool_size=5, max_overflow=10)
+def _engine_options(url: str) -> dict:
+    if url.startswith('sqlite'):
+        # SQLite has no server-side pool to size; allow use from the threadpool
+        return {'connect_args': {'check_same_thread': False}}
+    return {
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine, only created when DB_ASYNC is enabled so the async driver
+# (asyncpg / aiosqlite) is not required otherwise
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+    AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 class BaseModel(Base):
@@ -116,20 +151,173 @@ class ChatMessageModel(BaseModel):
         Index('idx_chat_unread', 'receiver_id', 'is_read')
     )
 
+def previous_value(target, attribute: str):
+    """Value of ``attribute`` before this flush"""
+    history = inspect(target).attrs[attribute].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, attribute)
+
+# photographers.total_bookings counts completed bookings. Mapper events only
+# collect per-photographer deltas; each flush applies them in one UPDATE.
+
+def _is_completed(target, value=getattr) -> bool:
+    return value(target, 'status') == 'completed' and value(target, 'deleted_at') is None
+
+def _add_booking_count_delta(target, photographer_id: int, delta: int):
+    session = object_session(target)
+    deltas = session.info.setdefault('booking_count_deltas', {})
+    deltas[photographer_id] = deltas.get(photographer_id, 0) + delta
+
 @event.listens_for(BookingModel, 'after_insert')
-def update_photographer_booking_count(mapper, connection, target):
-    if target.status == 'completed':
-        photographer = connection.execute(
-            f"UPDATE photographers SET total_bookings = total_bookings + 1 "
-            f"WHERE user_id = {target.photographer_id}"
+def _count_inserted_booking(mapper, connection, target):
+    if _is_completed(target):
+        _add_booking_count_delta(target, target.photographer_id, 1)
+
+@event.listens_for(BookingModel, 'after_update')
+def _count_updated_booking(mapper, connection, target):
+    # Covers status transitions and a booking moving to another photographer
+    if _is_completed(target, previous_value):
+        _add_booking_count_delta(target, previous_value(target, 'photographer_id'), -1)
+    if _is_completed(target):
+        _add_booking_count_delta(target, target.photographer_id, 1)
+
+@event.listens_for(BookingModel, 'after_delete')
+def _count_deleted_booking(mapper, connection, target):
+    if _is_completed(target, previous_value):
+        _add_booking_count_delta(target, previous_value(target, 'photographer_id'), -1)
+
+def apply_booking_count_deltas(connection, deltas: Dict[int, int], chunk_size: int = 500) -> int:
+    """Add ``deltas`` (photographer user id -> change) to total_bookings; returns statements run"""
+    photographers = PhotographerModel.__table__
+    changes = sorted((pid, delta) for pid, delta in deltas.items() if delta)
+    statements = 0
+    for i in range(0, len(changes), chunk_size):
+        chunk = dict(changes[i:i + chunk_size])
+        connection.execute(
+            photographers.update()
+            .where(photographers.c.user_id.in_(list(chunk)))
+            .values(total_bookings=photographers.c.total_bookings
+                    + case(chunk, value=photographers.c.user_id, else_=0))
         )
+        statements += 1
+    return statements
+
+# Called after commit with every total_bookings change (photographer user id -> delta)
+booking_count_listeners: List[Callable[[Dict[int, int]], None]] = []
+
+def _notify_booking_counts(session: Session, deltas: Dict[int, int]):
+    deltas = {pid: delta for pid, delta in deltas.items() if delta}
+    if deltas and booking_count_listeners:
+        def notify():
+            for listener in booking_count_listeners:
+                listener(deltas)
+
+        run_after_commit(session, notify)
+
+@event.listens_for(Session, 'after_flush')
+def _apply_flushed_booking_counts(session, flush_context):
+    deltas = session.info.pop('booking_count_deltas', None)
+    if deltas:
+        apply_booking_count_deltas(session.connection(), deltas)
+        _notify_booking_counts(session, deltas)
+
+# Called after commit with the rows written by bulk_insert_bookings, which
+# bypasses mapper events
+booking_bulk_insert_listeners: List[Callable[[List[dict]], None]] = []
+
+def bulk_insert_bookings(db: Session, rows: List[dict],
+                         insert: Optional[Callable[[List[dict]], None]] = None) -> int:
+    """Insert many bookings with one executemany; the caller commits.
+
+    ``insert`` writes the rows some other way (e.g. COPY) in the session's
+    transaction. Completed bookings are added to photographer counts in the
+    same transaction.
+    """
+    if not rows:
+        return 0
+    now = datetime.utcnow()
+    rows = [{'created_at': now, 'updated_at': now, 'deleted_at': None, 'notes': None, **row} for row in rows]
+    if insert is None:
+        db.execute(BookingModel.__table__.insert(), rows)
+    else:
+        insert(rows)
+    deltas: Dict[int, int] = {}
+    for row in rows:
+        if row['status'] == 'completed' and row['deleted_at'] is None:
+            deltas[row['photographer_id']] = deltas.get(row['photographer_id'], 0) + 1
+    apply_booking_count_deltas(db.connection(), deltas)
+    _notify_booking_counts(db, deltas)
+
+    def notify():
+        for listener in booking_bulk_insert_listeners:
+            listener(rows)
+
+    run_after_commit(db, notify)
+    return len(rows)
+
+def run_after_commit(target, callback):
+    """Run ``callback`` once ``target`` (a Session or an instance in one) commits.
+
+    Mapper events fire mid-flush, before the transaction is known to succeed, so
+    in-memory caches fed from them defer their updates until commit.
+    """
+    session = target if isinstance(target, Session) else object_session(target)
+    if session is None:
+        callback()
+        return
+    session.info.setdefault('after_commit_callbacks', []).append(callback)
+
+@event.listens_for(Session, 'after_commit')
+def _run_after_commit_callbacks(session):
+    for callback in session.info.pop('after_commit_callbacks', []):
+        callback()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_commit_callbacks(session):
+    session.info.pop('after_commit_callbacks', None)
+    session.info.pop('booking_count_deltas', None)
+
+# Query.update()/delete() skip mapper events and don't say which rows changed,
+# so caches fed from mapper events register a reset to run after such commits
+_bulk_change_callbacks: List[Tuple[Tuple[type, ...], Callable[[], None]]] = []
+
+def after_bulk_change(callback: Callable[[], None], *models: type):
+    """Run ``callback`` after commit whenever Query.update()/delete() touches one of ``models``"""
+    _bulk_change_callbacks.append((models, callback))
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _run_bulk_change_callbacks(update_context):
+    changed = update_context.mapper.class_
+    for models, callback in _bulk_change_callbacks:
+        if changed in models:
+            run_after_commit(update_context.session, callback)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
 
-def get_db():
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Routes depend on get_db; DB_ASYNC decides which kind of session they receive
+get_db = get_async_db if settings.DB_ASYNC else get_sync_db
+
+async def run_db(db: Union[Session, AsyncSession], fn: Callable[..., T], *args: Any) -> T:
+    """Run ``fn(session, *args)`` without blocking the event loop.
+
+    ``fn`` is written against the regular synchronous ORM API. On an AsyncSession
+    it runs through ``run_sync`` on the async driver; on a plain Session it is
+    moved to the threadpool.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
\ No newline at end of file
@@ -0,0 +1,440 @@
+import asyncio
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .background import BackgroundTask
+from .config import settings
+from .database import SessionLocal, PhotographerModel, run_after_commit
+from .message_bus import message_bus
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+Cell = Tuple[int, int]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def valid_coordinates(latitude, longitude) -> bool:
+    """Finite numbers within [-90, 90] and [-180, 180]"""
+    for value, limit in ((latitude, 90.0), (longitude, 180.0)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        if not math.isfinite(value) or abs(value) > limit:
+            return False
+    return True
+
+
+def grid_cell(latitude: float, longitude: float, cell_size_deg: float) -> Cell:
+    return (math.floor(latitude / cell_size_deg), math.floor(longitude / cell_size_deg))
+
+
+@dataclass
+class PhotographerProfile:
+    photographer_id: str
+    city: Optional[str] = None
+    specialties: FrozenSet[str] = frozenset()
+    hourly_rate: Optional[float] = None
+    rating: Optional[float] = None
+
+
+@dataclass
+class GeoEntry:
+    photographer_id: str
+    latitude: float
+    longitude: float
+    cell: Cell
+    updated_at: float = field(default_factory=time.monotonic)
+
+
+class GeoIndex:
+    """Grid-cell spatial index of the last known photographer positions.
+
+    The world is cut into square cells of ``cell_size_deg`` degrees; each cell
+    keeps the set of photographers currently inside it, so a radius or
+    nearest-neighbour query only looks at the cells around the search point
+    instead of every photographer. Positions older than ``max_age_seconds``
+    are pruned in the background once the index is started.
+    """
+
+    def __init__(self, cell_size_deg: float = 0.05, max_age_seconds: Optional[float] = None,
+                 max_rings: int = 100):
+        self.cell_size_deg = cell_size_deg
+        self.max_age_seconds = max_age_seconds
+        self.max_rings = max_rings
+        self._cells: Dict[Cell, Set[str]] = {}
+        self._entries: Dict[str, GeoEntry] = {}
+        self._profiles: Dict[str, PhotographerProfile] = {}
+        self._by_city: Dict[str, Set[str]] = {}
+        # Occupied cells per grid row and column, for the bounds nearest() searches within
+        self._row_cells: Dict[int, int] = {}
+        self._col_cells: Dict[int, int] = {}
+        self._bounds: Optional[Tuple[int, int, int, int]] = None  # None: recompute on next use
+        self._lock = threading.RLock()
+        self._worker = BackgroundTask(self._run)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def cell_for(self, latitude: float, longitude: float) -> Cell:
+        return grid_cell(latitude, longitude, self.cell_size_deg)
+
+    # Writes
+
+    def update_location(self, photographer_id, latitude: float, longitude: float):
+        photographer_id = str(photographer_id)
+        cell = self.cell_for(latitude, longitude)
+        with self._lock:
+            entry = self._entries.get(photographer_id)
+            if entry is None:
+                self._entries[photographer_id] = GeoEntry(photographer_id, latitude, longitude, cell)
+                self._add_to_cell(cell, photographer_id)
+                return
+            if entry.cell != cell:
+                self._discard_from_cell(entry.cell, photographer_id)
+                self._add_to_cell(cell, photographer_id)
+                entry.cell = cell
+            entry.latitude = latitude
+            entry.longitude = longitude
+            entry.updated_at = time.monotonic()
+
+    def remove_location(self, photographer_id):
+        photographer_id = str(photographer_id)
+        with self._lock:
+            entry = self._entries.pop(photographer_id, None)
+            if entry is not None:
+                self._discard_from_cell(entry.cell, photographer_id)
+
+    def update_profile(self, photographer_id, city: Optional[str] = None,
+                       specialties: Optional[Iterable[str]] = None,
+                       hourly_rate: Optional[float] = None, rating: Optional[float] = None):
+        photographer_id = str(photographer_id)
+        profile = PhotographerProfile(
+            photographer_id=photographer_id,
+            city=city,
+            specialties=frozenset(s.lower() for s in (specialties or [])),
+            hourly_rate=hourly_rate,
+            rating=rating,
+        )
+        with self._lock:
+            previous = self._profiles.get(photographer_id)
+            if previous is not None:
+                self._discard_from_city(previous.city, photographer_id)
+            self._profiles[photographer_id] = profile
+            if city:
+                self._by_city.setdefault(city.lower(), set()).add(photographer_id)
+
+    def remove_profile(self, photographer_id):
+        photographer_id = str(photographer_id)
+        with self._lock:
+            profile = self._profiles.pop(photographer_id, None)
+            if profile is not None:
+                self._discard_from_city(profile.city, photographer_id)
+            entry = self._entries.pop(photographer_id, None)
+            if entry is not None:
+                self._discard_from_cell(entry.cell, photographer_id)
+
+    def prune_stale(self, max_age_seconds: Optional[float] = None) -> int:
+        """Drop positions that have not been refreshed recently"""
+        max_age = max_age_seconds if max_age_seconds is not None else self.max_age_seconds
+        if max_age is None:
+            return 0
+        cutoff = time.monotonic() - max_age
+        with self._lock:
+            stale = [pid for pid, entry in self._entries.items() if entry.updated_at < cutoff]
+            for pid in stale:
+                entry = self._entries.pop(pid)
+                self._discard_from_cell(entry.cell, pid)
+        return len(stale)
+
+    async def start(self):
+        if self.max_age_seconds is not None:
+            self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+
+    async def _run(self):
+        while True:
+            await self._worker.sleep(self.max_age_seconds / 2)
+            self.prune_stale()
+
+    def _discard_from_city(self, city: Optional[str], photographer_id: str):
+        members = self._by_city.get((city or "").lower())
+        if members is not None:
+            members.discard(photographer_id)
+            if not members:
+                del self._by_city[(city or "").lower()]
+
+    def _add_to_cell(self, cell: Cell, photographer_id: str):
+        members = self._cells.get(cell)
+        if members is None:
+            members = self._cells[cell] = set()
+            row, col = cell
+            self._row_cells[row] = self._row_cells.get(row, 0) + 1
+            self._col_cells[col] = self._col_cells.get(col, 0) + 1
+            if self._bounds is not None:
+                min_row, max_row, min_col, max_col = self._bounds
+                self._bounds = (min(min_row, row), max(max_row, row), min(min_col, col), max(max_col, col))
+        members.add(photographer_id)
+
+    def _discard_from_cell(self, cell: Cell, photographer_id: str):
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(photographer_id)
+            if not members:
+                del self._cells[cell]
+                row, col = cell
+                row_emptied = self._release(self._row_cells, row)
+                col_emptied = self._release(self._col_cells, col)
+                # Only emptying an outermost row or column moves the bounds
+                if self._bounds is not None and ((row_emptied and row in self._bounds[:2])
+                                                 or (col_emptied and col in self._bounds[2:])):
+                    self._bounds = None
+
+    @staticmethod
+    def _release(counts: Dict[int, int], key: int) -> bool:
+        """Drop one cell from a row or column count; True if none are left"""
+        left = counts[key] - 1
+        if left:
+            counts[key] = left
+            return False
+        del counts[key]
+        return True
+
+    # Reads
+
+    def profiles_in_city(self, city: str) -> List[PhotographerProfile]:
+        with self._lock:
+            return [self._profiles[pid] for pid in self._by_city.get(city.lower(), ())]
+
+    def query_radius(self, latitude: float, longitude: float, radius_km: float,
+                     limit: Optional[int] = None, **filters) -> List[dict]:
+        """Photographers within ``radius_km``, closest first"""
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        widest_lat = min(abs(latitude) + lat_span, 89.9)
+        lon_span = radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(widest_lat)))
+        min_cell = self.cell_for(latitude - lat_span, longitude - lon_span)
+        max_cell = self.cell_for(latitude + lat_span, longitude + lon_span)
+        matches = []
+        with self._lock:
+            cell_count = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+            if cell_count > len(self._cells):
+                candidates = self._entries.values()
+            else:
+                candidates = self._entries_in_box(min_cell, max_cell)
+            for entry in candidates:
+                if not self._matches(entry, filters):
+                    continue
+                distance = haversine_km(latitude, longitude, entry.latitude, entry.longitude)
+                if distance <= radius_km:
+                    matches.append((distance, entry))
+            matches.sort(key=lambda item: item[0])
+            if limit is not None:
+                matches = matches[:limit]
+            return [self._to_dict(entry, distance) for distance, entry in matches]
+
+    def nearest(self, latitude: float, longitude: float, k: int,
+                max_distance_km: Optional[float] = None, **filters) -> List[dict]:
+        """The ``k`` closest photographers, searching outwards ring by ring"""
+        if k <= 0:
+            return []
+        center = self.cell_for(latitude, longitude)
+        found: List[Tuple[float, GeoEntry]] = []
+        with self._lock:
+            if not self._cells:
+                return []
+            max_ring = self._max_ring(center)
+            if max_distance_km is not None:
+                reach = self._cell_width_km(latitude, max_distance_km / KM_PER_DEGREE_LAT)
+                max_ring = min(max_ring, int(math.ceil(max_distance_km / reach)) + 1)
+            ring = 0
+            while ring <= max_ring:
+                # Past this point the rings hold more cells than are occupied,
+                # mostly empty ones; scanning the occupied cells is cheaper
+                if ring > self.max_rings or (2 * ring + 1) ** 2 > len(self._cells):
+                    found = self._scan(latitude, longitude, max_distance_km, filters)
+                    break
+                for cell in self._ring_cells(center, ring):
+                    for pid in self._cells.get(cell, ()):
+                        entry = self._entries[pid]
+                        if not self._matches(entry, filters):
+                            continue
+                        distance = haversine_km(latitude, longitude, entry.latitude, entry.longitude)
+                        if max_distance_km is None or distance <= max_distance_km:
+                            found.append((distance, entry))
+                if len(found) >= k:
+                    found.sort(key=lambda item: item[0])
+                    # Everything closer than ring * cell width has been visited.
+                    covered_km = ring * self._cell_width_km(latitude, (ring + 1) * self.cell_size_deg)
+                    if found[k - 1][0] <= covered_km:
+                        break
+                ring += 1
+            found.sort(key=lambda item: item[0])
+            return [self._to_dict(entry, distance) for distance, entry in found[:k]]
+
+    def _scan(self, latitude: float, longitude: float, max_distance_km: Optional[float],
+              filters: dict) -> List[Tuple[float, GeoEntry]]:
+        found = []
+        for members in self._cells.values():
+            for pid in members:
+                entry = self._entries[pid]
+                if not self._matches(entry, filters):
+                    continue
+                distance = haversine_km(latitude, longitude, entry.latitude, entry.longitude)
+                if max_distance_km is None or distance <= max_distance_km:
+                    found.append((distance, entry))
+        return found
+
+    def _cell_width_km(self, latitude: float, lat_offset_deg: float) -> float:
+        """Narrowest cell edge in km within ``lat_offset_deg`` of ``latitude``"""
+        widest_lat = min(abs(latitude) + lat_offset_deg, 89.9)
+        return self.cell_size_deg * KM_PER_DEGREE_LAT * math.cos(math.radians(widest_lat))
+
+    def _entries_in_box(self, min_cell: Cell, max_cell: Cell):
+        for row in range(min_cell[0], max_cell[0] + 1):
+            for col in range(min_cell[1], max_cell[1] + 1):
+                for pid in self._cells.get((row, col), ()):
+                    yield self._entries[pid]
+
+    def _max_ring(self, center: Cell) -> int:
+        if self._bounds is None:
+            # Recomputed from occupied rows and columns, far fewer than cells
+            self._bounds = (min(self._row_cells), max(self._row_cells),
+                            min(self._col_cells), max(self._col_cells))
+        min_row, max_row, min_col, max_col = self._bounds
+        return max(abs(center[0] - min_row), abs(center[0] - max_row),
+                   abs(center[1] - min_col), abs(center[1] - max_col))
+
+    @staticmethod
+    def _ring_cells(center: Cell, ring: int):
+        row, col = center
+        if ring == 0:
+            yield center
+            return
+        for dc in range(-ring, ring + 1):
+            yield (row - ring, col + dc)
+            yield (row + ring, col + dc)
+        for dr in range(-ring + 1, ring):
+            yield (row + dr, col - ring)
+            yield (row + dr, col + ring)
+
+    def _matches(self, entry: GeoEntry, filters: dict) -> bool:
+        if self.max_age_seconds is not None and time.monotonic() - entry.updated_at > self.max_age_seconds:
+            return False
+        city = filters.get("city")
+        specialties = filters.get("specialties")
+        max_hourly_rate = filters.get("max_hourly_rate")
+        if city is None and not specialties and max_hourly_rate is None:
+            return True
+        profile = self._profiles.get(entry.photographer_id)
+        if profile is None:
+            return False
+        if city is not None and (profile.city or "").lower() != city.lower():
+            return False
+        if specialties and not profile.specialties.issuperset(s.lower() for s in specialties):
+            return False
+        if max_hourly_rate is not None and (profile.hourly_rate is None or profile.hourly_rate > max_hourly_rate):
+            return False
+        return True
+
+    def _to_dict(self, entry: GeoEntry, distance: float) -> dict:
+        profile = self._profiles.get(entry.photographer_id)
+        return {
+            "user_id": entry.photographer_id,
+            "city": profile.city if profile else None,
+            "specialties": sorted(profile.specialties) if profile else [],
+            "hourly_rate": profile.hourly_rate if profile else None,
+            "rating": profile.rating if profile else None,
+            "current_location": {"latitude": entry.latitude, "longitude": entry.longitude},
+            "distance_km": round(distance, 3),
+        }
+
+
+def load_from_db(index: GeoIndex, db: Session, keep_positions: bool = False) -> int:
+    """Seed profiles and last stored positions from the photographers table.
+
+    With ``keep_positions``, photographers already placed keep their position,
+    which is newer than the stored one while location writes are buffered.
+    """
+    rows = db.query(
+        PhotographerModel.user_id,
+        PhotographerModel.city,
+        PhotographerModel.specialties,
+        PhotographerModel.hourly_rate,
+        PhotographerModel.rating,
+        PhotographerModel.current_location,
+    ).filter(PhotographerModel.deleted_at.is_(None)).yield_per(1000)
+    count = 0
+    for user_id, city, specialties, hourly_rate, rating, location in rows:
+        index.update_profile(user_id, city=city, specialties=specialties,
+                             hourly_rate=hourly_rate, rating=rating)
+        placed = keep_positions and str(user_id) in index._entries
+        if not placed and location and location.get("latitude") is not None and location.get("longitude") is not None:
+            index.update_location(user_id, location["latitude"], location["longitude"])
+        count += 1
+    return count
+
+
+geo_index = GeoIndex(
+    cell_size_deg=settings.GEO_INDEX_CELL_SIZE_DEG,
+    max_age_seconds=settings.LOCATION_MAX_AGE_SECONDS,
+    max_rings=settings.GEO_INDEX_MAX_RINGS,
+)
+
+
+@event.listens_for(PhotographerModel, 'after_insert')
+@event.listens_for(PhotographerModel, 'after_update')
+def _sync_photographer_profile(mapper, connection, target):
+    user_id = target.user_id
+    if target.deleted_at is not None:
+        run_after_commit(target, lambda: geo_index.remove_profile(user_id))
+        return
+    profile = dict(
+        city=target.city,
+        specialties=list(target.specialties or []),
+        hourly_rate=target.hourly_rate,
+        rating=target.rating,
+    )
+    run_after_commit(target, lambda: geo_index.update_profile(user_id, **profile))
+
+
+@event.listens_for(PhotographerModel, 'after_delete')
+def _drop_photographer_profile(mapper, connection, target):
+    user_id = target.user_id
+    run_after_commit(target, lambda: geo_index.remove_profile(user_id))
+
+
+def _apply_remote_location(update, origin):
+    geo_index.update_location(update['photographer_id'], update['latitude'], update['longitude'])
+
+# Positions reported to other workers
+message_bus.subscribe('location', _apply_remote_location)
+
+
+def _reload_from_db():
+    db = SessionLocal()
+    try:
+        return load_from_db(geo_index, db, keep_positions=True)
+    finally:
+        db.close()
+
+
+async def _bulk_imported(table_name, origin):
+    # bulk_io writes photographers through Core in its own process
+    if table_name == PhotographerModel.__tablename__:
+        await asyncio.get_event_loop().run_in_executor(None, _reload_from_db)
+
+message_bus.subscribe('bulk_import', _bulk_imported)
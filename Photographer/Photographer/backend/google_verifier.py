@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+import aiohttp
+from google.auth import jwt as google_jwt
+from .background import BackgroundTask
+from .config import settings
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+class CertificateFetchError(Exception):
+    """Google's signing certificates could not be downloaded"""
+
+
+class GoogleCertificateCache:
+    """Google's ID token signing certificates, cached for as long as Google allows.
+
+    The certificate endpoint's ``Cache-Control: max-age`` (minus ``Age``) decides
+    when the keys expire. A background task refreshes them ``refresh_margin``
+    seconds before that, so requests normally never wait on the network.
+    Tokens naming an unknown key id fetch again at most once per
+    ``unknown_key_interval``, so they can't make every request hit Google.
+    """
+
+    def __init__(self, certs_url: str, refresh_margin: float = 300.0,
+                 default_ttl: float = 3600.0, retry_delay: float = 30.0, unknown_key_interval: float = 60.0):
+        self.certs_url = certs_url
+        self.refresh_margin = refresh_margin
+        self.default_ttl = default_ttl
+        self.retry_delay = retry_delay
+        self.unknown_key_interval = unknown_key_interval
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._fetch_started_at: Optional[float] = None
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+        self._worker = BackgroundTask(self._run)
+
+        self.fetches = 0
+        self.fetch_failures = 0
+        self.unknown_key_refreshes_skipped = 0
+
+    async def get_certs(self) -> Dict[str, str]:
+        if not self._certs or time.monotonic() >= self._expires_at:
+            try:
+                await self.refresh()
+            except CertificateFetchError:
+                if not self._certs:
+                    raise
+                # Keys overlap across rotations, so expired ones beat failing every login
+                logger.warning("Using expired Google certificates, refresh failed")
+        return self._certs
+
+    async def refresh(self, force: bool = False):
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            # Another request may have refreshed while we waited for the lock
+            if not force and self._certs and time.monotonic() < self._expires_at:
+                return
+            await self._fetch()
+
+    async def refresh_for_unknown_key(self, seen: Dict[str, str]) -> bool:
+        """Fetch again because a token's key id is missing from ``seen``.
+
+        False if the certificates are unchanged since ``seen`` and the last
+        fetch started less than ``unknown_key_interval`` ago.
+        """
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if self._certs is not seen:
+                return True
+            if self._fetch_started_at is not None \
+                    and time.monotonic() - self._fetch_started_at < self.unknown_key_interval:
+                self.unknown_key_refreshes_skipped += 1
+                return False
+            await self._fetch()
+        return True
+
+    async def _fetch(self):
+        """Download the certificates; call with the refresh lock held"""
+        self._fetch_started_at = time.monotonic()
+        if self._http is None:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        try:
+            async with self._http.get(self.certs_url) as response:
+                response.raise_for_status()
+                certs = await response.json(content_type=None)
+                ttl = self._ttl_from_headers(response.headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.fetch_failures += 1
+            raise CertificateFetchError(str(e)) from e
+        self.fetches += 1
+        self._certs = certs
+        self._expires_at = time.monotonic() + ttl
+
+    def _ttl_from_headers(self, headers) -> float:
+        match = _MAX_AGE_RE.search(headers.get('Cache-Control', ''))
+        if match is None:
+            return self.default_ttl
+        age = headers.get('Age', '0')
+        return max(int(match.group(1)) - (int(age) if age.isdigit() else 0), 0)
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh(force=True)
+                delay = max(self._expires_at - time.monotonic() - self.refresh_margin, self.retry_delay)
+            except Exception:
+                logger.exception("Failed to refresh Google signing certificates")
+                delay = self.retry_delay
+            await asyncio.sleep(delay)
+
+
+class GoogleTokenVerifier:
+    """Verifies Google ID tokens locally against the cached certificates"""
+
+    def __init__(self, certificates: GoogleCertificateCache, client_id: str, latency_window: int = 1000):
+        self.certificates = certificates
+        self.client_id = client_id
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self.verified = 0
+        self.rejected = 0
+
+    async def verify(self, token: str) -> dict:
+        """Return the token's claims, or raise ValueError if it is not valid"""
+        started = time.perf_counter()
+        try:
+            certs = await self.certificates.get_certs()
+            try:
+                idinfo = google_jwt.decode(token, certs=certs, audience=self.client_id)
+            except ValueError as e:
+                # Google rotated its keys before our cached copy expired
+                if 'Certificate for key id' not in str(e) or not await self.certificates.refresh_for_unknown_key(certs):
+                    raise
+                certs = await self.certificates.get_certs()
+                idinfo = google_jwt.decode(token, certs=certs, audience=self.client_id)
+            if idinfo.get('iss') not in GOOGLE_ISSUERS:
+                raise ValueError('Invalid issuer')
+        except ValueError:
+            self.rejected += 1
+            raise
+        finally:
+            self._latencies.append(time.perf_counter() - started)
+        self.verified += 1
+        return idinfo
+
+    def metrics(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000
+
+        return {
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "certificate_fetches": self.certificates.fetches,
+            "certificate_fetch_failures": self.certificates.fetch_failures,
+            "unknown_key_refreshes_skipped": self.certificates.unknown_key_refreshes_skipped,
+            "latency_ms_p50": percentile(0.50),
+            "latency_ms_p95": percentile(0.95),
+            "latency_ms_max": latencies[-1] * 1000 if latencies else 0.0,
+        }
+
+
+google_certificates = GoogleCertificateCache(
+    settings.GOOGLE_CERTS_URL,
+    unknown_key_interval=settings.GOOGLE_CERTS_UNKNOWN_KEY_INTERVAL,
+)
+google_token_verifier = GoogleTokenVerifier(google_certificates, settings.GOOGLE_CLIENT_ID)
+metrics_registry.register("google_verifier", google_token_verifier.metrics)
@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import threading
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from .background import BackgroundTask
+from .config import settings
+from .database import (
+    SessionLocal, UserModel, PhotographerModel, run_after_commit, previous_value, booking_count_listeners, after_bulk_change,
+)
+from .message_bus import message_bus
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Sorts best first: highest rating, then most completed bookings, then lowest id
+RankKey = Tuple[float, int, int]
+
+
+@dataclass
+class LeaderboardEntry:
+    user_id: int
+    full_name: Optional[str]
+    city: Optional[str]
+    rating: Optional[float]
+    total_bookings: int = 0
+
+    @property
+    def key(self) -> RankKey:
+        return (-self.rating, -self.total_bookings, self.user_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "user_id": str(self.user_id),
+            "full_name": self.full_name,
+            "city": self.city,
+            "rating": self.rating,
+            "total_bookings": self.total_bookings,
+        }
+
+
+def _city_key(city: Optional[str]) -> str:
+    return (city or "").strip().lower()
+
+
+class Leaderboard:
+    """Rated photographers in rank order, globally and per city.
+
+    Each ranking is a sorted list of rank keys, so the top N is a slice and a
+    change in rating, bookings or city is one removal and one insertion. Every
+    rated photographer stays ranked (not only the top K), so one dropping out
+    of the top never needs a trip to the database to find its replacement.
+    Changes apply as they commit, and other workers' changes arrive over the
+    message bus. A periodic rebuild from the database catches writes made
+    outside the ORM; changes made while it loads are replayed onto its result.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 rebuild_interval: float = 3600.0):
+        self.session_factory = session_factory
+        self.rebuild_interval = rebuild_interval
+        self._entries: Dict[int, LeaderboardEntry] = {}
+        self._global: List[RankKey] = []
+        self._by_city: Dict[str, List[RankKey]] = {}
+        # Updates come from after-commit hooks, which may run on executor threads
+        self._lock = threading.Lock()
+        # Changes made while a rebuild is loading, to replay onto its result
+        self._journal: Optional[List[Tuple[Callable, tuple]]] = None
+        self._worker = BackgroundTask(self._run)
+
+        self.reads = 0
+        self.updates = 0
+        self.rebuilds = 0
+        self.replayed_changes = 0
+
+    def __len__(self) -> int:
+        return len(self._global)
+
+    # Writes
+
+    def _rank(self, entry: LeaderboardEntry):
+        if entry.rating is not None:
+            insort(self._global, entry.key)
+            insort(self._by_city.setdefault(_city_key(entry.city), []), entry.key)
+
+    def _unrank(self, entry: LeaderboardEntry):
+        if entry.rating is None:
+            return
+        key, city = entry.key, _city_key(entry.city)
+        in_city = self._by_city.get(city)
+        for ranking in (self._global, in_city):
+            if ranking is not None:
+                i = bisect_left(ranking, key)
+                if i < len(ranking) and ranking[i] == key:
+                    del ranking[i]
+        if in_city is not None and not in_city:
+            del self._by_city[city]
+
+    def update(self, user_id: int, **fields):
+        """Set ``full_name``, ``city``, ``rating`` or ``total_bookings``, adding the photographer if new"""
+        self._change(self._update, user_id, fields)
+
+    def rename(self, user_id: int, full_name: str):
+        """Names are not part of the rank, and users who aren't photographers are ignored"""
+        self._change(self._rename, user_id, full_name)
+
+    def add_bookings(self, deltas: Dict[int, int]):
+        self._change(self._add_bookings, deltas)
+
+    def remove(self, user_id: int):
+        self._change(self._remove, user_id)
+
+    def _change(self, apply: Callable, *args):
+        with self._lock:
+            apply(*args)
+            if self._journal is not None:
+                self._journal.append((apply, args))
+
+    def _update(self, user_id: int, fields: dict):
+        self.updates += 1
+        entry = self._entries.get(user_id)
+        if entry is None:
+            entry = self._entries[user_id] = LeaderboardEntry(
+                user_id, fields.get("full_name"), fields.get("city"), fields.get("rating"),
+                fields.get("total_bookings") or 0)
+            self._rank(entry)
+            return
+        self._unrank(entry)
+        for name, value in fields.items():
+            setattr(entry, name, value)
+        self._rank(entry)
+
+    def _rename(self, user_id: int, full_name: str):
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry.full_name = full_name
+
+    def _add_bookings(self, deltas: Dict[int, int]):
+        for user_id, delta in deltas.items():
+            entry = self._entries.get(user_id)
+            if entry is None:
+                continue
+            self.updates += 1
+            self._unrank(entry)
+            entry.total_bookings += delta
+            self._rank(entry)
+
+    def _remove(self, user_id: int):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._unrank(entry)
+
+    # Reads
+
+    def top(self, limit: int = 10, city: Optional[str] = None) -> List[dict]:
+        """The ``limit`` best rated photographers, in ``city`` if given"""
+        with self._lock:
+            self.reads += 1
+            ranking = self._global if city is None else self._by_city.get(_city_key(city), ())
+            return [self._entries[user_id].to_dict() for _, _, user_id in ranking[:limit]]
+
+    # Backfill
+
+    def _load(self) -> Dict[int, LeaderboardEntry]:
+        db = self.session_factory()
+        try:
+            rows = db.query(
+                PhotographerModel.user_id, UserModel.full_name, PhotographerModel.city,
+                PhotographerModel.rating, PhotographerModel.total_bookings,
+            ).join(UserModel, UserModel.id == PhotographerModel.user_id) \
+                .filter(PhotographerModel.deleted_at.is_(None)).yield_per(5000)
+            return {row[0]: LeaderboardEntry(*row[:4], row[4] or 0) for row in rows}
+        finally:
+            db.close()
+
+    async def rebuild(self):
+        """Reload every photographer.
+
+        Booking counts added after the query saw their commit are counted
+        twice until the next rebuild; the window is the moment before the
+        query starts. Other changes set absolute values and replay safely.
+        """
+        with self._lock:
+            self._journal = []
+        loop = asyncio.get_event_loop()
+        try:
+            entries = await loop.run_in_executor(None, self._load)
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        ranked = sorted(entry.key for entry in entries.values() if entry.rating is not None)
+        by_city: Dict[str, List[RankKey]] = {}
+        for key in ranked:
+            by_city.setdefault(_city_key(entries[key[2]].city), []).append(key)
+        with self._lock:
+            self._entries, self._global, self._by_city = entries, ranked, by_city
+            for apply, args in self._journal:
+                apply(*args)
+            self.replayed_changes += len(self._journal)
+            self._journal = None
+            self.rebuilds += 1
+
+    def request_rebuild(self):
+        self._worker.wake()
+
+    async def start(self):
+        if not self._worker.running:
+            # Loaded before the first request, unlike the periodic rebuilds
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("Loading the photographer leaderboard failed")
+            self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+
+    async def _run(self):
+        delay = self.rebuild_interval if self.rebuilds else 5.0
+        while True:
+            await self._worker.sleep(delay)
+            delay = self.rebuild_interval
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("Photographer leaderboard rebuild failed")
+
+    def metrics(self) -> dict:
+        return {
+            "photographers": len(self._entries),
+            "ranked": len(self._global),
+            "cities": len(self._by_city),
+            "reads": self.reads,
+            "updates": self.updates,
+            "rebuilds": self.rebuilds,
+            "replayed_changes": self.replayed_changes,
+        }
+
+
+leaderboard = Leaderboard(rebuild_interval=settings.LEADERBOARD_REBUILD_INTERVAL)
+metrics_registry.register("leaderboard", leaderboard.metrics)
+
+
+def _apply(change: dict):
+    if "bookings" in change:
+        leaderboard.add_bookings({int(user_id): delta for user_id, delta in change["bookings"].items()})
+    elif "removed" in change:
+        leaderboard.remove(change["removed"])
+    elif "renamed" in change:
+        leaderboard.rename(change["renamed"], change["full_name"])
+    else:
+        leaderboard.update(change.pop("user_id"), **change)
+
+
+def _publish(change: dict):
+    """Apply here and on every other worker, after commit"""
+    def apply():
+        message_bus.publish('leaderboard', dict(change))
+        _apply(dict(change))
+    return apply
+
+
+@event.listens_for(PhotographerModel, 'after_insert')
+def _photographer_inserted(mapper, connection, target):
+    if target.deleted_at is None:
+        users = UserModel.__table__
+        full_name = connection.execute(select(users.c.full_name).where(users.c.id == target.user_id)).scalar()
+        run_after_commit(target, _publish({
+            "user_id": target.user_id, "full_name": full_name, "city": target.city,
+            "rating": target.rating, "total_bookings": target.total_bookings or 0,
+        }))
+
+
+@event.listens_for(PhotographerModel, 'after_update')
+def _photographer_updated(mapper, connection, target):
+    ranked = ('user_id', 'city', 'rating', 'deleted_at')
+    if all(previous_value(target, name) == getattr(target, name) for name in ranked):
+        return
+    previous_user_id = previous_value(target, 'user_id')
+    if target.deleted_at is not None or previous_user_id != target.user_id:
+        run_after_commit(target, _publish({"removed": previous_user_id}))
+        if target.deleted_at is not None:
+            return
+    # total_bookings is kept out: counts change through Core UPDATEs the instance doesn't see
+    run_after_commit(target, _publish({"user_id": target.user_id, "city": target.city, "rating": target.rating}))
+    if previous_value(target, 'deleted_at') is not None or previous_user_id != target.user_id:
+        # Restored or moved: the name and count aren't known here
+        run_after_commit(target, leaderboard.request_rebuild)
+
+
+@event.listens_for(PhotographerModel, 'after_delete')
+def _photographer_deleted(mapper, connection, target):
+    run_after_commit(target, _publish({"removed": previous_value(target, 'user_id')}))
+
+
+@event.listens_for(UserModel, 'after_update')
+def _user_updated(mapper, connection, target):
+    if previous_value(target, 'full_name') != target.full_name:
+        run_after_commit(target, _publish({"renamed": target.id, "full_name": target.full_name}))
+
+
+def _booking_counts_changed(deltas: Dict[int, int]):
+    _publish({"bookings": deltas})()
+
+booking_count_listeners.append(_booking_counts_changed)
+
+
+after_bulk_change(leaderboard.request_rebuild, UserModel, PhotographerModel)
+
+
+def _remote_change(change, origin):
+    _apply(change)
+
+message_bus.subscribe('leaderboard', _remote_change)
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import bindparam
+from sqlalchemy.orm import Session
+from .background import BackgroundTask
+from .config import settings
+from .database import SessionLocal, PhotographerModel
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+photographers_table = PhotographerModel.__table__
+
+# One statement, executed with a list of parameter sets (executemany)
+_bulk_location_update = (
+    photographers_table.update()
+    .where(photographers_table.c.user_id == bindparam("b_user_id"))
+    .values(current_location=bindparam("b_location"))
+)
+
+
+class LocationWriteBuffer:
+    """Write-behind buffer for photographer locations.
+
+    Only the newest position per photographer is kept between flushes, and each
+    flush writes all of them with a single batched UPDATE. A flush happens every
+    ``flush_interval`` seconds, as soon as ``max_pending`` photographers are
+    waiting, and once more on shutdown. The UPDATE bypasses the ORM, so no
+    mapper events fire; ``listeners`` get the ids written by each flush instead.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 flush_interval: float = 5.0, max_pending: int = 1000):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # photographer_id -> (location payload, monotonic time first buffered)
+        self._pending: Dict[str, Tuple[dict, float]] = {}
+        # Created on first use so they bind to the running event loop
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._worker = BackgroundTask(self._run)
+        # Called with the photographer ids of each successful flush
+        self.listeners: List[Callable[[List[int]], None]] = []
+
+        self.updates_received = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_lag = 0.0
+        self.max_flush_lag = 0.0
+        self.last_flush_duration = 0.0
+
+    def add(self, photographer_id, latitude: float, longitude: float, timestamp: Optional[str] = None):
+        photographer_id = str(photographer_id)
+        location = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "timestamp": timestamp or datetime.utcnow().isoformat(),
+        }
+        previous = self._pending.get(photographer_id)
+        first_seen = previous[1] if previous else time.monotonic()
+        self._pending[photographer_id] = (location, first_seen)
+        self.updates_received += 1
+        if len(self._pending) >= self.max_pending:
+            self._worker.wake()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._worker.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> int:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            started = time.monotonic()
+            lag = started - min(first_seen for _, first_seen in batch.values())
+            loop = asyncio.get_event_loop()
+            try:
+                written = await loop.run_in_executor(None, self._write, batch)
+            except Exception:
+                self.failed_flushes += 1
+                logger.exception("Failed to flush %d buffered locations", len(batch))
+                # Put the batch back unless a newer position arrived meanwhile
+                for photographer_id, item in batch.items():
+                    self._pending.setdefault(photographer_id, item)
+                return 0
+            self.flushes += 1
+            self.rows_written += len(written)
+            self.last_flush_lag = lag
+            self.max_flush_lag = max(self.max_flush_lag, lag)
+            self.last_flush_duration = time.monotonic() - started
+            self._notify(written)
+            return len(written)
+
+    def _notify(self, photographer_ids: List[int]):
+        for listener in self.listeners:
+            try:
+                listener(photographer_ids)
+            except Exception:
+                logger.exception("Location flush listener failed")
+
+    def _write(self, batch: Dict[str, Tuple[dict, float]]) -> List[int]:
+        params: List[dict] = []
+        for photographer_id, (location, _) in batch.items():
+            try:
+                params.append({"b_user_id": int(photographer_id), "b_location": location})
+            except ValueError:
+                continue
+        if not params:
+            return []
+        db = self.session_factory()
+        try:
+            db.execute(_bulk_location_update, params)
+            db.commit()
+        finally:
+            db.close()
+        return [param["b_user_id"] for param in params]
+
+    def metrics(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "updates_received": self.updates_received,
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "coalescing_ratio": self.updates_received / self.rows_written if self.rows_written else 0.0,
+            "last_flush_lag_seconds": self.last_flush_lag,
+            "max_flush_lag_seconds": self.max_flush_lag,
+            "last_flush_duration_seconds": self.last_flush_duration,
+        }
+
+
+location_buffer = LocationWriteBuffer(
+    flush_interval=settings.LOCATION_FLUSH_INTERVAL,
+    max_pending=settings.LOCATION_FLUSH_MAX_PENDING,
+)
+metrics_registry.register("location_buffer", location_buffer.metrics)
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+from .background import BackgroundTask
+from .config import settings
+from .geo_index import Cell, grid_cell
+
+logger = logging.getLogger(__name__)
+
+Emit = Callable[[str, dict, str], Awaitable[None]]
+
+
+class LocationFanout:
+    """Routes photographer positions only to subscribers whose viewport covers them.
+
+    Subscribers register the grid cells they display. Each subscriber has its own
+    outbox keyed by photographer, so positions that arrive faster than the
+    subscriber's send interval overwrite each other and only the latest one is
+    emitted. A client that falls behind receives fewer, fresher updates instead
+    of a growing backlog.
+
+    Subscribers of the old global room still get one ``location_update``
+    event per position, in the shape that room used to send.
+
+    Each photographer's last cell is remembered so viewers of a cell they leave
+    see them go. It is forgotten when they go offline, or once no position has
+    arrived for ``max_age`` seconds.
+    """
+
+    def __init__(self, emit: Emit, cell_size_deg: float = 0.1,
+                 min_interval: float = 1.0, max_cells_per_subscriber: int = 400,
+                 tick: float = 0.1, max_age: Optional[float] = None):
+        self._emit = emit
+        self.cell_size_deg = cell_size_deg
+        self.min_interval = min_interval
+        self.max_cells_per_subscriber = max_cells_per_subscriber
+        self.tick = tick
+        self.max_age = max_age
+
+        self._cell_subscribers: Dict[Cell, Set[str]] = {}
+        self._subscriptions: Dict[str, Set[Cell]] = {}
+        self._global_subscribers: Set[str] = set()
+        self._intervals: Dict[str, float] = {}
+        # photographer -> (cell, monotonic time of the position)
+        self._last_cell: Dict[str, Tuple[Cell, float]] = {}
+        self._next_expiry = 0.0
+
+        self._outbox: Dict[str, Dict[str, dict]] = {}
+        self._last_sent: Dict[str, float] = {}
+        self._worker = BackgroundTask(self._run)
+
+        self.published = 0
+        self.queued = 0
+        self.coalesced = 0
+        self.emits = 0
+        self.updates_sent = 0
+
+    # Subscriptions
+
+    def subscribe_viewport(self, sid: str, min_lat: float, min_lon: float,
+                           max_lat: float, max_lon: float,
+                           max_updates_per_second: Optional[float] = None) -> int:
+        """Replace ``sid``'s subscription with the cells covering a bounding box"""
+        low = grid_cell(min(min_lat, max_lat), min(min_lon, max_lon), self.cell_size_deg)
+        high = grid_cell(max(min_lat, max_lat), max(min_lon, max_lon), self.cell_size_deg)
+        count = (high[0] - low[0] + 1) * (high[1] - low[1] + 1)
+        if count > self.max_cells_per_subscriber:
+            raise ValueError("Viewport too large, zoom in to receive live locations")
+        cells = [(row, col) for row in range(low[0], high[0] + 1) for col in range(low[1], high[1] + 1)]
+        self.subscribe_cells(sid, cells, max_updates_per_second)
+        return count
+
+    def subscribe_cells(self, sid: str, cells: Iterable[Cell],
+                        max_updates_per_second: Optional[float] = None):
+        self._drop_cells(sid)
+        cells = set(cells)
+        self._subscriptions[sid] = cells
+        for cell in cells:
+            self._cell_subscribers.setdefault(cell, set()).add(sid)
+        self._set_interval(sid, max_updates_per_second)
+
+    def subscribe_all(self, sid: str, max_updates_per_second: Optional[float] = None):
+        """Receive every position as ``location_update`` events, like the old global room"""
+        self._global_subscribers.add(sid)
+        self._set_interval(sid, max_updates_per_second)
+
+    def unsubscribe(self, sid: str):
+        self._drop_cells(sid)
+        self._global_subscribers.discard(sid)
+        self._intervals.pop(sid, None)
+        self._outbox.pop(sid, None)
+        self._last_sent.pop(sid, None)
+
+    def _set_interval(self, sid: str, max_updates_per_second: Optional[float]):
+        interval = self.min_interval
+        if max_updates_per_second:
+            # Clients may ask for fewer updates, never for more than the server allows
+            interval = max(interval, 1.0 / max_updates_per_second)
+        self._intervals[sid] = interval
+
+    def _drop_cells(self, sid: str):
+        for cell in self._subscriptions.pop(sid, ()):
+            members = self._cell_subscribers.get(cell)
+            if members is not None:
+                members.discard(sid)
+                if not members:
+                    del self._cell_subscribers[cell]
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._intervals)
+
+    # Publishing
+
+    def publish(self, update: dict):
+        """Queue a position for every subscriber covering its cell"""
+        photographer_id = str(update["photographer_id"])
+        cell = grid_cell(update["latitude"], update["longitude"], self.cell_size_deg)
+        previous_cell = self._last_cell.get(photographer_id, (None,))[0]
+        self._last_cell[photographer_id] = (cell, time.monotonic())
+        self.published += 1
+
+        targets = set(self._global_subscribers)
+        targets.update(self._cell_subscribers.get(cell, ()))
+        if previous_cell is not None and previous_cell != cell:
+            # Viewers of the old cell get one last position so the marker leaves
+            targets.update(self._cell_subscribers.get(previous_cell, ()))
+        for sid in targets:
+            outbox = self._outbox.setdefault(sid, {})
+            if photographer_id in outbox:
+                self.coalesced += 1
+            outbox[photographer_id] = update
+            self.queued += 1
+
+    def forget(self, photographer_id):
+        self._last_cell.pop(str(photographer_id), None)
+
+    def expire(self, max_age: float) -> int:
+        """Forget photographers with no position for ``max_age`` seconds"""
+        cutoff = time.monotonic() - max_age
+        stale = [pid for pid, (_, seen) in self._last_cell.items() if seen < cutoff]
+        for pid in stale:
+            del self._last_cell[pid]
+        return len(stale)
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.flush()
+                if self.max_age is not None and time.monotonic() >= self._next_expiry:
+                    self.expire(self.max_age)
+                    self._next_expiry = time.monotonic() + self.max_age / 2
+            except Exception:
+                logger.exception("Location fan-out flush failed")
+
+    async def flush(self):
+        now = time.monotonic()
+        ready = [
+            sid for sid in self._outbox
+            if now - self._last_sent.get(sid, 0.0) >= self._intervals.get(sid, self.min_interval)
+        ]
+        for sid in ready:
+            updates = self._outbox.pop(sid, None)
+            if not updates:
+                continue
+            self._last_sent[sid] = now
+            self.updates_sent += len(updates)
+            if sid in self._global_subscribers:
+                for update in updates.values():
+                    self.emits += 1
+                    await self._emit("location_update", update, sid)
+            else:
+                self.emits += 1
+                await self._emit("location_updates", {"updates": list(updates.values())}, sid)
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": self.subscriber_count,
+            "subscribed_cells": len(self._cell_subscribers),
+            "tracked_photographers": len(self._last_cell),
+            "published": self.published,
+            "queued": self.queued,
+            "coalesced": self.coalesced,
+            "emits": self.emits,
+            "updates_sent": self.updates_sent,
+        }
+
+
+def create_fanout(emit: Emit) -> LocationFanout:
+    return LocationFanout(
+        emit,
+        cell_size_deg=settings.LOCATION_FANOUT_CELL_SIZE_DEG,
+        min_interval=settings.LOCATION_FANOUT_MIN_INTERVAL,
+        max_cells_per_subscriber=settings.LOCATION_FANOUT_MAX_CELLS,
+        max_age=settings.LOCATION_MAX_AGE_SECONDS,
+    )
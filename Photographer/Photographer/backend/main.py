@@ -1,12 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, status, WebSocket
+from fastapi import FastAPI, Depends, HTTPException, status, WebSocket, Query, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.requests import ClientDisconnect
+
+try:
+    from fastapi.staticfiles import StaticFiles
+except ImportError:  # needs aiofiles; serve UPLOAD_DIRECTORY from the web server instead
+    StaticFiles = None
 from typing import Optional, List
-from datetime import datetime, timedelta
-from pydantic import BaseModel
+from datetime import datetime, timedelta, timezone
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from .config import settings
 from .dashboard import router as dashboard_router
-from .auth import get_current_admin_user
+from .chat import router as chat_router, chat_writer
+from .unread_counters import unread_counters
+from .database import get_db, run_db, engine, async_engine, SessionLocal, UserModel, PhotographerModel, BookingModel
+from .fast_json import FastJSONResponse, dumps as json_dumps
+from .geo_index import geo_index, load_from_db as load_geo_index, valid_coordinates
+from .location_buffer import location_buffer
+from .message_bus import message_bus
+from .auth import get_current_active_user, get_current_admin_user, authenticate_user, create_tokens, login_rate_limiter
+from .password_hashing import password_hasher
+from .google_verifier import google_certificates
+from .rate_limit import bucket_store
 from .realtime_dashboard import handle_dashboard_websocket, dashboard_manager
+from .system_metrics import system_metrics
+from .aggregates import dashboard_aggregates
+from .revenue_rollup import revenue_rollup
+from .availability import availability
+from .response_cache import response_cache, CachedResponse, make_etag
+from .uploads import portfolio_store, UploadTooLarge, UnsupportedImage
+from .request_metrics import request_metrics, RequestMetricsMiddleware
+from .leaderboard import leaderboard
+from .presence import presence
+from .realtime import publish_location
 
 app = FastAPI(title="PhotoHire API", description="Backend API for PhotoHire Photographer Booking App")
 
@@ -19,6 +47,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency and SQL counts, see /dashboard/metrics/requests
+if settings.REQUEST_METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware)
+    request_metrics.instrument(engine)
+    if async_engine is not None:
+        request_metrics.instrument(async_engine.sync_engine)
+
 # Models
 class User(BaseModel):
     email: str
@@ -45,11 +80,132 @@ class Booking(BaseModel):
     location: dict
     total_amount: float
 
+class BookingCreate(BaseModel):
+    photographer_id: int
+    booking_date: datetime
+    duration_hours: float = Field(..., gt=0)
+    location: dict
+    notes: Optional[str] = None
+
+# Columns behind each field a photographer response can select with
+# ?fields=; full_name comes from the users table
+PHOTOGRAPHER_FIELDS = {
+    "user_id": PhotographerModel.user_id,
+    "full_name": UserModel.full_name,
+    "portfolio_urls": PhotographerModel.portfolio_urls,
+    "specialties": PhotographerModel.specialties,
+    "hourly_rate": PhotographerModel.hourly_rate,
+    "city": PhotographerModel.city,
+    "current_location": PhotographerModel.current_location,
+    "rating": PhotographerModel.rating,
+    "total_bookings": PhotographerModel.total_bookings,
+}
+DEFAULT_PHOTOGRAPHER_FIELDS = (
+    "user_id", "portfolio_urls", "specialties", "hourly_rate", "city", "current_location", "rating",
+)
+
+def _photographer_fields(fields: Optional[str], extra=()) -> List[str]:
+    if fields is None:
+        return list(DEFAULT_PHOTOGRAPHER_FIELDS)
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in PHOTOGRAPHER_FIELDS and name not in extra]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown field(s) {', '.join(unknown)}" if unknown else "No fields selected",
+        )
+    return names
+
+def _photographer_query(db: Session, names: List[str]):
+    """Query selecting only the columns behind ``names``, one tuple per photographer"""
+    query = db.query(*[PHOTOGRAPHER_FIELDS[name] for name in names]).select_from(PhotographerModel)
+    if "full_name" in names:
+        query = query.join(UserModel, UserModel.id == PhotographerModel.user_id)
+    return query.filter(PhotographerModel.deleted_at.is_(None))
+
+def _photographer_row(names: List[str], row) -> dict:
+    photographer = dict(zip(names, row))
+    if "user_id" in photographer:
+        photographer["user_id"] = str(photographer["user_id"])
+    return photographer
+
+def _naive_utc(moment: datetime) -> datetime:
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+def _booking_to_dict(booking: BookingModel) -> dict:
+    return {
+        "id": booking.id,
+        "customer_id": booking.customer_id,
+        "photographer_id": booking.photographer_id,
+        "booking_date": booking.booking_date,
+        "duration_hours": booking.duration_hours,
+        "status": booking.status,
+        "location": booking.location,
+        "total_amount": booking.total_amount,
+        "notes": booking.notes,
+    }
+
+# Lifecycle
+@app.on_event("startup")
+async def load_in_memory_indexes():
+    def load(db: Session):
+        load_geo_index(geo_index, db)
+
+    db = SessionLocal()
+    try:
+        await run_db(db, load)
+    finally:
+        db.close()
+    await message_bus.start()
+    await geo_index.start()
+    await location_buffer.start()
+    await chat_writer.start()
+    await unread_counters.start()
+    await google_certificates.start()
+    await bucket_store.start()
+    await system_metrics.start()
+    await dashboard_aggregates.start()
+    await revenue_rollup.start()
+    await leaderboard.start()
+    # Follows the socket workers' online users for the dashboard
+    await presence.start()
+
+@app.on_event("shutdown")
+async def flush_write_buffers():
+    await geo_index.stop()
+    await location_buffer.stop()
+    await chat_writer.stop()
+    await unread_counters.stop()
+    password_hasher.shutdown()
+    portfolio_store.shutdown()
+    await google_certificates.stop()
+    await bucket_store.stop()
+    await system_metrics.stop()
+    await dashboard_aggregates.stop()
+    await revenue_rollup.stop()
+    await leaderboard.stop()
+    await presence.stop()
+    await message_bus.stop()
+
 # Routes
 @app.get("/")
 async def root():
     return {"message": "Welcome to PhotoHire API"}
 
+# Auth routes
+@app.post("/token", dependencies=[Depends(login_rate_limiter)])
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await authenticate_user(db, form_data.username, form_data.password)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return create_tokens({"sub": user.email, "is_admin": user.is_admin})
+
 # User routes
 @app.post("/users/", response_model=User)
 async def create_user(user: User):
@@ -57,37 +213,263 @@ async def create_user(user: User):
     return user
 
 # Photographer routes
-@app.get("/photographers/")
-async def get_photographers(city: Optional[str] = None):
-    # TODO: Implement photographer listing logic
-    return []
+@app.get("/photographers/", response_class=FastJSONResponse)
+async def get_photographers(
+    city: Optional[str] = None,
+    specialties: Optional[List[str]] = Query(None),
+    max_hourly_rate: Optional[float] = None,
+    latitude: Optional[float] = Query(None, ge=-90, le=90),
+    longitude: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(None, gt=0),
+    limit: int = Query(20, ge=1, le=100),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    db: Session = Depends(get_db),
+):
+    filters = dict(city=city, specialties=specialties, max_hourly_rate=max_hourly_rate)
+    if latitude is not None and longitude is not None:
+        # Location searches are answered from the in-memory index; radius_km
+        # bounds the search, otherwise the nearest `limit` photographers win.
+        if radius_km is not None:
+            results = geo_index.query_radius(latitude, longitude, radius_km, limit=limit, **filters)
+        else:
+            results = geo_index.nearest(latitude, longitude, limit, **filters)
+        if fields is None:
+            return FastJSONResponse(results)
+        names = _photographer_fields(fields, extra=("distance_km",))
+        if "full_name" in names and results:
+            def load_names(db: Session):
+                ids = [int(result["user_id"]) for result in results]
+                return dict(db.query(UserModel.id, UserModel.full_name).filter(UserModel.id.in_(ids)))
+            full_names = await run_db(db, load_names)
+            for result in results:
+                result["full_name"] = full_names.get(int(result["user_id"]))
+        return FastJSONResponse([{name: result.get(name) for name in names} for result in results])
+
+    names = _photographer_fields(fields)
+
+    def list_photographers(db: Session):
+        # Specialties are filtered here, so select them even if not returned
+        selected = names if not specialties or "specialties" in names else names + ["specialties"]
+        query = _photographer_query(db, selected)
+        if city is not None:
+            query = query.filter(PhotographerModel.city == city)
+        if max_hourly_rate is not None:
+            query = query.filter(PhotographerModel.hourly_rate <= max_hourly_rate)
+        query = query.order_by(PhotographerModel.rating.desc())
+        if not specialties:
+            return [_photographer_row(names, row) for row in query.limit(limit)]
+        wanted = {s.lower() for s in specialties}
+        position = selected.index("specialties")
+        photographers = []
+        for row in query.yield_per(500):
+            if wanted.issubset(s.lower() for s in (row[position] or [])):
+                photographers.append(_photographer_row(names, row))
+                if len(photographers) == limit:
+                    break
+        return photographers
+
+    return FastJSONResponse(await run_db(db, list_photographers))
+
+@app.get("/photographers/available")
+async def get_available_photographers(
+    city: str,
+    start: datetime,
+    end: datetime,
+    specialties: Optional[List[str]] = Query(None),
+    max_hourly_rate: Optional[float] = None,
+    limit: int = Query(50, ge=1, le=200),
+):
+    start, end = _naive_utc(start), _naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="end must be after start")
+    wanted = {s.lower() for s in specialties or []}
+    profiles = {
+        int(profile.photographer_id): profile
+        for profile in geo_index.profiles_in_city(city)
+        if profile.specialties.issuperset(wanted)
+        and (max_hourly_rate is None or (profile.hourly_rate is not None and profile.hourly_rate <= max_hourly_rate))
+    }
+    free = await availability.free(profiles, start, end)
+    free.sort(key=lambda pid: profiles[pid].rating or 0, reverse=True)
+    return [
+        {
+            "user_id": pid,
+            "city": profiles[pid].city,
+            "specialties": sorted(profiles[pid].specialties),
+            "hourly_rate": profiles[pid].hourly_rate,
+            "rating": profiles[pid].rating,
+        }
+        for pid in free[:limit]
+    ]
+
+@app.get("/photographers/top", response_class=FastJSONResponse)
+async def get_top_photographers(city: Optional[str] = None, limit: int = Query(10, ge=1, le=100)):
+    # Served from the in-memory leaderboard: best rating first, ties by completed bookings
+    return FastJSONResponse(leaderboard.top(limit, city=city))
+
+@app.get("/photographers/{photographer_id}", response_class=FastJSONResponse)
+async def get_photographer(
+    request: Request,
+    photographer_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    db: Session = Depends(get_db),
+):
+    names = _photographer_fields(fields)
+    key = ("photographer", photographer_id, ",".join(names))
+    cached = response_cache.get(key)
+    if cached is None:
+        version = response_cache.version
+
+        def fetch_photographer(db: Session):
+            # The versions of every row the response is built from
+            versions = [PhotographerModel.updated_at]
+            if "full_name" in names:
+                versions.append(UserModel.updated_at)
+            return _photographer_query(db, names).add_columns(*versions) \
+                .filter(PhotographerModel.user_id == photographer_id).first()
 
-@app.get("/photographers/{photographer_id}")
-async def get_photographer(photographer_id: str):
-    # TODO: Implement single photographer fetch logic
-    return {}
+        row = await run_db(db, fetch_photographer)
+        if row is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photographer not found")
+        body = json_dumps(_photographer_row(names, row[:len(names)]))
+        cached = CachedResponse(etag=make_etag(*key, tuple(row[len(names):])), body=body)
+        response_cache.put(key, cached, version)
+    return response_cache.respond(request, cached)
+
+def _add_portfolio_url(db: Session, user_id: int, url: str) -> Optional[List[str]]:
+    # Locked so concurrent uploads by the same photographer don't drop each other's URL
+    photographer = db.query(PhotographerModel).filter(
+        PhotographerModel.user_id == user_id,
+        PhotographerModel.deleted_at.is_(None),
+    ).with_for_update().first()
+    if photographer is None:
+        return None
+    if url not in (photographer.portfolio_urls or []):
+        photographer.portfolio_urls = [*(photographer.portfolio_urls or []), url]
+        db.commit()
+    return photographer.portfolio_urls
+
+@app.post("/photographers/me/portfolio", status_code=status.HTTP_201_CREATED)
+async def upload_portfolio_image(request: Request, db: Session = Depends(get_db),
+                                 current_user=Depends(get_current_active_user)):
+    """Add an image to the caller's portfolio; the body is the raw JPEG, PNG or WebP file"""
+    if current_user.user_type != "photographer":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only photographers have a portfolio")
+    too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                              detail=f"Uploads are limited to {portfolio_store.max_size} bytes")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > portfolio_store.max_size:
+        raise too_large
+    if portfolio_store.backlog_full():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many uploads in progress, please retry shortly",
+                            headers={"Retry-After": "5"})
+    try:
+        stored = await portfolio_store.save(request.stream())
+    except UploadTooLarge:
+        raise too_large
+    except UnsupportedImage as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+    except ClientDisconnect:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload interrupted")
+    portfolio_store.schedule_variants(stored)
+    urls = portfolio_store.urls(stored)
+    portfolio = await run_db(db, _add_portfolio_url, current_user.id, urls["url"])
+    if portfolio is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photographer profile not found")
+    return {**urls, "sha256": stored.digest, "size": stored.size, "duplicate": not stored.created,
+            "portfolio_urls": portfolio}
 
 # Booking routes
-@app.post("/bookings/")
-async def create_booking(booking: Booking):
-    # TODO: Implement booking creation logic
-    return booking
-
-@app.get("/bookings/{booking_id}")
-async def get_booking(booking_id: str):
-    # TODO: Implement booking fetch logic
-    return {}
-
-# Chat routes
-@app.post("/chat/send")
-async def send_message(sender_id: str, receiver_id: str, message: str):
-    # TODO: Implement chat message sending logic
-    return {"status": "sent"}
+def _insert_booking(db: Session, customer_id: int, booking: BookingCreate, booking_date: datetime) -> Optional[dict]:
+    # The row lock serializes bookings for one photographer across workers
+    photographer = db.query(PhotographerModel).filter(
+        PhotographerModel.user_id == booking.photographer_id,
+        PhotographerModel.deleted_at.is_(None),
+    ).with_for_update().first()
+    if photographer is None:
+        return None
+    end = booking_date + timedelta(hours=booking.duration_hours)
+    if availability.find_conflict(db, booking.photographer_id, booking_date, end) is not None:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="The photographer is already booked at that time")
+    row = BookingModel(
+        customer_id=customer_id,
+        photographer_id=booking.photographer_id,
+        booking_date=booking_date,
+        duration_hours=booking.duration_hours,
+        status='pending',
+        location=booking.location,
+        total_amount=round(photographer.hourly_rate * booking.duration_hours, 2),
+        notes=booking.notes,
+    )
+    db.add(row)
+    db.commit()
+    return _booking_to_dict(row)
+
+@app.post("/bookings/", status_code=status.HTTP_201_CREATED)
+async def create_booking(booking: BookingCreate, db: Session = Depends(get_db),
+                         current_user=Depends(get_current_active_user)):
+    if booking.duration_hours > settings.BOOKING_MAX_DURATION_HOURS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Bookings are limited to {settings.BOOKING_MAX_DURATION_HOURS:g} hours")
+    start = _naive_utc(booking.booking_date)
+    end = start + timedelta(hours=booking.duration_hours)
+    # Fast pre-check; _insert_booking repeats it against the database
+    await availability.ensure_loaded([booking.photographer_id])
+    if availability.conflict(booking.photographer_id, start, end) is not None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="The photographer is already booked at that time")
+    # Keeps this worker's concurrent requests for the slot off the database
+    hold = availability.hold(booking.photographer_id, start, end)
+    try:
+        created = await run_db(db, _insert_booking, current_user.id, booking, start)
+    finally:
+        availability.release(booking.photographer_id, hold)
+    if created is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photographer not found")
+    return created
+
+@app.get("/bookings/{booking_id}", response_class=FastJSONResponse)
+async def get_booking(request: Request, booking_id: int, db: Session = Depends(get_db),
+                      current_user=Depends(get_current_active_user)):
+    key = ("booking", booking_id, "")
+    cached = response_cache.get(key)
+    if cached is None:
+        version = response_cache.version
+
+        def fetch_booking(db: Session):
+            return db.query(BookingModel).filter(
+                BookingModel.id == booking_id,
+                BookingModel.deleted_at.is_(None),
+            ).first()
+
+        booking = await run_db(db, fetch_booking)
+        if booking is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
+        cached = CachedResponse(
+            etag=make_etag(*key, booking.updated_at),
+            body=json_dumps(_booking_to_dict(booking)),
+            viewers=frozenset((booking.customer_id, booking.photographer_id)),
+        )
+        response_cache.put(key, cached, version)
+    # Only the two parties (and admins) may see a booking
+    if not current_user.is_admin and current_user.id not in cached.viewers:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
+    return response_cache.respond(request, cached)
 
 # Location routes
 @app.post("/location/update")
-async def update_location(photographer_id: str, latitude: float, longitude: float):
-    # TODO: Implement location update logic
+async def update_location(photographer_id: str, latitude: float, longitude: float,
+                          current_user=Depends(get_current_active_user)):
+    if current_user.user_type != "photographer" or photographer_id != str(current_user.id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
+                            detail="Photographers can only update their own location")
+    if not valid_coordinates(latitude, longitude):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="latitude and longitude must be finite and in range")
+    publish_location(photographer_id, latitude, longitude)
     return {"status": "updated"}
 
 # WebSocket routes for dashboard
@@ -95,8 +477,13 @@ async def update_location(photographer_id: str, latitude: float, longitude: floa
 async def dashboard_websocket(websocket: WebSocket, client_type: str):
     await handle_dashboard_websocket(websocket, client_type)
 
-# Include dashboard routes
+# Include dashboard and chat routes
 app.include_router(dashboard_router)
+app.include_router(chat_router)
+
+if StaticFiles is not None:
+    app.mount(settings.UPLOAD_BASE_URL, StaticFiles(directory=settings.UPLOAD_DIRECTORY, check_dir=False),
+              name="uploads")
 
 if __name__ == "__main__":
     import uvicorn
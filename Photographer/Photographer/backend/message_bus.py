@@ -0,0 +1,204 @@
+import abc
+import asyncio
+import json
+import logging
+import uuid
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .background import BackgroundTask
+from .config import settings
+from .metrics_registry import metrics_registry
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # only needed for MESSAGE_BUS_BACKEND=redis
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Any, str], Any]
+
+
+class MessageBus(abc.ABC):
+    """Carries events between workers so each can deliver to its own sockets.
+
+    ``publish`` only queues the event; queued events go out as one batch every
+    ``flush_interval`` seconds or once ``batch_size`` are waiting. A worker never
+    receives its own events back, so callers handle local delivery themselves
+    and publish for everyone else. Handlers are called with the payload and the
+    id of the worker that sent it, and may be coroutines.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, flush_interval: float = 0.005,
+                 batch_size: int = 500, max_pending: int = 50_000):
+        self.worker_id = worker_id or uuid.uuid4().hex
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._outbox: List[Tuple[str, Any]] = []
+        self._worker = BackgroundTask(self._run)
+
+        self.published = 0
+        self.dropped = 0
+        self.batches_sent = 0
+        self.received = 0
+        self.batches_received = 0
+        self.handler_errors = 0
+
+    def subscribe(self, channel: str, handler: Handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def publish(self, channel: str, payload: Any):
+        if len(self._outbox) >= self.max_pending:
+            # Other workers are unreachable; don't hold events forever
+            self.dropped += 1
+            return
+        self._outbox.append((channel, payload))
+        self.published += 1
+        if len(self._outbox) >= self.batch_size:
+            self._worker.wake()
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await self._worker.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Failed to send events to other workers")
+
+    async def flush(self) -> int:
+        sent = 0
+        while self._outbox:
+            batch = self._outbox[:self.batch_size]
+            del self._outbox[:self.batch_size]
+            await self._send(batch)
+            self.batches_sent += 1
+            sent += len(batch)
+        return sent
+
+    @abc.abstractmethod
+    async def _send(self, batch: List[Tuple[str, Any]]):
+        """Deliver ``batch`` to every other worker"""
+
+    async def _dispatch(self, origin: str, batch: List[Tuple[str, Any]]):
+        if origin == self.worker_id:
+            return
+        self.batches_received += 1
+        for channel, payload in batch:
+            self.received += 1
+            for handler in self._handlers.get(channel, ()):
+                try:
+                    result = handler(payload, origin)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception:
+                    self.handler_errors += 1
+                    logger.exception("Message bus handler for %r failed", channel)
+
+    def metrics(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "pending": len(self._outbox),
+            "published": self.published,
+            "dropped": self.dropped,
+            "batches_sent": self.batches_sent,
+            "received": self.received,
+            "batches_received": self.batches_received,
+            "handler_errors": self.handler_errors,
+        }
+
+
+class LocalHub:
+    """Connects LocalMessageBus instances living in the same process"""
+
+    def __init__(self):
+        self.buses: List["LocalMessageBus"] = []
+
+
+class LocalMessageBus(MessageBus):
+    """In-process bus: a single worker, or several simulated workers sharing a hub.
+
+    With one worker there is nobody to send to, so batches are simply dropped.
+    """
+
+    def __init__(self, hub: Optional[LocalHub] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.hub = hub or LocalHub()
+        self.hub.buses.append(self)
+
+    def publish(self, channel: str, payload: Any):
+        # Nobody else would receive it
+        if len(self.hub.buses) > 1:
+            super().publish(channel, payload)
+
+    async def _send(self, batch: List[Tuple[str, Any]]):
+        for bus in list(self.hub.buses):
+            await bus._dispatch(self.worker_id, batch)
+
+
+class RedisMessageBus(MessageBus):
+    """Workers exchange JSON batches over one Redis pub/sub channel"""
+
+    def __init__(self, redis_url: str, channel: str = "photohire:bus", **kwargs):
+        if aioredis is None:
+            raise RuntimeError("The Redis message bus needs the redis package")
+        super().__init__(**kwargs)
+        self.redis = aioredis.from_url(redis_url)
+        self.channel = channel
+        self._reader: Optional[BackgroundTask] = None
+
+    async def start(self):
+        if self._reader is None:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(self.channel)
+            self._reader = BackgroundTask(partial(self._read, pubsub))
+            self._reader.start()
+        await super().start()
+
+    async def stop(self):
+        await super().stop()
+        if self._reader is not None:
+            await self._reader.stop()
+            self._reader = None
+        await self.redis.close()
+
+    async def _send(self, batch: List[Tuple[str, Any]]):
+        await self.redis.publish(self.channel, json.dumps({"origin": self.worker_id, "events": batch}))
+
+    async def _read(self, pubsub):
+        try:
+            while True:
+                try:
+                    if not pubsub.subscribed:
+                        await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        data = json.loads(message["data"])
+                        await self._dispatch(data["origin"], [tuple(event) for event in data["events"]])
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Message bus connection lost, resubscribing")
+                    await asyncio.sleep(1.0)
+        finally:
+            await pubsub.close()
+
+
+def create_message_bus() -> MessageBus:
+    options = dict(flush_interval=settings.MESSAGE_BUS_FLUSH_INTERVAL, batch_size=settings.MESSAGE_BUS_BATCH_SIZE)
+    if settings.MESSAGE_BUS_BACKEND == "redis":
+        return RedisMessageBus(settings.MESSAGE_BUS_REDIS_URL, **options)
+    return LocalMessageBus(**options)
+
+
+message_bus = create_message_bus()
+metrics_registry.register("message_bus", message_bus.metrics)
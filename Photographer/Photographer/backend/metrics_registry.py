@@ -0,0 +1,31 @@
+from typing import Callable, Dict, List
+
+
+class MetricsRegistry:
+    """The ``metrics()`` of every in-process component, by name.
+
+    Each module registers its component next to the instance it creates;
+    the admin dashboard serves them all from /dashboard/metrics and one at a
+    time from /dashboard/metrics/{name}.
+    """
+
+    def __init__(self):
+        self._sources: Dict[str, Callable[[], dict]] = {}
+
+    def register(self, name: str, source: Callable[[], dict]):
+        if name in self._sources:
+            raise ValueError(f"Metrics source {name!r} is already registered")
+        self._sources[name] = source
+
+    def names(self) -> List[str]:
+        return sorted(self._sources)
+
+    def collect(self, name: str) -> dict:
+        """Metrics of one component; KeyError if none is registered as ``name``"""
+        return self._sources[name]()
+
+    def collect_all(self) -> Dict[str, dict]:
+        return {name: self._sources[name]() for name in self.names()}
+
+
+metrics_registry = MetricsRegistry()
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set
+from .background import BackgroundTask
+from .config import settings
+from .message_bus import message_bus
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceRegistry:
+    """Who is connected, with every session (device) per user.
+
+    A forward index (user -> sids) and a reverse index (sid -> user) keep
+    register, unregister and lookups O(1) no matter how many clients are
+    connected. Users connected to other workers are tracked per worker from
+    their presence events, so ``is_online`` answers for the whole cluster.
+
+    Once started, a background task expires workers that stopped sending
+    snapshots and last-seen times older than ``last_seen_ttl``; a worker
+    serving socket clients also shares its own online list every
+    ``snapshot_interval`` seconds.
+    """
+
+    def __init__(self, snapshot_interval: float = 10.0, last_seen_ttl: float = 86400.0):
+        self.snapshot_interval = snapshot_interval
+        self.last_seen_ttl = last_seen_ttl
+        self._sids_by_user: Dict[str, Set[str]] = {}
+        self._user_by_sid: Dict[str, str] = {}
+        self._last_seen: Dict[str, float] = {}
+        # Other workers: user -> workers, worker -> users, worker -> last heard from
+        self._remote_workers: Dict[str, Set[str]] = {}
+        self._worker_users: Dict[str, Set[str]] = {}
+        self._worker_seen: Dict[str, float] = {}
+        self._share = False
+        self._worker = BackgroundTask(self._run)
+
+    def register(self, sid: str, user_id) -> bool:
+        """Attach ``sid`` to ``user_id``; True if the user just came online"""
+        user_id = str(user_id)
+        previous = self._user_by_sid.get(sid)
+        if previous == user_id:
+            self._last_seen[user_id] = time.time()
+            return False
+        if previous is not None:
+            self.unregister(sid)
+        self._user_by_sid[sid] = user_id
+        sids = self._sids_by_user.setdefault(user_id, set())
+        sids.add(sid)
+        self._last_seen[user_id] = time.time()
+        return len(sids) == 1
+
+    def unregister(self, sid: str) -> Optional[str]:
+        """Detach ``sid``; returns the user id if that was their last session"""
+        user_id = self._user_by_sid.pop(sid, None)
+        if user_id is None:
+            return None
+        self._last_seen[user_id] = time.time()
+        sids = self._sids_by_user.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._sids_by_user[user_id]
+                return user_id
+        return None
+
+    def touch(self, sid: str):
+        user_id = self._user_by_sid.get(sid)
+        if user_id is not None:
+            self._last_seen[user_id] = time.time()
+
+    def user_for(self, sid: str) -> Optional[str]:
+        return self._user_by_sid.get(sid)
+
+    def sids(self, user_id) -> Set[str]:
+        return self._sids_by_user.get(str(user_id), set())
+
+    def is_online(self, user_id) -> bool:
+        user_id = str(user_id)
+        return user_id in self._sids_by_user or user_id in self._remote_workers
+
+    def is_local(self, user_id) -> bool:
+        """Whether the user has a session on this worker"""
+        return str(user_id) in self._sids_by_user
+
+    def is_online_elsewhere(self, user_id) -> bool:
+        return str(user_id) in self._remote_workers
+
+    def local_users(self) -> List[str]:
+        return list(self._sids_by_user)
+
+    def last_seen(self, user_id) -> Optional[float]:
+        """Unix time of the user's last connect, disconnect or activity"""
+        return self._last_seen.get(str(user_id))
+
+    def online_count(self) -> int:
+        remote_only = sum(1 for user_id in self._remote_workers if user_id not in self._sids_by_user)
+        return len(self._sids_by_user) + remote_only
+
+    def session_count(self) -> int:
+        return len(self._user_by_sid)
+
+    # Other workers
+
+    def remote_online(self, worker: str, user_id):
+        user_id = str(user_id)
+        self._worker_users.setdefault(worker, set()).add(user_id)
+        self._remote_workers.setdefault(user_id, set()).add(worker)
+        self._worker_seen[worker] = time.time()
+        self._last_seen[user_id] = time.time()
+
+    def remote_offline(self, worker: str, user_id):
+        user_id = str(user_id)
+        self._worker_users.get(worker, set()).discard(user_id)
+        self._drop_remote(worker, user_id)
+        self._worker_seen[worker] = time.time()
+        self._last_seen[user_id] = time.time()
+
+    def remote_snapshot(self, worker: str, user_ids: Iterable):
+        """Replace everything known about ``worker`` with its full online list"""
+        users = {str(user_id) for user_id in user_ids}
+        for user_id in self._worker_users.get(worker, set()) - users:
+            self._drop_remote(worker, user_id)
+        for user_id in users:
+            self._remote_workers.setdefault(user_id, set()).add(worker)
+        self._worker_users[worker] = users
+        self._worker_seen[worker] = time.time()
+
+    def expire_workers(self, max_age: float) -> List[str]:
+        """Forget workers that have not been heard from for ``max_age`` seconds"""
+        cutoff = time.time() - max_age
+        expired = [worker for worker, seen in self._worker_seen.items() if seen < cutoff]
+        for worker in expired:
+            for user_id in self._worker_users.pop(worker, set()):
+                self._drop_remote(worker, user_id)
+            del self._worker_seen[worker]
+        return expired
+
+    def expire_last_seen(self, max_age: float) -> int:
+        """Forget when offline users were last seen more than ``max_age`` seconds ago"""
+        cutoff = time.time() - max_age
+        expired = [user_id for user_id, seen in self._last_seen.items()
+                   if seen < cutoff and not self.is_online(user_id)]
+        for user_id in expired:
+            del self._last_seen[user_id]
+        return len(expired)
+
+    def _drop_remote(self, worker: str, user_id: str):
+        workers = self._remote_workers.get(user_id)
+        if workers is not None:
+            workers.discard(worker)
+            if not workers:
+                del self._remote_workers[user_id]
+
+    # Background task
+
+    async def start(self, share: bool = False):
+        """``share``: this worker holds socket sessions and broadcasts them"""
+        self._share = self._share or share
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+        if self._share:
+            # Tell the other workers our users are gone
+            message_bus.publish('presence_snapshot', [])
+
+    async def _run(self):
+        while True:
+            try:
+                if self._share:
+                    # Also serves as this worker's heartbeat
+                    message_bus.publish('presence_snapshot', self.local_users())
+                # A worker that missed several snapshots has died
+                self.expire_workers(self.snapshot_interval * 3)
+                self.expire_last_seen(self.last_seen_ttl)
+            except Exception:
+                logger.exception("Presence maintenance failed")
+            await asyncio.sleep(self.snapshot_interval)
+
+    def metrics(self) -> dict:
+        return {
+            "online_users": self.online_count(),
+            "local_users": len(self._sids_by_user),
+            "sessions": self.session_count(),
+            "other_workers": len(self._worker_seen),
+            "last_seen_entries": len(self._last_seen),
+        }
+
+
+presence = PresenceRegistry(
+    snapshot_interval=settings.PRESENCE_SNAPSHOT_INTERVAL,
+    last_seen_ttl=settings.PRESENCE_LAST_SEEN_TTL,
+)
+metrics_registry.register("presence", presence.metrics)
+
+
+# Every process that imports the registry follows the other workers' users,
+# including one serving only the REST API and dashboard
+def _remote_presence(payload, origin):
+    if payload['online']:
+        presence.remote_online(origin, payload['user_id'])
+    else:
+        presence.remote_offline(origin, payload['user_id'])
+
+
+def _remote_presence_snapshot(user_ids, origin):
+    presence.remote_snapshot(origin, user_ids)
+
+
+message_bus.subscribe('presence', _remote_presence)
+message_bus.subscribe('presence_snapshot', _remote_presence_snapshot)
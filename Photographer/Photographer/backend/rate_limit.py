@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+import zlib
+from math import ceil
+from typing import Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request, Response, status
+from .background import BackgroundTask
+from .config import settings
+from .metrics_registry import metrics_registry
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis sync is optional
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(millisecond|second|minute|hour)s?\s*$')
+_UNIT_MS = {"millisecond": 1, "second": 1000, "minute": 60_000, "hour": 3_600_000}
+
+
+def parse_limit(value: str) -> Tuple[int, int]:
+    """Parse ``"100/minute"`` or ``"5/10seconds"`` into (times, milliseconds)"""
+    match = _LIMIT_RE.match(value)
+    if match is None:
+        raise ValueError(f"Invalid rate limit {value!r}")
+    times, count, unit = match.groups()
+    return int(times), int(count or 1) * _UNIT_MS[unit]
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [tokens, last refill time, capacity, tokens per second]
+        self.buckets: Dict[str, List[float]] = {}
+
+
+class TokenBucketStore:
+    """In-memory token buckets, split into independently locked shards.
+
+    A bucket that has refilled to capacity behaves exactly like a missing one, so
+    the sweeper drops those; memory stays proportional to recently active keys.
+    Each sweep step visits a single shard to keep pauses short.
+    """
+
+    def __init__(self, shards: int = 64, sweep_interval: float = 10.0):
+        self._shards = [_Shard() for _ in range(shards)]
+        self.sweep_interval = sweep_interval
+        self._sweep_position = 0
+        self._worker = BackgroundTask(self._run)
+        self.sync: Optional["RedisBucketSync"] = None
+
+        self.allowed = 0
+        self.limited = 0
+        self.evicted = 0
+
+    def _shard(self, key: str) -> _Shard:
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def consume(self, key: str, capacity: int, period_ms: int, now: Optional[float] = None) -> float:
+        """Take one token; return 0 if allowed, else milliseconds until one is available"""
+        now = time.monotonic() if now is None else now
+        rate = capacity * 1000.0 / period_ms
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [float(capacity), now, capacity, rate]
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                self.allowed += 1
+                if self.sync is not None:
+                    self.sync.record(key)
+                return 0
+            self.limited += 1
+            return (1.0 - bucket[0]) / rate * 1000.0
+
+    def deduct(self, key: str, tokens: float, now: Optional[float] = None):
+        """Remove tokens spent elsewhere (e.g. by other workers)"""
+        now = time.monotonic() if now is None else now
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(bucket[2], bucket[0] + (now - bucket[1]) * bucket[3]) - tokens
+                bucket[1] = now
+
+    def sweep_shard(self, index: int, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        shard = self._shards[index]
+        with shard.lock:
+            full = [
+                key for key, (tokens, last, capacity, rate) in shard.buckets.items()
+                if tokens + (now - last) * rate >= capacity
+            ]
+            for key in full:
+                del shard.buckets[key]
+        self.evicted += len(full)
+        return len(full)
+
+    def __len__(self) -> int:
+        return sum(len(shard.buckets) for shard in self._shards)
+
+    async def start(self):
+        self._worker.start()
+        if self.sync is not None:
+            await self.sync.start()
+
+    async def stop(self):
+        await self._worker.stop()
+        if self.sync is not None:
+            await self.sync.stop()
+
+    async def _run(self):
+        step = self.sweep_interval / len(self._shards)
+        while True:
+            await asyncio.sleep(step)
+            self.sweep_shard(self._sweep_position)
+            self._sweep_position = (self._sweep_position + 1) % len(self._shards)
+
+    def metrics(self) -> dict:
+        return {
+            "buckets": len(self),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "evicted": self.evicted,
+        }
+
+
+class RedisBucketSync:
+    """Periodically shares token consumption between workers through Redis.
+
+    Each worker adds what it spent since the last sync to a shared Redis hash,
+    reads back the totals and deducts what the other workers spent from its own
+    buckets. Limits are exact per worker and approximately global, with no Redis
+    round trip on the request path.
+    """
+
+    def __init__(self, store: TokenBucketStore, redis_url: str, interval: float = 1.0,
+                 hash_key: str = "photohire:ratelimit", ttl_seconds: int = 3600):
+        if aioredis is None:
+            raise RuntimeError("Rate limit sync needs the redis package")
+        self.store = store
+        self.redis = aioredis.from_url(redis_url)
+        self.interval = interval
+        self.hash_key = hash_key
+        self.ttl_seconds = ttl_seconds
+        self._spent: Dict[str, int] = {}
+        # key -> shared total seen at the last sync
+        self._seen: Dict[str, int] = {}
+        self._worker = BackgroundTask(self._run)
+
+    def record(self, key: str):
+        self._spent[key] = self._spent.get(key, 0) + 1
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+        await self.redis.close()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Rate limit sync failed")
+
+    async def sync(self):
+        spent, self._spent = self._spent, {}
+        keys = list(set(spent) | set(self._seen))
+        if not keys:
+            return
+        pipe = self.redis.pipeline()
+        for key in keys:
+            pipe.hincrby(self.hash_key, key, spent.get(key, 0))
+        pipe.expire(self.hash_key, self.ttl_seconds)
+        totals = (await pipe.execute())[:-1]
+        for key, total in zip(keys, totals):
+            mine = spent.get(key, 0)
+            last_total = self._seen.get(key)
+            if last_total is None or total < last_total + mine:
+                # First sync for this key, or the shared hash expired: take a baseline
+                remote = 0
+            else:
+                remote = total - last_total - mine
+            if remote > 0:
+                self.store.deduct(key, remote)
+            if mine or remote:
+                self._seen[key] = total
+            else:
+                self._seen.pop(key, None)
+
+
+bucket_store = TokenBucketStore(shards=settings.RATE_LIMIT_SHARDS)
+metrics_registry.register("rate_limit", bucket_store.metrics)
+if settings.RATE_LIMIT_SYNC_REDIS_URL:
+    bucket_store.sync = RedisBucketSync(
+        bucket_store,
+        settings.RATE_LIMIT_SYNC_REDIS_URL,
+        interval=settings.RATE_LIMIT_SYNC_INTERVAL,
+    )
+
+_route_limits: Dict[str, Tuple[int, int]] = {
+    path: parse_limit(limit) for path, limit in settings.RATE_LIMITS.items()
+}
+_endpoint_paths: Dict[Callable, Optional[str]] = {}
+
+
+def _route_path(request: Request) -> Optional[str]:
+    endpoint = request.scope.get("endpoint")
+    if endpoint not in _endpoint_paths:
+        _endpoint_paths[endpoint] = next(
+            (route.path for route in request.app.routes if getattr(route, "endpoint", None) is endpoint),
+            None,
+        )
+    return _endpoint_paths[endpoint]
+
+
+async def default_identifier(request: Request) -> str:
+    """Client address and path, as fastapi_limiter keys requests"""
+    forwarded = request.headers.get("X-Forwarded-For")
+    ip = forwarded.split(",")[0] if forwarded else request.client.host
+    return ip + ":" + request.scope["path"]
+
+
+async def http_default_callback(request: Request, response: Response, pexpire: int):
+    raise HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, "Too Many Requests",
+                        headers={"Retry-After": str(ceil(pexpire / 1000))})
+
+
+class RateLimiter:
+    """Drop-in for ``fastapi_limiter.depends.RateLimiter`` backed by ``bucket_store``.
+
+    ``times`` per period is the default; an entry for the route's path in
+    ``settings.RATE_LIMITS`` (e.g. ``{"/token": "10/minute"}``) overrides it.
+    """
+
+    def __init__(self, times: int = 1, milliseconds: int = 0, seconds: int = 0,
+                 minutes: int = 0, hours: int = 0,
+                 identifier: Optional[Callable] = None, callback: Optional[Callable] = None,
+                 store: TokenBucketStore = bucket_store):
+        self.times = times
+        self.milliseconds = milliseconds + 1000 * seconds + 60000 * minutes + 3600000 * hours
+        self.identifier = identifier or default_identifier
+        self.callback = callback or http_default_callback
+        self.store = store
+
+    async def __call__(self, request: Request, response: Response):
+        times, milliseconds = self.times, self.milliseconds
+        if _route_limits:
+            times, milliseconds = _route_limits.get(_route_path(request), (times, milliseconds))
+        rate_key = await self.identifier(request)
+        retry_after = self.store.consume(f"{rate_key}:{times}/{milliseconds}", times, milliseconds)
+        if retry_after:
+            return await self.callback(request, response, retry_after)
@@ -1,69 +1,226 @@
+import asyncio
+import logging
 import socketio
-from typing import Dict
 from datetime import datetime
+from urllib.parse import parse_qs
+from fastapi import HTTPException
+from .auth import get_current_user
+from .database import SessionLocal
+from .geo_index import geo_index, valid_coordinates
+from .location_buffer import location_buffer
+from .location_fanout import create_fanout
+from .chat import chat_writer, UnknownUser
+from .unread_counters import unread_counters
+from .presence import presence
+from .message_bus import message_bus
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
 
 # Initialize Socket.IO server
 sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
-app = socketio.ASGIApp(sio)
 
-# Store active connections
-active_users: Dict[str, str] = {}
+async def _emit_to_sid(event, data, sid):
+    await sio.emit(event, data, room=sid)
+
+# Location updates are routed per grid cell instead of one global room
+location_fanout = create_fanout(_emit_to_sid)
+metrics_registry.register("location_fanout", location_fanout.metrics)
+
+async def on_startup():
+    await message_bus.start()
+    await geo_index.start()
+    await location_buffer.start()
+    await location_fanout.start()
+    await chat_writer.start()
+    await unread_counters.start()
+    await presence.start(share=True)
+
+async def on_shutdown():
+    # Tell the other workers our users are gone before the final flush
+    await presence.stop()
+    await location_fanout.stop()
+    await geo_index.stop()
+    await location_buffer.stop()
+    await chat_writer.stop()
+    await unread_counters.stop()
+    await message_bus.stop()
+
+app = socketio.ASGIApp(sio, on_startup=on_startup, on_shutdown=on_shutdown)
+
+def user_room(user_id) -> str:
+    """Room holding every session (device) of a user"""
+    return f'user:{user_id}'
+
+async def emit_to_user(user_id, event, data):
+    """Send an event to every device of a user, whichever worker holds them"""
+    if presence.is_local(user_id):
+        await sio.emit(event, data, room=user_room(user_id))
+    if presence.is_online_elsewhere(user_id):
+        message_bus.publish('user_event', {'user_id': str(user_id), 'event': event, 'data': data})
+
+def _push_unread_counts(user_id, counts):
+    # Every worker keeps its own counters, so only local devices are pushed to
+    if presence.is_local(user_id):
+        asyncio.ensure_future(sio.emit('unread_counts', counts, room=user_room(user_id)))
+
+unread_counters.listeners.append(_push_unread_counts)
+
+# Events from other workers
+
+async def _deliver_user_event(payload, origin):
+    if presence.is_local(payload['user_id']):
+        await sio.emit(payload['event'], payload['data'], room=user_room(payload['user_id']))
+
+def _remote_location(update, origin):
+    location_fanout.publish(update)
+
+def _remote_presence(payload, origin):
+    # After presence.py's handler, so the registry already has the change
+    if not payload['online'] and not presence.is_online(payload['user_id']):
+        location_fanout.forget(payload['user_id'])
+
+message_bus.subscribe('user_event', _deliver_user_event)
+message_bus.subscribe('location', _remote_location)
+message_bus.subscribe('presence', _remote_presence)
+
+async def _authenticate(token: str):
+    """The active user an access token belongs to, or None"""
+    db = SessionLocal()
+    try:
+        user = await get_current_user(token, db)
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+    return user if user.is_active else None
 
 @sio.event
-async def connect(sid, environ):
-    print(f'Client connected: {sid}')
+async def connect(sid, environ, auth=None):
+    # The REST API's bearer token, from the client's auth payload or ?token=;
+    # sessions without one can only watch locations
+    token = auth.get('token') if isinstance(auth, dict) else None
+    token = token or parse_qs(environ.get('QUERY_STRING', '')).get('token', [None])[0]
+    if token is not None:
+        user = await _authenticate(token)
+        if user is None:
+            raise socketio.exceptions.ConnectionRefusedError('Could not validate credentials')
+        await sio.save_session(sid, {'user_id': str(user.id), 'user_type': user.user_type})
+    logger.debug('Client connected: %s', sid)
 
 @sio.event
 async def disconnect(sid):
-    user_id = next((uid for uid, session_id in active_users.items() if session_id == sid), None)
-    if user_id:
-        del active_users[user_id]
-    print(f'Client disconnected: {sid}')
+    went_offline = presence.unregister(sid)
+    if went_offline is not None:
+        message_bus.publish('presence', {'user_id': went_offline, 'online': False})
+        if not presence.is_online(went_offline):
+            location_fanout.forget(went_offline)
+    location_fanout.unsubscribe(sid)
+    logger.debug('Client disconnected: %s', sid)
 
 @sio.event
-async def register_user(sid, user_id):
-    active_users[user_id] = sid
-    print(f'User {user_id} registered with session {sid}')
+async def register_user(sid, user_id=None):
+    session = await sio.get_session(sid)
+    if 'user_id' not in session:
+        return {'status': 'error', 'detail': 'connect with a token to register'}
+    if user_id is not None and str(user_id) != session['user_id']:
+        return {'status': 'error', 'detail': 'user_id does not match the token'}
+    user_id = session['user_id']
+    if presence.register(sid, user_id):
+        message_bus.publish('presence', {'user_id': str(user_id), 'online': True})
+    await sio.enter_room(sid, user_room(user_id))
+    logger.debug('User %s registered with session %s', user_id, sid)
 
 @sio.event
 async def send_message(sid, data):
-    sender_id = data.get('sender_id')
+    # Always the registered user; a sender_id in the payload must match it
+    sender_id = presence.user_for(sid)
+    if sender_id is None:
+        return {'status': 'error', 'detail': 'register_user first'}
+    if str(data.get('sender_id', sender_id)) != sender_id:
+        return {'status': 'error', 'detail': 'sender_id does not match the registered user'}
     receiver_id = data.get('receiver_id')
     message = data.get('message')
-    timestamp = datetime.utcnow().isoformat()
+    try:
+        receiver_key = int(receiver_id)
+    except (TypeError, ValueError):
+        return {'status': 'error', 'detail': 'receiver_id must be a user id'}
+    sender_key = int(sender_id)
+    if not message:
+        return {'status': 'error', 'detail': 'message is empty'}
+
+    # Queued for a batched insert; the emit below does not wait for the commit
+    try:
+        row = await chat_writer.submit(sender_key, receiver_key, message)
+    except UnknownUser as e:
+        return {'status': 'error', 'detail': str(e)}
+    timestamp = row['created_at'].isoformat()
+
+    presence.touch(sid)
 
-    # Store message in database (implement this)
-    
-    # Send to receiver if online
-    if receiver_id in active_users:
-        receiver_sid = active_users[receiver_id]
-        await sio.emit('new_message', {
+    # Send to every device of the receiver, on this worker or another one
+    if presence.is_online(receiver_key):
+        await emit_to_user(receiver_key, 'new_message', {
             'sender_id': sender_id,
             'message': message,
             'timestamp': timestamp
-        }, room=receiver_sid)
+        })
 
 @sio.event
 async def update_location(sid, data):
-    photographer_id = data.get('photographer_id')
+    photographer_id = presence.user_for(sid)
+    session = await sio.get_session(sid)
+    if photographer_id is None or session.get('user_type') != 'photographer':
+        return {'status': 'error', 'detail': 'register as a photographer first'}
+    if str(data.get('photographer_id', photographer_id)) != photographer_id:
+        return {'status': 'error', 'detail': 'photographers can only update their own location'}
     latitude = data.get('latitude')
     longitude = data.get('longitude')
+    if not valid_coordinates(latitude, longitude):
+        return {'status': 'error', 'detail': 'latitude and longitude must be finite and in range'}
+    publish_location(photographer_id, latitude, longitude)
+
+def publish_location(photographer_id: str, latitude: float, longitude: float):
+    """Record a photographer's position and send it to location subscribers.
+
+    Shared by the socket event and POST /location/update, so both reach
+    this worker's subscribers directly and other workers' over the bus.
+    """
     timestamp = datetime.utcnow().isoformat()
 
-    # Update photographer's location in database (implement this)
-    
-    # Broadcast location update to relevant clients
-    await sio.emit('location_update', {
+    # Index the position right away; the database write is coalesced and batched
+    geo_index.update_location(photographer_id, latitude, longitude)
+    location_buffer.add(photographer_id, latitude, longitude, timestamp)
+
+    # Queue the update for subscribers watching this photographer's cell;
+    # they receive batched 'location_updates' events at their own pace
+    update = {
         'photographer_id': photographer_id,
         'latitude': latitude,
         'longitude': longitude,
         'timestamp': timestamp
-    }, room='location_updates')
+    }
+    location_fanout.publish(update)
+    # Other workers index it and fan it out to their own subscribers
+    message_bus.publish('location', update)
+
+@sio.event
+async def subscribe_location_viewport(sid, data):
+    try:
+        cells = location_fanout.subscribe_viewport(
+            sid,
+            float(data['min_latitude']), float(data['min_longitude']),
+            float(data['max_latitude']), float(data['max_longitude']),
+            data.get('max_updates_per_second'),
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return {'status': 'error', 'detail': str(e)}
+    return {'status': 'subscribed', 'cells': cells}
 
 @sio.event
 async def join_location_updates(sid):
-    sio.enter_room(sid, 'location_updates')
+    location_fanout.subscribe_all(sid)
 
 @sio.event
 async def leave_location_updates(sid):
-    sio.leave_room(sid, 'location_updates')
\ No newline at end of file
+    location_fanout.unsubscribe(sid)
\ No newline at end of file
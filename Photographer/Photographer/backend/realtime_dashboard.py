@@ -1,93 +1,230 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from typing import Deque, Dict, Optional
+from collections import deque
 from datetime import datetime
+import asyncio
 import json
+import logging
+import time
+from .config import settings
+from .presence import presence
+from .system_metrics import system_metrics
+from .request_metrics import request_metrics
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# What happens when a client's send queue is full: metrics are superseded by
+# the next update, so the oldest is dropped; alerts and admin messages must not
+# be lost, so the client is disconnected and reloads its state on reconnect
+DROP_OLDEST = "drop_oldest"
+EVICT = "evict"
+FULL_QUEUE_POLICIES = {"metrics": DROP_OLDEST, "alerts": EVICT, "admin": EVICT}
+
+
+def _percentiles(samples) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    pick = lambda p: ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000
+    return {"p50": pick(0.50), "p95": pick(0.95), "max": ordered[-1] * 1000}
+
+
+class DashboardConnection:
+    """A dashboard socket with its own bounded queue drained by a writer task"""
+
+    def __init__(self, websocket: WebSocket, client_type: str, queue_size: int):
+        self.websocket = websocket
+        self.client_type = client_type
+        self.queue: "asyncio.Queue" = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
 
 class DashboardConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {
-            "admin": [],
-            "metrics": [],
-            "alerts": []
+    """Broadcasts to dashboard sockets without waiting on any single client.
+
+    A broadcast serializes its payload once and only enqueues the text for each
+    connection; every connection's writer task sends at that client's pace. A
+    client that stops reading fills its queue and is handled by its type's
+    policy, and one that takes longer than ``send_timeout`` to accept a message
+    is disconnected.
+    """
+
+    def __init__(self, queue_size: int = 100, send_timeout: float = 5.0, latency_window: int = 1000):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        # Keyed by id(websocket): starlette's WebSocket is a Mapping and isn't hashable
+        self.active_connections: Dict[str, Dict[int, DashboardConnection]] = {
+            "admin": {},
+            "metrics": {},
+            "alerts": {}
         }
+        self._broadcast_latencies: Deque[float] = deque(maxlen=latency_window)
+        self._delivery_latencies: Deque[float] = deque(maxlen=latency_window)
+
+        self.broadcasts = 0
+        self.sent = 0
+        self.dropped = 0
+        self.evicted = 0
 
     async def connect(self, websocket: WebSocket, client_type: str):
         await websocket.accept()
         if client_type in self.active_connections:
-            self.active_connections[client_type].append(websocket)
+            connection = DashboardConnection(websocket, client_type, self.queue_size)
+            connection.task = asyncio.ensure_future(self._write(connection))
+            self.active_connections[client_type][id(websocket)] = connection
 
     def disconnect(self, websocket: WebSocket, client_type: str):
-        if client_type in self.active_connections:
-            self.active_connections[client_type].remove(websocket)
+        connection = self.active_connections.get(client_type, {}).pop(id(websocket), None)
+        if connection is not None and connection.task is not None:
+            connection.task.cancel()
 
-    async def broadcast_metrics(self, message: dict):
-        for connection in self.active_connections["metrics"]:
+    def _evict(self, connection: DashboardConnection):
+        self.evicted += 1
+        self.disconnect(connection.websocket, connection.client_type)
+        asyncio.ensure_future(self._close(connection.websocket))
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            # 1013: try again later
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def _write(self, connection: DashboardConnection):
+        while True:
+            text, enqueued_at = await connection.queue.get()
             try:
-                await connection.send_json({
-                    "type": "metrics_update",
-                    "data": message,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-            except WebSocketDisconnect:
-                await self.disconnect(connection, "metrics")
+                await asyncio.wait_for(connection.websocket.send_text(text), timeout=self.send_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Unregister without cancelling: this is the writer task itself
+                self.active_connections[connection.client_type].pop(id(connection.websocket), None)
+                if not isinstance(e, WebSocketDisconnect):
+                    self.evicted += 1
+                    logger.info("Dropping slow or broken %s dashboard client: %r", connection.client_type, e)
+                    await self._close(connection.websocket)
+                return
+            self.sent += 1
+            self._delivery_latencies.append(time.monotonic() - enqueued_at)
+
+    def _enqueue(self, connection: DashboardConnection, text: str, now: float):
+        try:
+            connection.queue.put_nowait((text, now))
+            return
+        except asyncio.QueueFull:
+            pass
+        self.dropped += 1
+        connection.dropped += 1
+        if FULL_QUEUE_POLICIES.get(connection.client_type, EVICT) == DROP_OLDEST:
+            connection.queue.get_nowait()
+            connection.queue.put_nowait((text, now))
+        else:
+            self._evict(connection)
+
+    def _broadcast(self, client_type: str, payload: dict):
+        started = time.monotonic()
+        text = json.dumps(payload)
+        for connection in list(self.active_connections[client_type].values()):
+            self._enqueue(connection, text, started)
+        self.broadcasts += 1
+        self._broadcast_latencies.append(time.monotonic() - started)
+
+    async def send_to(self, websocket: WebSocket, client_type: str, payload: dict):
+        """Reply to one client through its queue, keeping order with broadcasts"""
+        connection = self.active_connections.get(client_type, {}).get(id(websocket))
+        if connection is None:
+            await websocket.send_text(json.dumps(payload))
+        else:
+            self._enqueue(connection, json.dumps(payload), time.monotonic())
+
+    async def broadcast_metrics(self, message: dict):
+        self._broadcast("metrics", {
+            "type": "metrics_update",
+            "data": message,
+            "timestamp": datetime.utcnow().isoformat()
+        })
 
     async def broadcast_alert(self, alert_type: str, message: str):
-        alert_data = {
+        self._broadcast("alerts", {
             "type": "alert",
             "alert_type": alert_type,
             "message": message,
             "timestamp": datetime.utcnow().isoformat()
-        }
-        for connection in self.active_connections["alerts"]:
-            try:
-                await connection.send_json(alert_data)
-            except WebSocketDisconnect:
-                await self.disconnect(connection, "alerts")
+        })
 
     async def send_admin_message(self, message: dict):
-        for connection in self.active_connections["admin"]:
-            try:
-                await connection.send_json({
-                    "type": "admin_message",
-                    "data": message,
-                    "timestamp": datetime.utcnow().isoformat()
-                })
-            except WebSocketDisconnect:
-                await self.disconnect(connection, "admin")
+        self._broadcast("admin", {
+            "type": "admin_message",
+            "data": message,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    def connection_count(self) -> int:
+        return sum(len(connections) for connections in self.active_connections.values())
+
+    def metrics(self) -> dict:
+        return {
+            "connections": {client_type: len(connections) for client_type, connections in self.active_connections.items()},
+            "queued": sum(connection.queue.qsize() for connections in self.active_connections.values()
+                          for connection in connections.values()),
+            "broadcasts": self.broadcasts,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "broadcast_ms": _percentiles(self._broadcast_latencies),
+            "delivery_ms": _percentiles(self._delivery_latencies),
+        }
+
+dashboard_manager = DashboardConnectionManager(
+    queue_size=settings.DASHBOARD_SEND_QUEUE_SIZE,
+    send_timeout=settings.DASHBOARD_SEND_TIMEOUT,
+)
+metrics_registry.register("dashboard_websocket", dashboard_manager.metrics)
 
-dashboard_manager = DashboardConnectionManager()
+system_metrics.gauges["active_connections"] = dashboard_manager.connection_count
+system_metrics.gauges["active_users"] = presence.online_count
+system_metrics.collectors.append(request_metrics.collect)
+# Subscribers get only the metrics that changed since the last sample
+system_metrics.listeners.append(dashboard_manager.broadcast_metrics)
 
 async def handle_dashboard_websocket(websocket: WebSocket, client_type: str):
     await dashboard_manager.connect(websocket, client_type)
     try:
+        if client_type == "metrics":
+            # Fill the charts once; live deltas follow
+            await dashboard_manager.send_to(websocket, client_type, {
+                "type": "metrics_history",
+                "data": system_metrics.snapshot()
+            })
         while True:
             data = await websocket.receive_text()
             message = json.loads(data)
             
             # Handle different types of messages
             if message.get("type") == "ping":
-                await websocket.send_json({"type": "pong"})
+                await dashboard_manager.send_to(websocket, client_type, {"type": "pong"})
             elif message.get("type") == "metrics_request":
-                # TODO: Implement metrics data gathering
-                await websocket.send_json({
+                await dashboard_manager.send_to(websocket, client_type, {
                     "type": "metrics_response",
                     "data": {
-                        "active_users": 0,
-                        "active_sessions": 0,
+                        **system_metrics.latest(),
+                        "active_users": presence.online_count(),
+                        "active_sessions": presence.session_count(),
                         "system_health": "good"
                     }
                 })
     except WebSocketDisconnect:
+        pass
+    finally:
+        # Also on bad JSON or a failed send: unregister and stop the writer task
         dashboard_manager.disconnect(websocket, client_type)
 
 async def broadcast_system_metrics():
-    """Periodic task to broadcast system metrics to all connected clients"""
-    metrics = {
-        "cpu_usage": 0,  # TODO: Implement actual CPU monitoring
-        "memory_usage": 0,  # TODO: Implement actual memory monitoring
-        "active_connections": sum(len(connections) for connections in dashboard_manager.active_connections.values())
-    }
-    await dashboard_manager.broadcast_metrics(metrics)
+    """Push the latest full sample to all metrics clients (the sampler sends deltas)"""
+    await dashboard_manager.broadcast_metrics(system_metrics.latest())
 
 async def send_system_alert(alert_type: str, message: str):
     """Send system alerts to all connected admin clients"""
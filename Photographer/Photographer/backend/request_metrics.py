@@ -0,0 +1,280 @@
+import contextvars
+import logging
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Deque, Dict, Optional, Set
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets in ms; one more bucket takes anything slower
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Requests that matched no route share one label, so scanners can't grow the table
+UNMATCHED = "unmatched"
+
+
+class RequestStats:
+    """SQL done on behalf of the current request"""
+
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+# Copied into threadpool calls and run_sync, so statements run there are counted too
+_current_request: "contextvars.ContextVar[Optional[RequestStats]]" = contextvars.ContextVar(
+    "current_request", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _current_request.get()
+
+
+class Histogram:
+    """Counts per fixed latency bucket; quantiles are interpolated within a bucket"""
+
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, ms: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, in_bucket in enumerate(self.buckets):
+            if in_bucket and seen + in_bucket >= rank:
+                if i == len(LATENCY_BUCKETS_MS):
+                    return float(LATENCY_BUCKETS_MS[-1])
+                lower = LATENCY_BUCKETS_MS[i - 1] if i else 0.0
+                return lower + (LATENCY_BUCKETS_MS[i] - lower) * (rank - seen) / in_bucket
+            seen += in_bucket
+        return float(LATENCY_BUCKETS_MS[-1])
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else None,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": {
+                **{str(bound): n for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                "+Inf": self.buckets[-1],
+            },
+        }
+
+
+class RouteStats:
+    __slots__ = ("latency", "errors", "queries", "db_time", "max_queries", "flagged")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0  # 5xx responses
+        self.queries = 0
+        self.db_time = 0.0
+        self.max_queries = 0
+        self.flagged = 0
+
+    def to_dict(self) -> dict:
+        count = self.latency.count
+        return {
+            **self.latency.to_dict(),
+            "errors": self.errors,
+            "queries_per_request": self.queries / count if count else 0.0,
+            "max_queries": self.max_queries,
+            "db_ms_per_request": self.db_time * 1000 / count if count else 0.0,
+            "flagged": self.flagged,
+        }
+
+
+class RequestMetrics:
+    """Per-route latency histograms and SQL accounting for HTTP requests.
+
+    ``RequestMetricsMiddleware`` times each request and puts a ``RequestStats``
+    in a context variable, which engine events registered by ``instrument``
+    fill with the statement count and DB time. Requests issuing more than
+    ``query_threshold`` statements, which is usually an N+1 through a lazy
+    relationship, are flagged and the latest ones kept for inspection.
+    """
+
+    def __init__(self, enabled: bool = True, query_threshold: int = 20, flagged_size: int = 50):
+        self.enabled = enabled
+        self.query_threshold = query_threshold
+        self.routes: Dict[str, RouteStats] = {}
+        self.recent_flagged: Deque[dict] = deque(maxlen=flagged_size)
+        self._logged_routes: Set[str] = set()
+        self._instrumented: Set[int] = set()
+        # Since the last collect(), for the system metrics sampler
+        self._window = RouteStats()
+        self._window_started = time.monotonic()
+
+        self.requests = 0
+
+    def instrument(self, engine: Engine):
+        """Count the statements ``engine`` runs against the current request"""
+        if id(engine) in self._instrumented:
+            return
+        self._instrumented.add(id(engine))
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = _current_request.get()
+        if stats is None:
+            return
+        stats.queries += 1
+        if context is not None:
+            context._request_query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_request_query_started", None)
+        if started is not None:
+            stats = _current_request.get()
+            if stats is not None:
+                stats.db_time += time.perf_counter() - started
+
+    def record(self, route: str, status_code: int, duration: float, stats: RequestStats):
+        ms = duration * 1000
+        self.requests += 1
+        route_stats = self.routes.get(route)
+        if route_stats is None:
+            route_stats = self.routes[route] = RouteStats()
+        for aggregate in (route_stats, self._window):
+            aggregate.latency.observe(ms)
+            aggregate.queries += stats.queries
+            aggregate.db_time += stats.db_time
+            aggregate.max_queries = max(aggregate.max_queries, stats.queries)
+            if status_code >= 500:
+                aggregate.errors += 1
+        if stats.queries > self.query_threshold:
+            self._flag(route, status_code, ms, stats)
+
+    def _flag(self, route: str, status_code: int, ms: float, stats: RequestStats):
+        self.routes[route].flagged += 1
+        self._window.flagged += 1
+        self.recent_flagged.append({
+            "route": route,
+            "status": status_code,
+            "queries": stats.queries,
+            "db_ms": round(stats.db_time * 1000, 2),
+            "duration_ms": round(ms, 2),
+            "at": time.time(),
+        })
+        # Once per route; the counts keep going up in the metrics
+        if route not in self._logged_routes:
+            self._logged_routes.add(route)
+            logger.warning("%s issued %d SQL statements (threshold %d), possibly an N+1 query",
+                           route, stats.queries, self.query_threshold)
+
+    def collect(self) -> Dict[str, float]:
+        """Aggregates since the previous call; registered with the system metrics sampler"""
+        now = time.monotonic()
+        window, elapsed = self._window, now - self._window_started
+        self._window, self._window_started = RouteStats(), now
+        count = window.latency.count
+        return {
+            "http_requests_per_s": count / elapsed if elapsed > 0 else 0.0,
+            "http_p95_ms": window.latency.quantile(0.95) or 0.0,
+            "http_5xx": window.errors,
+            "sql_per_request": window.queries / count if count else 0.0,
+            "sql_ms_per_request": window.db_time * 1000 / count if count else 0.0,
+            "flagged_requests": window.flagged,
+        }
+
+    def snapshot(self) -> dict:
+        """Every route's aggregates, the ones taking the most total time first"""
+        routes = sorted(self.routes.items(), key=lambda item: -item[1].latency.total)
+        return {
+            "query_threshold": self.query_threshold,
+            "routes": {route: stats.to_dict() for route, stats in routes},
+            "recent_flagged": list(self.recent_flagged),
+        }
+
+    def reset(self):
+        self.routes.clear()
+        self.recent_flagged.clear()
+        self._logged_routes.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "routes": len(self.routes),
+            "flagged": sum(stats.flagged for stats in self.routes.values()),
+        }
+
+
+request_metrics = RequestMetrics(
+    enabled=settings.REQUEST_METRICS_ENABLED,
+    query_threshold=settings.REQUEST_QUERY_THRESHOLD,
+    flagged_size=settings.REQUEST_FLAGGED_HISTORY,
+)
+metrics_registry.register("requests", lambda: {**request_metrics.metrics(), **request_metrics.snapshot()})
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware feeding ``request_metrics``.
+
+    Requests are labelled with the method and the route's path template (e.g.
+    ``GET /photographers/{photographer_id}``), looked up from the endpoint the
+    router stored in the scope.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+        self._paths: Dict[int, Dict[object, str]] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            _current_request.reset(token)
+            self.metrics.record(f"{scope['method']} {self._route_path(scope)}", status_code, duration, stats)
+
+    def _route_path(self, scope) -> str:
+        route = scope.get("route")
+        if route is not None:
+            return route.path
+        endpoint, app = scope.get("endpoint"), scope.get("app")
+        if endpoint is None or app is None:
+            return UNMATCHED
+        paths = self._paths.get(id(app))
+        if paths is None:
+            paths = self._paths[id(app)] = {
+                getattr(route, "endpoint", None) or getattr(route, "app", None): route.path
+                for route in getattr(app, "routes", ())
+            }
+        return paths.get(endpoint, UNMATCHED)
@@ -0,0 +1,215 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Hashable, Optional, Set, Tuple
+from sqlalchemy import event
+from starlette.requests import Request
+from starlette.responses import Response
+from .config import settings
+from .database import (
+    UserModel, PhotographerModel, BookingModel, run_after_commit, previous_value, booking_bulk_insert_listeners,
+    after_bulk_change,
+)
+from .location_buffer import location_buffer
+from .message_bus import message_bus
+from .metrics_registry import metrics_registry
+
+# (resource, id), e.g. ("photographer", 12); a cache key adds the representation
+Resource = Tuple[str, int]
+CacheKey = Tuple[str, int, str]
+
+
+def make_etag(resource: str, resource_id: int, variant: str, version: Hashable) -> str:
+    """Strong ETag for one representation of a resource at ``version`` (its updated_at)"""
+    digest = hashlib.blake2b(repr((resource, resource_id, variant, version)).encode(), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    etag: str
+    body: bytes
+    # Users allowed to read it; None when it is public
+    viewers: Optional[FrozenSet[int]] = None
+
+
+class ResponseCache:
+    """Bounded LRU cache of rendered GET responses, with ETags.
+
+    Entries are keyed by resource, id and representation (e.g. the selected
+    fields) and dropped when the resource changes. As in ``AuthUserCache``,
+    callers read ``version`` before querying and pass it back to ``put``, so a
+    response rendered from a row that changed meanwhile is not cached.
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self._keys_by_resource: Dict[Resource, Set[CacheKey]] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: CacheKey) -> Optional[CachedResponse]:
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached
+
+    def put(self, key: CacheKey, cached: CachedResponse, version: int):
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = cached
+            self._entries.move_to_end(key)
+            self._keys_by_resource.setdefault(key[:2], set()).add(key)
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                self._forget_key(evicted)
+                self.evictions += 1
+
+    def _forget_key(self, key: CacheKey):
+        keys = self._keys_by_resource.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_resource[key[:2]]
+
+    def invalidate(self, *resources: Resource):
+        with self._lock:
+            self.version += 1
+            for resource in resources:
+                for key in self._keys_by_resource.pop(resource, ()):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._keys_by_resource.clear()
+
+    def respond(self, request: Request, cached: CachedResponse) -> Response:
+        """200 with the cached body, or 304 if the client already has it"""
+        headers = {"ETag": cached.etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), cached.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(cached.body, media_type="application/json", headers=headers)
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(max_size=settings.RESPONSE_CACHE_MAX_SIZE)
+metrics_registry.register("response_cache", response_cache.metrics)
+
+
+def _invalidate(*resources: Resource):
+    """Drop the resources here and on every other worker, after commit"""
+    def apply():
+        response_cache.invalidate(*resources)
+        message_bus.publish('response_cache', [list(resource) for resource in resources])
+    return apply
+
+
+@event.listens_for(UserModel, 'after_update')
+@event.listens_for(UserModel, 'after_delete')
+def _user_changed(mapper, connection, target):
+    # Photographer responses include the user's name
+    run_after_commit(target, _invalidate(("photographer", target.id)))
+
+
+@event.listens_for(PhotographerModel, 'after_update')
+@event.listens_for(PhotographerModel, 'after_delete')
+def _photographer_changed(mapper, connection, target):
+    user_ids = {target.user_id, previous_value(target, 'user_id')}
+    run_after_commit(target, _invalidate(*(("photographer", user_id) for user_id in user_ids)))
+
+
+def _counted(target, value=getattr) -> bool:
+    # Bookings that count towards photographers.total_bookings
+    return value(target, 'status') == 'completed' and value(target, 'deleted_at') is None
+
+
+@event.listens_for(BookingModel, 'after_insert')
+def _booking_inserted(mapper, connection, target):
+    if _counted(target):
+        run_after_commit(target, _invalidate(("photographer", target.photographer_id)))
+
+
+@event.listens_for(BookingModel, 'after_update')
+@event.listens_for(BookingModel, 'after_delete')
+def _booking_changed(mapper, connection, target):
+    resources = {("booking", target.id)}
+    if _counted(target, previous_value):
+        resources.add(("photographer", previous_value(target, 'photographer_id')))
+    if _counted(target):
+        resources.add(("photographer", target.photographer_id))
+    run_after_commit(target, _invalidate(*resources))
+
+
+def _bulk_inserted(rows):
+    photographer_ids = {row['photographer_id'] for row in rows if row['status'] == 'completed'}
+    if photographer_ids:
+        _invalidate(*(("photographer", pid) for pid in photographer_ids))()
+
+booking_bulk_insert_listeners.append(_bulk_inserted)
+
+
+def _locations_flushed(photographer_ids):
+    # Photographer responses include current_location, written outside the ORM
+    _invalidate(*(("photographer", pid) for pid in photographer_ids))()
+
+location_buffer.listeners.append(_locations_flushed)
+
+
+def _clear_all():
+    response_cache.clear()
+    message_bus.publish('response_cache', None)
+
+after_bulk_change(_clear_all, UserModel, PhotographerModel, BookingModel)
+
+
+def _remote_change(resources, origin):
+    if resources is None:
+        response_cache.clear()
+    else:
+        response_cache.invalidate(*(tuple(resource) for resource in resources))
+
+message_bus.subscribe('response_cache', _remote_change)
@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .background import BackgroundTask
+from .config import settings
+from .database import (
+    SessionLocal, BookingModel, run_after_commit, previous_value, booking_bulk_insert_listeners, after_bulk_change,
+)
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# bucket start -> [revenue, completed bookings]
+Buckets = Dict[datetime, List[float]]
+
+TIMEFRAMES = ("day", "week", "month", "year")
+
+
+def _hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _day(moment: datetime) -> datetime:
+    return datetime.combine(moment.date(), datetime.min.time())
+
+def _add(hourly: Buckets, daily: Buckets, booking_date: datetime, revenue: float, bookings: int):
+    for buckets, start in ((hourly, _hour(booking_date)), (daily, _day(booking_date))):
+        bucket = buckets.get(start)
+        if bucket is None:
+            bucket = buckets[start] = [0.0, 0]
+        bucket[0] += revenue
+        bucket[1] += bookings
+        if not bucket[1]:
+            del buckets[start]
+
+
+class RevenueRollup:
+    """Completed-booking revenue and counts in hourly and daily buckets.
+
+    Bookings count towards the bucket of their ``booking_date`` once they are
+    completed; status, amount and date changes move them between buckets as
+    they commit. Hourly buckets are only kept for ``hourly_retention_days``
+    (enough for the day chart); longer charts merge daily buckets. Each chart
+    is cached until a change lands inside its window or its window moves.
+    Changes that commit during a rebuild are replayed onto its buckets.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 hourly_retention_days: int = 2, rebuild_interval: float = 3600.0):
+        self.session_factory = session_factory
+        self.hourly_retention_days = hourly_retention_days
+        self.rebuild_interval = rebuild_interval
+        self._hourly: Buckets = {}
+        self._daily: Buckets = {}
+        # Changes come from after-commit hooks, which may run on executor threads
+        self._lock = threading.Lock()
+        # Changes made while a rebuild is loading, to replay onto its buckets
+        self._journal: Optional[List[Tuple[datetime, float, int]]] = None
+        # timeframe -> (window start, window anchor, chart)
+        self._charts: Dict[str, Tuple[datetime, datetime, dict]] = {}
+        self._worker = BackgroundTask(self._run)
+
+        self.chart_hits = 0
+        self.chart_misses = 0
+        self.rebuilds = 0
+        self.replayed_changes = 0
+
+    def add(self, booking_date: datetime, revenue: float, bookings: int):
+        with self._lock:
+            _add(self._hourly, self._daily, booking_date, revenue, bookings)
+            if self._journal is not None:
+                self._journal.append((booking_date, revenue, bookings))
+            for timeframe, (window_start, _, _) in list(self._charts.items()):
+                if booking_date >= window_start:
+                    del self._charts[timeframe]
+
+    def prune(self, now: Optional[datetime] = None):
+        cutoff = _hour(now or datetime.utcnow()) - timedelta(days=self.hourly_retention_days)
+        with self._lock:
+            for start in [start for start in self._hourly if start < cutoff]:
+                del self._hourly[start]
+
+    # Charts
+
+    def chart(self, timeframe: str, now: Optional[datetime] = None) -> dict:
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f"Unknown timeframe {timeframe!r}")
+        now = now or datetime.utcnow()
+        anchor = _hour(now) if timeframe == "day" else _day(now)
+        with self._lock:
+            return self._chart(timeframe, anchor)
+
+    def _chart(self, timeframe: str, anchor: datetime) -> dict:
+        cached = self._charts.get(timeframe)
+        if cached is not None and cached[1] == anchor:
+            self.chart_hits += 1
+            return cached[2]
+        self.chart_misses += 1
+        if timeframe == "day":
+            starts = [anchor - timedelta(hours=n) for n in range(23, -1, -1)]
+            points = [(start.strftime("%H:00"), self._hourly.get(start, (0.0, 0))) for start in starts]
+            window_start = starts[0]
+        elif timeframe in ("week", "month"):
+            days = 7 if timeframe == "week" else 30
+            starts = [anchor - timedelta(days=n) for n in range(days - 1, -1, -1)]
+            points = [(start.date().isoformat(), self._daily.get(start, (0.0, 0))) for start in starts]
+            window_start = starts[0]
+        else:
+            points, window_start = self._monthly_points(anchor.date())
+        chart = {
+            "labels": [label for label, _ in points],
+            "data": [round(bucket[0], 2) for _, bucket in points],
+            "bookings": [int(bucket[1]) for _, bucket in points],
+        }
+        self._charts[timeframe] = (window_start, anchor, chart)
+        return chart
+
+    def _monthly_points(self, today: date):
+        """The last 12 calendar months, each merged from its daily buckets"""
+        months = []
+        year, month = today.year, today.month
+        for _ in range(12):
+            months.append((year, month))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        months.reverse()
+        totals = {key: [0.0, 0] for key in months}
+        window_start = datetime(months[0][0], months[0][1], 1)
+        for start, (revenue, bookings) in self._daily.items():
+            key = (start.year, start.month)
+            if start >= window_start and key in totals:
+                totals[key][0] += revenue
+                totals[key][1] += bookings
+        return [(f"{year}-{month:02d}", totals[(year, month)]) for year, month in months], window_start
+
+    # Backfill
+
+    def _load(self) -> Tuple[Buckets, Buckets]:
+        hourly: Buckets = {}
+        daily: Buckets = {}
+        hourly_cutoff = _hour(datetime.utcnow()) - timedelta(days=self.hourly_retention_days)
+        db = self.session_factory()
+        try:
+            rows = db.query(BookingModel.booking_date, BookingModel.total_amount).filter(
+                BookingModel.status == 'completed', BookingModel.deleted_at.is_(None),
+            ).yield_per(5000)
+            for booking_date, amount in rows:
+                keyed = [(daily, _day(booking_date))]
+                if booking_date >= hourly_cutoff:
+                    keyed.append((hourly, _hour(booking_date)))
+                for buckets, start in keyed:
+                    bucket = buckets.setdefault(start, [0.0, 0])
+                    bucket[0] += amount or 0.0
+                    bucket[1] += 1
+        finally:
+            db.close()
+        return hourly, daily
+
+    async def rebuild(self):
+        """Backfill every bucket from ``bookings``.
+
+        A change whose commit the query already saw is counted twice until
+        the next rebuild; the window is the moment before the query starts.
+        """
+        with self._lock:
+            self._journal = []
+        loop = asyncio.get_event_loop()
+        try:
+            hourly, daily = await loop.run_in_executor(None, self._load)
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            for change in self._journal:
+                _add(hourly, daily, *change)
+            self.replayed_changes += len(self._journal)
+            self._journal = None
+            self._hourly, self._daily = hourly, daily
+            self._charts.clear()
+        self.rebuilds += 1
+
+    def request_rebuild(self):
+        self._worker.wake()
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebuild()
+            except Exception:
+                logger.exception("Revenue rollup rebuild failed")
+            self.prune()
+            await self._worker.sleep(self.rebuild_interval)
+
+    def metrics(self) -> dict:
+        return {
+            "hourly_buckets": len(self._hourly),
+            "daily_buckets": len(self._daily),
+            "cached_charts": len(self._charts),
+            "chart_hits": self.chart_hits,
+            "chart_misses": self.chart_misses,
+            "rebuilds": self.rebuilds,
+            "replayed_changes": self.replayed_changes,
+        }
+
+
+revenue_rollup = RevenueRollup(
+    hourly_retention_days=settings.REVENUE_HOURLY_RETENTION_DAYS,
+    rebuild_interval=settings.REVENUE_ROLLUP_REBUILD_INTERVAL,
+)
+metrics_registry.register("revenue_rollup", revenue_rollup.metrics)
+
+
+def _completed(target, value=getattr) -> Optional[Tuple[datetime, float]]:
+    if value(target, 'status') != 'completed' or value(target, 'deleted_at') is not None:
+        return None
+    return value(target, 'booking_date'), value(target, 'total_amount') or 0.0
+
+
+def _move(old: Optional[Tuple[datetime, float]], new: Optional[Tuple[datetime, float]]):
+    def apply():
+        if old is not None:
+            revenue_rollup.add(old[0], -old[1], -1)
+        if new is not None:
+            revenue_rollup.add(new[0], new[1], 1)
+    return apply
+
+
+@event.listens_for(BookingModel, 'after_insert')
+def _booking_inserted(mapper, connection, target):
+    new = _completed(target)
+    if new is not None:
+        run_after_commit(target, _move(None, new))
+
+
+@event.listens_for(BookingModel, 'after_update')
+def _booking_updated(mapper, connection, target):
+    old, new = _completed(target, previous_value), _completed(target)
+    if old != new:
+        run_after_commit(target, _move(old, new))
+
+
+@event.listens_for(BookingModel, 'after_delete')
+def _booking_deleted(mapper, connection, target):
+    old = _completed(target, previous_value)
+    if old is not None:
+        run_after_commit(target, _move(old, None))
+
+
+def _bulk_inserted(rows):
+    for row in rows:
+        if row['status'] == 'completed' and row['deleted_at'] is None:
+            revenue_rollup.add(row['booking_date'], row['total_amount'] or 0.0, 1)
+
+booking_bulk_insert_listeners.append(_bulk_inserted)
+
+
+after_bulk_change(revenue_rollup.request_rebuild, BookingModel)
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from .background import BackgroundTask
+from .config import settings
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _read(path: str) -> str:
+    with open(path) as f:
+        return f.read()
+
+
+class SystemMetricsSampler:
+    """Samples host and process stats from /proc on a fixed interval.
+
+    Every metric keeps the last ``history_size`` samples in a ring buffer, so
+    memory and the cost of a sample stay constant. Listeners receive only the
+    metrics whose value changed since the previous sample. Extra gauges (e.g.
+    connection counts) can be registered in ``gauges``, and ``collectors``
+    return several values at once.
+    """
+
+    def __init__(self, interval: float = 5.0, history_size: int = 720, precision: int = 1):
+        self.interval = interval
+        self.precision = precision
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.collectors: List[Callable[[], Dict[str, float]]] = []
+        self.listeners: List[Callable[[Dict[str, float]], object]] = []
+        self._timestamps: Deque[float] = deque(maxlen=history_size)
+        self._history: Dict[str, Deque[float]] = {}
+        self._latest: Dict[str, float] = {}
+        # Counters from the previous sample, to turn CPU jiffies into percentages
+        self._previous: Optional[Tuple[float, int, int, int]] = None
+        self._worker = BackgroundTask(self._run)
+        self._proc_available = os.path.exists("/proc/self/stat")
+
+        self.samples = 0
+        self.last_sample_duration = 0.0
+
+    def _read_proc(self) -> Dict[str, float]:
+        values: Dict[str, float] = {}
+        now = time.monotonic()
+
+        cpu = [int(v) for v in _read("/proc/stat").split("\n", 1)[0].split()[1:]]
+        host_total, host_idle = sum(cpu[:8]), cpu[3] + cpu[4]
+        stat = _read("/proc/self/stat").rsplit(")", 1)[1].split()
+        process_jiffies = int(stat[11]) + int(stat[12])
+        values["threads"] = int(stat[17])
+
+        if self._previous is not None:
+            last_time, last_process, last_total, last_idle = self._previous
+            elapsed = now - last_time
+            total_delta = host_total - last_total
+            if total_delta > 0:
+                values["cpu_usage"] = 100.0 * (1 - (host_idle - last_idle) / total_delta)
+            if elapsed > 0:
+                values["process_cpu"] = 100.0 * (process_jiffies - last_process) / _CLOCK_TICKS / elapsed
+        self._previous = (now, process_jiffies, host_total, host_idle)
+
+        meminfo = {}
+        for line in _read("/proc/meminfo").splitlines():
+            name, _, rest = line.partition(":")
+            if name in ("MemTotal", "MemAvailable"):
+                meminfo[name] = int(rest.split()[0])
+        if meminfo.get("MemTotal"):
+            values["memory_usage"] = 100.0 * (1 - meminfo.get("MemAvailable", 0) / meminfo["MemTotal"])
+        values["process_rss_mb"] = int(_read("/proc/self/statm").split()[1]) * _PAGE_SIZE / 1_048_576
+        values["load_1m"] = float(_read("/proc/loadavg").split()[0])
+        values["open_fds"] = len(os.listdir("/proc/self/fd"))
+        return values
+
+    def sample(self) -> Dict[str, float]:
+        """Take one sample; returns the metrics that changed"""
+        started = time.perf_counter()
+        values: Dict[str, float] = {}
+        if self._proc_available:
+            try:
+                values.update(self._read_proc())
+            except (OSError, ValueError, IndexError):
+                logger.exception("Cannot read /proc, system metrics disabled")
+                self._proc_available = False
+        for name, gauge in self.gauges.items():
+            try:
+                values[name] = gauge()
+            except Exception:
+                logger.exception("Metric gauge %r failed", name)
+        for collector in self.collectors:
+            try:
+                values.update(collector())
+            except Exception:
+                logger.exception("Metric collector %r failed", collector)
+
+        self._timestamps.append(time.time())
+        changed = {}
+        for name, value in values.items():
+            value = round(value, self.precision)
+            history = self._history.get(name)
+            if history is None:
+                # Keep every series aligned with the shared timestamps
+                history = self._history[name] = deque(
+                    [None] * (len(self._timestamps) - 1), maxlen=self._timestamps.maxlen)
+            history.append(value)
+            if self._latest.get(name) != value:
+                changed[name] = value
+            self._latest[name] = value
+        for name, history in self._history.items():
+            if name not in values:
+                history.append(None)
+        self.samples += 1
+        self.last_sample_duration = time.perf_counter() - started
+        return changed
+
+    def latest(self) -> Dict[str, float]:
+        return dict(self._latest)
+
+    def snapshot(self) -> dict:
+        """Compact history: shared timestamps plus one value list per metric"""
+        return {
+            "interval": self.interval,
+            "timestamps": [round(t, 1) for t in self._timestamps],
+            "series": {name: list(history) for name, history in self._history.items()},
+        }
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+
+    async def _run(self):
+        while True:
+            changed = self.sample()
+            if changed:
+                for listener in self.listeners:
+                    try:
+                        result = listener(changed)
+                        if asyncio.iscoroutine(result):
+                            await result
+                    except Exception:
+                        logger.exception("System metrics listener failed")
+            await asyncio.sleep(self.interval)
+
+    def metrics(self) -> dict:
+        return {
+            "samples": self.samples,
+            "history_length": len(self._timestamps),
+            "last_sample_duration_ms": self.last_sample_duration * 1000,
+            "proc_available": self._proc_available,
+        }
+
+
+system_metrics = SystemMetricsSampler(
+    interval=settings.SYSTEM_METRICS_INTERVAL,
+    history_size=settings.SYSTEM_METRICS_HISTORY,
+)
+metrics_registry.register("system_metrics", system_metrics.metrics)
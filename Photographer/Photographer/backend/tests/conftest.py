@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Import the app as the backend package, like `python -m backend.main` from the project directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# Settings and engines are created at import time, so point them at a scratch database first
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db"))
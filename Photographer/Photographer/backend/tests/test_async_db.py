@@ -0,0 +1,85 @@
+"""Concurrent requests must not queue behind each other's slow queries."""
+import asyncio
+import time
+
+import pytest
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import run_db
+from backend.benchmarks._asgi import asgi_request
+
+REQUESTS = 8
+QUERY_SECONDS = 0.2
+SLOW_QUERY = text("SELECT slow_sleep(:seconds)")
+
+
+def _register_slow_sleep(dbapi_connection, connection_record):
+    def slow_sleep(seconds):
+        time.sleep(seconds)
+        return 1
+    dbapi_connection.create_function("slow_sleep", 1, slow_sleep)
+
+
+def _slow(session):
+    return session.execute(SLOW_QUERY, {"seconds": QUERY_SECONDS}).scalar()
+
+
+def build_app(mode: str, path) -> FastAPI:
+    app = FastAPI()
+    if mode == "async":
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        event.listen(engine.sync_engine, "connect", _register_slow_sleep)
+        Sessions = sessionmaker(engine, class_=AsyncSession)
+
+        async def get_db():
+            async with Sessions() as db:
+                yield db
+    else:
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        event.listen(engine, "connect", _register_slow_sleep)
+        Sessions = sessionmaker(bind=engine)
+
+        def get_db():
+            db = Sessions()
+            try:
+                yield db
+            finally:
+                db.close()
+
+    if mode == "blocking":
+        # The pattern run_db replaced: sync queries straight from an async route
+        @app.get("/slow")
+        async def slow_blocking(db=Depends(get_db)):
+            return _slow(db)
+    else:
+        @app.get("/slow")
+        async def slow(db=Depends(get_db)):
+            return await run_db(db, _slow)
+
+    return app
+
+
+def burst(app: FastAPI) -> float:
+    async def run():
+        await asgi_request(app, "GET", "/slow")  # open the first connection
+        started = time.perf_counter()
+        results = await asyncio.gather(*(asgi_request(app, "GET", "/slow") for _ in range(REQUESTS)))
+        assert all(status == 200 for status, _, _ in results)
+        return time.perf_counter() - started
+    return asyncio.run(run())
+
+
+def test_blocking_route_serializes_requests(tmp_path):
+    # Shows the burst would catch serialization
+    assert burst(build_app("blocking", tmp_path / "db.sqlite")) >= REQUESTS * QUERY_SECONDS * 0.9
+
+
+@pytest.mark.parametrize("mode", ["threadpool", "async"])
+def test_run_db_runs_requests_concurrently(mode, tmp_path):
+    if mode == "async":
+        pytest.importorskip("aiosqlite")
+    elapsed = burst(build_app(mode, tmp_path / "db.sqlite"))
+    assert elapsed < REQUESTS * QUERY_SECONDS / 2
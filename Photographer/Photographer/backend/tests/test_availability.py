@@ -0,0 +1,83 @@
+"""Overlap checks find bookings longer than BOOKING_MAX_DURATION_HOURS (imported or older rows)."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, pool
+from sqlalchemy.orm import sessionmaker
+
+from backend.availability import AvailabilityIndex, PhotographerSchedule
+from backend.database import Base, PhotographerModel, UserModel, bulk_insert_bookings
+
+HOUR = 3600.0
+
+
+@pytest.fixture
+def sessions():
+    engine = create_engine("sqlite://", poolclass=pool.StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    Sessions = sessionmaker(bind=engine)
+    session = Sessions()
+    customer = UserModel(email="customer@example.com", full_name="C", hashed_password="x", user_type="customer")
+    photographer = UserModel(email="p@example.com", full_name="P", hashed_password="x", user_type="photographer")
+    session.add_all([customer, photographer])
+    session.commit()
+    session.add(PhotographerModel(user_id=photographer.id, hourly_rate=1000, city="Pune"))
+    session.commit()
+    Sessions.ids = customer.id, photographer.id
+    session.close()
+    try:
+        yield Sessions
+    finally:
+        engine.dispose()
+
+
+def insert_booking(Sessions, booking_date: datetime, duration_hours: float):
+    customer_id, photographer_id = Sessions.ids
+    db = Sessions()
+    try:
+        # Like backend.bulk_io, which does not apply the POST /bookings/ duration limit
+        bulk_insert_bookings(db, [dict(customer_id=customer_id, photographer_id=photographer_id,
+                                       booking_date=booking_date, duration_hours=duration_hours,
+                                       status="confirmed", location={}, total_amount=0.0)])
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_schedule_finds_an_interval_longer_than_max_duration():
+    schedule = PhotographerSchedule(max_duration=8 * HOUR)
+    schedule.add(0.0, 72 * HOUR, "long")
+    schedule.add(100 * HOUR, 101 * HOUR, "short")
+
+    assert schedule.conflict(48 * HOUR, 49 * HOUR) == "long"
+    assert schedule.conflict(80 * HOUR, 90 * HOUR) is None
+
+
+def test_find_conflict_sees_a_booking_longer_than_the_configured_maximum(sessions):
+    availability = AvailabilityIndex(session_factory=sessions, max_booking_hours=24)
+    start = datetime(2030, 1, 1)
+    insert_booking(sessions, start, duration_hours=72)
+    photographer_id = sessions.ids[1]
+
+    db = sessions()
+    try:
+        requested = start + timedelta(hours=48)
+        assert availability.find_conflict(db, photographer_id, requested, requested + timedelta(hours=2)) is not None
+        after = start + timedelta(hours=72)
+        assert availability.find_conflict(db, photographer_id, after, after + timedelta(hours=2)) is None
+    finally:
+        db.close()
+
+
+def test_loaded_schedule_keeps_a_running_booking_longer_than_the_configured_maximum(sessions):
+    availability = AvailabilityIndex(session_factory=sessions, max_booking_hours=24)
+    now = datetime.utcnow()
+    insert_booking(sessions, now - timedelta(hours=48), duration_hours=96)
+    insert_booking(sessions, now - timedelta(hours=200), duration_hours=96)  # over, not kept
+    photographer_id = sessions.ids[1]
+
+    asyncio.run(availability.ensure_loaded([photographer_id]))
+
+    assert availability.conflict(photographer_id, now + timedelta(hours=40), now + timedelta(hours=41)) is not None
+    assert availability.metrics()["intervals"] == 1
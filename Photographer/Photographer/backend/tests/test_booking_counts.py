@@ -0,0 +1,113 @@
+"""photographers.total_bookings stays correct with a fixed number of UPDATEs per flush."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, event, func, pool
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base, BookingModel, PhotographerModel, UserModel, bulk_insert_bookings
+
+PHOTOGRAPHERS = 5
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=pool.StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    customer = UserModel(email="customer@example.com", full_name="C", hashed_password="x", user_type="customer")
+    users = [UserModel(email=f"p{i}@example.com", full_name="P", hashed_password="x", user_type="photographer")
+             for i in range(PHOTOGRAPHERS)]
+    session.add_all([customer, *users])
+    session.commit()
+    session.add_all([PhotographerModel(user_id=user.id, hourly_rate=1000, city="Pune") for user in users])
+    session.commit()
+    session.info["customer_id"] = customer.id
+    session.info["photographer_ids"] = [user.id for user in users]
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def statements(db):
+    """Statements the session's engine runs, by verb and table for UPDATEs"""
+    seen = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        words = statement.split(None, 2)
+        seen.append(" ".join(words[:2]) if words[0] == "UPDATE" else words[0])
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", count)
+    yield seen
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def rows(db, count: int, status: str):
+    ids = db.info["photographer_ids"]
+    start = datetime(2030, 1, 1)
+    return [
+        dict(customer_id=db.info["customer_id"], photographer_id=ids[i % len(ids)],
+             booking_date=start + timedelta(hours=3 * i), duration_hours=2, status=status,
+             location={}, total_amount=2000.0)
+        for i in range(count)
+    ]
+
+
+def counts(db) -> dict:
+    return dict(db.query(PhotographerModel.user_id, PhotographerModel.total_bookings))
+
+
+def total(db) -> int:
+    return db.query(func.sum(PhotographerModel.total_bookings)).scalar()
+
+
+@pytest.mark.parametrize("n", [10, 200])
+def test_orm_inserts_issue_one_count_update_per_flush(db, statements, n):
+    db.add_all([BookingModel(**row) for row in rows(db, n, "completed")])
+    statements.clear()
+    db.commit()
+    assert statements.count("UPDATE photographers") == 1
+    assert total(db) == n
+
+
+@pytest.mark.parametrize("n", [10, 200])
+def test_status_transitions_are_counted_in_one_update(db, statements, n):
+    db.add_all([BookingModel(**row) for row in rows(db, n, "pending")])
+    db.commit()
+    assert total(db) == 0
+    for booking in db.query(BookingModel):
+        booking.status = "completed"
+    statements.clear()
+    db.commit()
+    assert statements.count("UPDATE photographers") == 1
+    assert total(db) == n
+
+    # And back out again when a completed booking is cancelled or deleted
+    first, second = db.query(BookingModel).order_by(BookingModel.id).limit(2)
+    first.status = "cancelled"
+    db.delete(second)
+    db.commit()
+    assert total(db) == n - 2
+
+
+@pytest.mark.parametrize("n", [10, 200])
+def test_bulk_insert_is_two_statements(db, statements, n):
+    statements.clear()
+    assert bulk_insert_bookings(db, rows(db, n, "completed") + rows(db, n, "pending")) == 2 * n
+    db.commit()
+    assert statements == ["INSERT", "UPDATE photographers"]
+    assert total(db) == n
+    assert set(counts(db).values()) == {n // PHOTOGRAPHERS}
+
+
+def test_rollback_discards_deltas(db):
+    db.add_all([BookingModel(**row) for row in rows(db, 10, "completed")])
+    db.flush()
+    db.rollback()
+    db.add(BookingModel(**rows(db, 1, "completed")[0]))
+    db.commit()
+    assert total(db) == 1
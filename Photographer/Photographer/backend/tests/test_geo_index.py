@@ -0,0 +1,51 @@
+import asyncio
+import random
+import time
+
+from backend.geo_index import GeoIndex, haversine_km
+
+
+def test_nearest_with_few_photographers_far_apart_scans_instead_of_walking_rings():
+    index = GeoIndex(cell_size_deg=0.05)
+    index.update_location(1, 59.91, 10.75)     # Oslo
+    index.update_location(2, -33.87, 151.21)   # Sydney
+
+    started = time.perf_counter()
+    results = index.nearest(59.9, 10.7, 10)
+
+    assert time.perf_counter() - started < 0.5
+    assert [result["user_id"] for result in results] == ["1", "2"]
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(3)
+    index = GeoIndex(cell_size_deg=0.05, max_rings=20)
+    points = {}
+    for pid in range(300):
+        latitude, longitude = rng.uniform(18, 20), rng.uniform(72, 74)
+        if pid % 50 == 0:
+            latitude, longitude = rng.uniform(-60, 60), rng.uniform(-180, 180)
+        index.update_location(pid, latitude, longitude)
+        points[str(pid)] = (latitude, longitude)
+
+    for _ in range(50):
+        latitude, longitude, k = rng.uniform(17, 21), rng.uniform(71, 75), rng.randint(1, 30)
+        expected = sorted(points, key=lambda pid: haversine_km(latitude, longitude, *points[pid]))[:k]
+        assert [result["user_id"] for result in index.nearest(latitude, longitude, k)] == expected
+
+
+def test_started_index_prunes_positions_that_stopped_updating():
+    index = GeoIndex(cell_size_deg=0.05, max_age_seconds=0.05)
+
+    async def run():
+        await index.start()
+        try:
+            index.update_location(1, 59.91, 10.75)
+            await asyncio.sleep(0.2)
+        finally:
+            await index.stop()
+
+    asyncio.run(run())
+
+    assert len(index) == 0
+    assert index.nearest(59.9, 10.7, 1) == []
@@ -0,0 +1,197 @@
+"""GoogleTokenVerifier against a local stand-in for Google's certificate endpoint."""
+import asyncio
+import datetime
+import json
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.auth import crypt, jwt as google_jwt
+
+from backend.google_verifier import CertificateFetchError, GoogleCertificateCache, GoogleTokenVerifier
+
+CLIENT_ID = "test-client.apps.googleusercontent.com"
+
+
+class SigningKey:
+    def __init__(self, key_id: str):
+        self.key_id = key_id
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, key_id)])
+        now = datetime.datetime.utcnow()
+        cert = x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key()) \
+            .serial_number(x509.random_serial_number()) \
+            .not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=1)) \
+            .sign(key, hashes.SHA256())
+        self.cert_pem = cert.public_bytes(serialization.Encoding.PEM).decode()
+
+    def token(self, audience: str = CLIENT_ID, issuer: str = "https://accounts.google.com") -> str:
+        now = int(time.time())
+        claims = {"iss": issuer, "aud": audience, "sub": "1234", "email": "user@example.com",
+                  "iat": now, "exp": now + 600}
+        signer = crypt.RSASigner.from_string(self.private_pem, self.key_id)
+        return google_jwt.encode(signer, claims).decode()
+
+
+class CertServer:
+    """Serves ``keys`` as Google does, with configurable cache headers"""
+
+    def __init__(self, *keys: SigningKey):
+        self.keys = list(keys)
+        self.headers = {"Cache-Control": "public, max-age=600, must-revalidate", "Age": "100"}
+        self.status = 200
+        self.requests = 0
+
+    async def handle(self, request):
+        self.requests += 1
+        body = json.dumps({key.key_id: key.cert_pem for key in self.keys})
+        return web.Response(status=self.status, text=body, content_type="application/json", headers=self.headers)
+
+
+@asynccontextmanager
+async def serving(server: CertServer, unknown_key_interval: float = 0.0):
+    app = web.Application()
+    app.router.add_get("/certs", server.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    certificates = GoogleCertificateCache(f"http://127.0.0.1:{port}/certs", retry_delay=0.05,
+                                          unknown_key_interval=unknown_key_interval)
+    try:
+        yield certificates, GoogleTokenVerifier(certificates, CLIENT_ID)
+    finally:
+        await certificates.stop()
+        await runner.cleanup()
+
+
+@pytest.fixture(scope="module")
+def key():
+    return SigningKey("key-1")
+
+
+def test_verifies_locally_and_fetches_certificates_once(key):
+    server = CertServer(key)
+
+    async def run():
+        async with serving(server) as (certificates, verifier):
+            for _ in range(5):
+                claims = await verifier.verify(key.token())
+                assert claims["email"] == "user@example.com"
+            assert server.requests == 1
+            assert verifier.metrics()["verified"] == 5
+            assert verifier.metrics()["latency_ms_max"] > 0
+            # max-age minus Age
+            assert 495 < certificates._expires_at - time.monotonic() <= 500
+    asyncio.run(run())
+
+
+def test_without_max_age_the_default_ttl_applies(key):
+    server = CertServer(key)
+    server.headers = {"Cache-Control": "no-transform"}
+
+    async def run():
+        async with serving(server) as (certificates, verifier):
+            await verifier.verify(key.token())
+            assert certificates._expires_at - time.monotonic() > certificates.default_ttl - 5
+    asyncio.run(run())
+
+
+def test_expired_certificates_are_fetched_again(key):
+    server = CertServer(key)
+    server.headers = {"Cache-Control": "max-age=0"}
+
+    async def run():
+        async with serving(server) as (certificates, verifier):
+            await verifier.verify(key.token())
+            await verifier.verify(key.token())
+            assert server.requests == 2
+    asyncio.run(run())
+
+
+def test_unknown_key_id_forces_a_refresh(key):
+    rotated = SigningKey("key-2")
+    server = CertServer(key)
+
+    async def run():
+        async with serving(server) as (certificates, verifier):
+            await verifier.verify(key.token())
+            server.keys = [key, rotated]
+            await verifier.verify(rotated.token())
+            assert server.requests == 2
+    asyncio.run(run())
+
+
+def test_unknown_key_ids_refetch_at_most_once_per_interval(key):
+    unknown = SigningKey("key-unknown").token()
+    server = CertServer(key)
+
+    async def run():
+        async with serving(server, unknown_key_interval=0.5) as (certificates, verifier):
+            await verifier.verify(key.token())
+            await asyncio.sleep(0.6)
+            results = await asyncio.gather(*(verifier.verify(unknown) for _ in range(20)),
+                                           return_exceptions=True)
+            assert all(isinstance(result, ValueError) for result in results)
+            assert server.requests == 2
+            for _ in range(5):
+                with pytest.raises(ValueError):
+                    await verifier.verify(unknown)
+            assert server.requests == 2
+            assert certificates.unknown_key_refreshes_skipped == 5
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("claims", [{"audience": "someone-else"}, {"issuer": "https://evil.example.com"}])
+def test_rejects_wrong_audience_or_issuer(key, claims):
+    async def run():
+        async with serving(CertServer(key)) as (certificates, verifier):
+            with pytest.raises(ValueError):
+                await verifier.verify(key.token(**claims))
+            assert verifier.metrics()["rejected"] == 1
+    asyncio.run(run())
+
+
+def test_failed_refresh_keeps_expired_certificates(key):
+    server = CertServer(key)
+    server.headers = {"Cache-Control": "max-age=0"}
+
+    async def run():
+        async with serving(server) as (certificates, verifier):
+            await verifier.verify(key.token())
+            server.status = 503
+            await verifier.verify(key.token())
+            assert certificates.fetch_failures == 1
+    asyncio.run(run())
+
+
+def test_no_certificates_at_all_raises(key):
+    server = CertServer(key)
+    server.status = 503
+
+    async def run():
+        async with serving(server) as (certificates, verifier):
+            with pytest.raises(CertificateFetchError):
+                await verifier.verify(key.token())
+    asyncio.run(run())
+
+
+def test_background_refresh(key):
+    server = CertServer(key)
+    server.headers = {"Cache-Control": "max-age=0"}
+
+    async def run():
+        async with serving(server) as (certificates, verifier):
+            await certificates.start()
+            await asyncio.sleep(0.2)
+            assert server.requests >= 2
+            assert certificates._certs == {key.key_id: key.cert_pem}
+    asyncio.run(run())
@@ -0,0 +1,73 @@
+"""Positions reach socket subscribers in the shape each subscription expects, whichever route sent them."""
+import asyncio
+
+from backend.benchmarks._asgi import asgi_request
+from backend.location_fanout import LocationFanout
+
+
+def capture():
+    sent = []
+
+    async def emit(event, data, sid):
+        sent.append((sid, event, data))
+    return sent, emit
+
+
+def update(photographer_id, latitude=18.52, longitude=73.85):
+    return {"photographer_id": photographer_id, "latitude": latitude, "longitude": longitude,
+            "timestamp": "2030-01-01T00:00:00"}
+
+
+def test_global_subscribers_get_one_location_update_per_position():
+    sent, emit = capture()
+    fanout = LocationFanout(emit, min_interval=0.0)
+    fanout.subscribe_all("legacy")
+    fanout.subscribe_viewport("viewport", 18.0, 73.0, 19.0, 74.0)
+
+    fanout.publish(update("1"))
+    fanout.publish(update("2"))
+    asyncio.run(fanout.flush())
+
+    assert [(event, data) for sid, event, data in sent if sid == "legacy"] == [
+        ("location_update", update("1")), ("location_update", update("2"))]
+    assert [(event, data) for sid, event, data in sent if sid == "viewport"] == [
+        ("location_updates", {"updates": [update("1"), update("2")]})]
+
+
+def test_rest_location_update_reaches_socket_subscribers_without_a_bus(monkeypatch):
+    from backend import realtime
+    from backend.auth import create_tokens
+    from backend.database import SessionLocal, UserModel, init_db
+    from backend.main import app
+    from backend.message_bus import LocalMessageBus, message_bus
+
+    assert isinstance(message_bus, LocalMessageBus)
+    init_db()
+    db = SessionLocal()
+    try:
+        user = UserModel(email="rest-location@example.com", full_name="P", hashed_password="x",
+                         user_type="photographer")
+        db.add(user)
+        db.commit()
+        photographer_id, token = str(user.id), create_tokens({"sub": user.email, "is_admin": False})["access_token"]
+    finally:
+        db.close()
+
+    sent = []
+
+    async def emit(event, data, room=None):
+        sent.append((room, event, data))
+    monkeypatch.setattr(realtime.sio, "emit", emit)
+    realtime.location_fanout.subscribe_all("legacy")
+    try:
+        status, _, _ = asyncio.run(asgi_request(
+            app, "POST", "/location/update",
+            params={"photographer_id": photographer_id, "latitude": 18.52, "longitude": 73.85},
+            headers={"Authorization": f"Bearer {token}"}))
+        asyncio.run(realtime.location_fanout.flush())
+    finally:
+        realtime.location_fanout.unsubscribe("legacy")
+
+    assert status == 200
+    assert [(room, event, data["photographer_id"]) for room, event, data in sent] == [
+        ("legacy", "location_update", photographer_id)]
@@ -0,0 +1,50 @@
+"""Cached users are dropped on every worker when the row changes."""
+import asyncio
+
+import pytest
+
+from backend.database import SessionLocal, UserModel, init_db
+from backend.message_bus import LocalMessageBus, message_bus
+from backend.user_cache import CachedUser, auth_user_cache
+
+
+@pytest.fixture
+def other_worker():
+    """A second bus on the app bus's hub, standing in for another worker"""
+    bus = LocalMessageBus(hub=message_bus.hub)
+    received = []
+    bus.subscribe('auth_user_cache', lambda emails, origin: received.append(emails))
+    try:
+        yield bus, received
+    finally:
+        message_bus.hub.buses.remove(bus)
+
+
+def test_user_changes_are_published_to_other_workers(other_worker):
+    _, received = other_worker
+    init_db()
+    db = SessionLocal()
+    try:
+        user = UserModel(email="cached@example.com", full_name="C", hashed_password="x", user_type="customer")
+        db.add(user)
+        db.commit()
+        user.is_active = False
+        db.commit()
+    finally:
+        db.close()
+    asyncio.run(message_bus.flush())
+
+    assert received == [["cached@example.com"]]
+
+
+def test_invalidations_from_other_workers_drop_cached_users(other_worker):
+    bus, _ = other_worker
+    user = CachedUser(id=1, email="remote@example.com", full_name="R", user_type="customer",
+                      is_active=True, is_admin=False, deleted_at=None)
+    auth_user_cache.put(user, auth_user_cache.version)
+    assert auth_user_cache.get("remote@example.com") == user
+
+    bus.publish('auth_user_cache', ["remote@example.com"])
+    asyncio.run(bus.flush())
+
+    assert auth_user_cache.get("remote@example.com") is None
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from .background import BackgroundTask
+from .config import settings
+from .database import SessionLocal, ChatMessageModel
+from .metrics_registry import metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadCounters:
+    """Unread message counts per receiver and per (receiver, sender) conversation.
+
+    Counts are bumped when the chat writer commits a batch and cleared by
+    ``mark_read``, so badges are served from memory. A periodic reconciliation
+    against ``chat_messages`` repairs any drift (e.g. rows written outside the
+    writer). Listeners are told about every receiver whose counts changed.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 reconcile_interval: float = 300.0):
+        self.session_factory = session_factory
+        self.reconcile_interval = reconcile_interval
+        self._totals: Dict[int, int] = {}
+        self._conversations: Dict[int, Dict[int, int]] = {}
+        # Receivers changed while a reconciliation query is running
+        self._touched: Optional[Set[int]] = None
+        self._worker = BackgroundTask(self._run)
+        self.listeners: List[Callable[[int, dict], None]] = []
+
+        self.reconciliations = 0
+        self.last_drift = 0
+
+    def counts(self, receiver_id: int) -> dict:
+        return {
+            "total": self._totals.get(receiver_id, 0),
+            "conversations": {str(sender): n for sender, n in self._conversations.get(receiver_id, {}).items()},
+        }
+
+    def on_messages_persisted(self, rows: Iterable[dict]):
+        changed = set()
+        for row in rows:
+            if row.get("is_read"):
+                continue
+            receiver, sender = row["receiver_id"], row["sender_id"]
+            self._totals[receiver] = self._totals.get(receiver, 0) + 1
+            conversation = self._conversations.setdefault(receiver, {})
+            conversation[sender] = conversation.get(sender, 0) + 1
+            changed.add(receiver)
+        self._notify(changed)
+
+    def mark_read(self, receiver_id: int, sender_id: int) -> int:
+        conversation = self._conversations.get(receiver_id, {})
+        cleared = conversation.pop(sender_id, 0)
+        if not conversation:
+            self._conversations.pop(receiver_id, None)
+        remaining = self._totals.get(receiver_id, 0) - cleared
+        if remaining > 0:
+            self._totals[receiver_id] = remaining
+        else:
+            self._totals.pop(receiver_id, None)
+        self._notify({receiver_id})
+        return cleared
+
+    def _notify(self, receivers: Set[int]):
+        if self._touched is not None:
+            self._touched.update(receivers)
+        for receiver in receivers:
+            counts = self.counts(receiver)
+            for listener in self.listeners:
+                listener(receiver, counts)
+
+    # Reconciliation
+
+    def _load_unread(self) -> List[Tuple[int, int, int]]:
+        db = self.session_factory()
+        try:
+            m = ChatMessageModel
+            return db.query(m.receiver_id, m.sender_id, func.count(m.id)) \
+                .filter(m.is_read.is_(False), m.deleted_at.is_(None)) \
+                .group_by(m.receiver_id, m.sender_id).all()
+        finally:
+            db.close()
+
+    async def reconcile(self) -> int:
+        """Rebuild counts from the database; returns how many receivers were off"""
+        self._touched = set()
+        try:
+            loop = asyncio.get_event_loop()
+            rows = await loop.run_in_executor(None, self._load_unread)
+            touched = self._touched
+        finally:
+            self._touched = None
+
+        conversations: Dict[int, Dict[int, int]] = {}
+        for receiver, sender, count in rows:
+            conversations.setdefault(receiver, {})[sender] = count
+        changed = set()
+        for receiver in set(conversations) | set(self._conversations):
+            # Counts changed mid-query may or may not be in the snapshot; keep the
+            # live value and let the next pass check it
+            if receiver in touched:
+                continue
+            fresh = conversations.get(receiver, {})
+            if fresh != self._conversations.get(receiver, {}) or \
+                    sum(fresh.values()) != self._totals.get(receiver, 0):
+                changed.add(receiver)
+                if fresh:
+                    self._conversations[receiver] = fresh
+                    self._totals[receiver] = sum(fresh.values())
+                else:
+                    self._conversations.pop(receiver, None)
+                    self._totals.pop(receiver, None)
+        self.reconciliations += 1
+        self.last_drift = len(changed)
+        self._notify(changed)
+        return len(changed)
+
+    async def start(self):
+        self._worker.start()
+
+    async def stop(self):
+        await self._worker.stop()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Unread counter reconciliation failed")
+            await asyncio.sleep(self.reconcile_interval)
+
+    def metrics(self) -> dict:
+        return {
+            "receivers": len(self._totals),
+            "unread_total": sum(self._totals.values()),
+            "reconciliations": self.reconciliations,
+            "last_drift": self.last_drift,
+        }
+
+
+unread_counters = UnreadCounters(reconcile_interval=settings.CHAT_UNREAD_RECONCILE_INTERVAL)
+metrics_registry.register("unread_counters", unread_counters.metrics)
@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from .config import settings
+from .metrics_registry import metrics_registry
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # without Pillow, uploads are stored but not thumbnailed
+    Image = ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Disk writes are batched into blocks of this size and done off the loop
+WRITE_BLOCK_SIZE = 1_048_576
+
+_SIGNATURES = ((b"\xff\xd8\xff", "jpg"), (b"\x89PNG\r\n\x1a\n", "png"))
+
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """File extension for the image type ``head`` starts with, or None if not accepted"""
+    for signature, extension in _SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class StoredImage:
+    digest: str  # sha256 of the content
+    extension: str
+    size: int
+    created: bool  # False when the same content was already stored
+
+
+# Module-level so it can be shipped to the process pool
+def _render_variants(source: str, targets: List[Tuple[str, int]], quality: int):
+    """Write a JPEG no larger than ``size`` px on each side to every ``(path, size)``"""
+    with Image.open(source) as image:
+        largest = max(size for _, size in targets)
+        image.draft("RGB", (largest, largest))  # JPEGs decode at a reduced scale
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        # Largest first, so each smaller variant is scaled from the previous one
+        for path, size in sorted(targets, key=lambda target: -target[1]):
+            image.thumbnail((size, size))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = path + ".part"
+            image.save(partial, "JPEG", quality=quality, optimize=True)
+            os.replace(partial, path)
+
+
+class PortfolioStore:
+    """Content-addressed image storage with background thumbnailing.
+
+    Uploads are streamed to a temporary file while being hashed, then moved
+    to ``originals/ab/cd/<sha256>.<ext>``; content that is already stored is
+    not written twice. Resized variants are rendered in a process pool after
+    the upload has been answered. At most ``max_pending`` renders may wait;
+    beyond that ``backlog_full`` tells the endpoint to turn uploads away.
+    """
+
+    def __init__(self, directory: str = "uploads", base_url: str = "/uploads", max_size: int = 5_242_880,
+                 variant_sizes: Optional[Dict[str, int]] = None, workers: int = 2, max_pending: int = 64,
+                 quality: int = 85):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        self.max_size = max_size
+        self.variant_sizes = variant_sizes if variant_sizes is not None else {"thumb": 256, "preview": 1024}
+        self.workers = workers
+        self.max_pending = max_pending
+        self.quality = quality
+        self._executor: Optional[Executor] = None
+        self._rendering: Set[str] = set()
+
+        self.uploads = 0
+        self.bytes_written = 0
+        self.duplicates = 0
+        self.too_large = 0
+        self.unsupported = 0
+        self.renders = 0
+        self.render_failures = 0
+
+    def _relative(self, kind: str, digest: str, extension: str) -> str:
+        return f"{kind}/{digest[:2]}/{digest[2:4]}/{digest}.{extension}"
+
+    def path(self, kind: str, digest: str, extension: str) -> str:
+        return os.path.join(self.directory, *self._relative(kind, digest, extension).split("/"))
+
+    def urls(self, stored: StoredImage) -> dict:
+        """URL of the original and of each variant (present once rendered)"""
+        return {
+            "url": f"{self.base_url}/{self._relative('originals', stored.digest, stored.extension)}",
+            "variants": {
+                name: f"{self.base_url}/{self._relative(name, stored.digest, 'jpg')}"
+                for name in self.variant_sizes
+            },
+        }
+
+    # Storing
+
+    async def save(self, chunks: AsyncIterator[bytes]) -> StoredImage:
+        """Stream ``chunks`` to disk; raises UploadTooLarge or UnsupportedImage"""
+        loop = asyncio.get_event_loop()
+        tmp_dir = os.path.join(self.directory, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        extension = None
+        pending: List[bytes] = []
+        pending_size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if size > self.max_size:
+                        self.too_large += 1
+                        raise UploadTooLarge(f"Uploads are limited to {self.max_size} bytes")
+                    digest.update(chunk)
+                    pending.append(chunk)
+                    pending_size += len(chunk)
+                    if extension is None and pending_size >= 12:
+                        extension = self._check_type(b"".join(pending)[:12])
+                    if pending_size >= WRITE_BLOCK_SIZE:
+                        await loop.run_in_executor(None, f.write, b"".join(pending))
+                        pending, pending_size = [], 0
+                if extension is None:
+                    extension = self._check_type(b"".join(pending)[:12])
+                if pending:
+                    await loop.run_in_executor(None, f.write, b"".join(pending))
+            stored = StoredImage(digest.hexdigest(), extension, size, created=False)
+            path = self.path("originals", stored.digest, stored.extension)
+            if os.path.exists(path):
+                self.duplicates += 1
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+                stored = StoredImage(stored.digest, stored.extension, size, created=True)
+                self.bytes_written += size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.uploads += 1
+        return stored
+
+    def _check_type(self, head: bytes) -> str:
+        extension = sniff_extension(head)
+        if extension is None:
+            self.unsupported += 1
+            raise UnsupportedImage("Only JPEG, PNG and WebP images are accepted")
+        return extension
+
+    # Variants
+
+    def backlog_full(self) -> bool:
+        return len(self._rendering) >= self.workers + self.max_pending
+
+    def schedule_variants(self, stored: StoredImage):
+        """Render missing variants in the background"""
+        if Image is None or stored.digest in self._rendering:
+            return
+        targets = [
+            (self.path(name, stored.digest, "jpg"), size)
+            for name, size in self.variant_sizes.items()
+        ]
+        targets = [(path, size) for path, size in targets if not os.path.exists(path)]
+        if not targets:
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        source = self.path("originals", stored.digest, stored.extension)
+        self._rendering.add(stored.digest)
+        future = asyncio.get_event_loop().run_in_executor(
+            self._executor, _render_variants, source, targets, self.quality)
+        future.add_done_callback(lambda done: self._rendered(stored.digest, done))
+
+    def _rendered(self, digest: str, future: asyncio.Future):
+        self._rendering.discard(digest)
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.render_failures += 1
+            logger.error("Rendering variants of %s failed", digest, exc_info=future.exception())
+        else:
+            self.renders += 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def metrics(self) -> dict:
+        return {
+            "uploads": self.uploads,
+            "bytes_written": self.bytes_written,
+            "duplicates": self.duplicates,
+            "too_large": self.too_large,
+            "unsupported": self.unsupported,
+            "rendering": len(self._rendering),
+            "renders": self.renders,
+            "render_failures": self.render_failures,
+            "thumbnails_enabled": Image is not None,
+        }
+
+
+portfolio_store = PortfolioStore(
+    directory=settings.UPLOAD_DIRECTORY,
+    base_url=settings.UPLOAD_BASE_URL,
+    max_size=settings.MAX_UPLOAD_SIZE,
+    variant_sizes=settings.THUMBNAIL_SIZES,
+    workers=settings.THUMBNAIL_WORKERS,
+    max_pending=settings.THUMBNAIL_MAX_PENDING,
+    quality=settings.THUMBNAIL_QUALITY,
+)
+metrics_registry.register("uploads", portfolio_store.metrics)
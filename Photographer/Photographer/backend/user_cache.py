@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import event, inspect
+from .config import settings
+from .database import UserModel, run_after_commit, after_bulk_change
+from .message_bus import message_bus
+from .metrics_registry import metrics_registry
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """Identity and auth-relevant state of a user, detached from any session"""
+    id: int
+    email: str
+    full_name: str
+    user_type: str
+    is_active: bool
+    is_admin: bool
+    deleted_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, user: UserModel) -> "CachedUser":
+        return cls(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            user_type=user.user_type,
+            is_active=user.is_active,
+            is_admin=user.is_admin,
+            deleted_at=user.deleted_at,
+        )
+
+
+class AuthUserCache:
+    """Bounded TTL + LRU cache of authenticated users, keyed by token subject (email).
+
+    ``version`` is bumped on every invalidation. Callers read it before loading a
+    user from the database and pass it back to ``put``; if an invalidation
+    happened in between, the possibly stale row is not cached. Invalidations
+    are published on the message bus, so every worker drops the user.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl_seconds: float = 60.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[CachedUser, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, email: str) -> Optional[CachedUser]:
+        with self._lock:
+            item = self._entries.get(email)
+            if item is None:
+                self.misses += 1
+                return None
+            user, expires_at = item
+            if expires_at < time.monotonic():
+                del self._entries[email]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(email)
+            self.hits += 1
+            return user
+
+    def put(self, user: CachedUser, version: int):
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[user.email] = (user, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user.email)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *emails: str):
+        with self._lock:
+            self.version += 1
+            for email in emails:
+                if self._entries.pop(email, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+auth_user_cache = AuthUserCache(
+    max_size=settings.AUTH_CACHE_MAX_SIZE,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+)
+metrics_registry.register("auth_user_cache", auth_user_cache.metrics)
+
+
+@event.listens_for(UserModel, 'after_update')
+@event.listens_for(UserModel, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    # Drop both the old and the new email when the email itself changed
+    history = inspect(target).attrs.email.history
+    emails = {target.email, *(history.deleted or ())}
+    run_after_commit(target, _invalidate(*emails))
+
+
+def _invalidate(*emails: str):
+    """Drop the users here and on every other worker, after commit"""
+    def apply():
+        auth_user_cache.invalidate(*emails)
+        message_bus.publish('auth_user_cache', list(emails))
+    return apply
+
+
+def _clear_all():
+    auth_user_cache.clear()
+    message_bus.publish('auth_user_cache', None)
+
+after_bulk_change(_clear_all, UserModel)
+
+
+def _remote_change(emails, origin):
+    if emails is None:
+        auth_user_cache.clear()
+    else:
+        auth_user_cache.invalidate(*emails)
+
+message_bus.subscribe('auth_user_cache', _remote_change)